@@ -0,0 +1,12 @@
+"""Create tables, apply migrations and add missing indexes: python -m database"""
+import logging
+from dotenv import load_dotenv
+
+# Before database.models reads DATABASE_URL
+load_dotenv()
+logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+
+from database.models import create_tables
+
+create_tables()
+logging.getLogger(__name__).info("Database schema is up to date")
@@ -0,0 +1,270 @@
+"""Data migrations that create_all cannot express.
+
+Each migration is a function taking a connection; it runs once inside a
+transaction and its name is recorded in schema_migrations. Append new
+migrations to MIGRATIONS, never reorder or rename existing ones.
+"""
+from datetime import datetime
+import logging
+from sqlalchemy import func, insert, inspect, select, text
+from database.models import engine, Word, LexiconEntry, ContextCount, SchemaMigration
+from database.partitions import ensure_partitions
+
+logger = logging.getLogger(__name__)
+
+# Monthly review partitions created ahead of the current month
+PARTITIONS_AHEAD = 2
+
+def _columns(conn, table: str) -> set:
+    return {column["name"] for column in inspect(conn).get_columns(table)}
+
+def _backfill_context_counts(conn):
+    context_key = func.coalesce(Word.context, "")
+    conn.execute(ContextCount.__table__.delete())
+    conn.execute(insert(ContextCount).from_select(
+        ["user_id", "context", "word_count"],
+        select(Word.user_id, context_key, func.count(Word.id)).group_by(Word.user_id, context_key)
+    ))
+
+def _create_search_index(conn):
+    # Superseded by the lexicon search index on schemas created after 0003
+    if "word" not in _columns(conn, "words"):
+        return
+    
+    if conn.dialect.name == "postgresql":
+        conn.exec_driver_sql("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        conn.exec_driver_sql(
+            "CREATE INDEX IF NOT EXISTS ix_words_search_trgm ON words "
+            "USING gin ((lower(word || ' ' || translation || ' ' || coalesce(example, ''))) gin_trgm_ops)"
+        )
+    elif conn.dialect.name == "sqlite":
+        # External-content FTS5 table kept in sync with words by triggers
+        conn.exec_driver_sql(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS words_fts USING fts5("
+            "word, translation, example, content='words', content_rowid='id', tokenize='trigram')"
+        )
+        conn.exec_driver_sql(
+            "CREATE TRIGGER IF NOT EXISTS words_fts_ai AFTER INSERT ON words BEGIN "
+            "INSERT INTO words_fts(rowid, word, translation, example) "
+            "VALUES (new.id, new.word, new.translation, new.example); END"
+        )
+        conn.exec_driver_sql(
+            "CREATE TRIGGER IF NOT EXISTS words_fts_ad AFTER DELETE ON words BEGIN "
+            "INSERT INTO words_fts(words_fts, rowid, word, translation, example) "
+            "VALUES ('delete', old.id, old.word, old.translation, old.example); END"
+        )
+        conn.exec_driver_sql(
+            "CREATE TRIGGER IF NOT EXISTS words_fts_au AFTER UPDATE OF word, translation, example ON words BEGIN "
+            "INSERT INTO words_fts(words_fts, rowid, word, translation, example) "
+            "VALUES ('delete', old.id, old.word, old.translation, old.example); "
+            "INSERT INTO words_fts(rowid, word, translation, example) "
+            "VALUES (new.id, new.word, new.translation, new.example); END"
+        )
+        conn.exec_driver_sql("INSERT INTO words_fts(words_fts) VALUES ('rebuild')")
+
+def _create_lexicon_search_index(conn):
+    if conn.dialect.name == "postgresql":
+        conn.exec_driver_sql("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        conn.exec_driver_sql(
+            "CREATE INDEX IF NOT EXISTS ix_lexicon_search_trgm ON lexicon "
+            "USING gin ((lower(word || ' ' || translation || ' ' || coalesce(example, ''))) gin_trgm_ops)"
+        )
+    elif conn.dialect.name == "sqlite":
+        conn.exec_driver_sql(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS lexicon_fts USING fts5("
+            "word, translation, example, content='lexicon', content_rowid='id', tokenize='trigram')"
+        )
+        conn.exec_driver_sql(
+            "CREATE TRIGGER IF NOT EXISTS lexicon_fts_ai AFTER INSERT ON lexicon BEGIN "
+            "INSERT INTO lexicon_fts(rowid, word, translation, example) "
+            "VALUES (new.id, new.word, new.translation, new.example); END"
+        )
+        conn.exec_driver_sql(
+            "CREATE TRIGGER IF NOT EXISTS lexicon_fts_ad AFTER DELETE ON lexicon BEGIN "
+            "INSERT INTO lexicon_fts(lexicon_fts, rowid, word, translation, example) "
+            "VALUES ('delete', old.id, old.word, old.translation, old.example); END"
+        )
+        conn.exec_driver_sql(
+            "CREATE TRIGGER IF NOT EXISTS lexicon_fts_au AFTER UPDATE OF word, translation, example ON lexicon BEGIN "
+            "INSERT INTO lexicon_fts(lexicon_fts, rowid, word, translation, example) "
+            "VALUES ('delete', old.id, old.word, old.translation, old.example); "
+            "INSERT INTO lexicon_fts(rowid, word, translation, example) "
+            "VALUES (new.id, new.word, new.translation, new.example); END"
+        )
+        conn.exec_driver_sql("INSERT INTO lexicon_fts(lexicon_fts) VALUES ('rebuild')")
+
+def _add_override_columns(conn):
+    columns = _columns(conn, "words")
+    for column, column_type in (
+        ("translation_override", "VARCHAR(255)"),
+        ("example_override", "TEXT"),
+        ("example_translation_override", "TEXT")
+    ):
+        if column not in columns:
+            conn.exec_driver_sql(f"ALTER TABLE words ADD COLUMN {column} {column_type}")
+
+def _move_words_to_lexicon(conn):
+    """Replace per-user word/translation/example copies with lexicon references.
+    
+    Cards of a language pair and lemma share the first card's content as the
+    lexicon entry; a card whose translation or example differs keeps its own
+    in the override columns, so every card reads back as before (one without
+    an example shows its entry's, as after enrichment).
+    """
+    if "word" in _columns(conn, "words"):
+        # A card's entry is keyed by its user's language pair; without one the
+        # card has no entry to point at, and dropping the columns would lose it
+        unpaired = conn.execute(text(
+            "SELECT w.id FROM words w LEFT JOIN users u ON u.telegram_id = w.user_id "
+            "WHERE coalesce(u.language_from, '') = '' OR coalesce(u.language_to, '') = '' "
+            "ORDER BY w.id"
+        )).scalars().all()
+        if unpaired:
+            raise RuntimeError(
+                f"{len(unpaired)} words belong to users without a language pair "
+                f"(word ids {', '.join(map(str, unpaired[:20]))}{', ...' if len(unpaired) > 20 else ''}); "
+                "set the users' languages or delete the words, then run the migrations again"
+            )
+        
+        if "lexicon_id" not in _columns(conn, "words"):
+            conn.exec_driver_sql("ALTER TABLE words ADD COLUMN lexicon_id INTEGER REFERENCES lexicon (id)")
+        _add_override_columns(conn)
+        
+        entries = {
+            (row.language_from, row.language_to, row.lemma): (row.id, row.translation, row.example)
+            for row in conn.execute(select(
+                LexiconEntry.id, LexiconEntry.language_from, LexiconEntry.language_to, LexiconEntry.lemma,
+                LexiconEntry.translation, LexiconEntry.example
+            ))
+        }
+        set_lexicon_id = text(
+            "UPDATE words SET lexicon_id = :lexicon_id, "
+            "translation_override = :translation_override, example_override = :example_override "
+            "WHERE id = :word_id"
+        )
+        
+        # Keyset batches keep memory flat and avoid updating a table under an open cursor
+        last_id = 0
+        while True:
+            rows = conn.execute(text(
+                "SELECT w.id, w.word, w.translation, w.example, u.language_from, u.language_to "
+                "FROM words w JOIN users u ON u.telegram_id = w.user_id "
+                "WHERE w.id > :last_id ORDER BY w.id LIMIT 1000"
+            ), {"last_id": last_id}).all()
+            if not rows:
+                break
+            
+            updates = []
+            for row in rows:
+                key = (row.language_from, row.language_to, LexiconEntry.normalize_lemma(row.word))
+                example = row.example or None
+                if key not in entries:
+                    entries[key] = (conn.execute(insert(LexiconEntry).values(
+                        language_from=key[0],
+                        language_to=key[1],
+                        lemma=key[2],
+                        word=row.word,
+                        translation=row.translation,
+                        example=example,
+                        created_at=datetime.utcnow()
+                    )).inserted_primary_key[0], row.translation, example)
+                entry_id, translation, entry_example = entries[key]
+                updates.append({
+                    "lexicon_id": entry_id,
+                    "translation_override": row.translation if row.translation != translation else None,
+                    "example_override": example if example != entry_example else None,
+                    "word_id": row.id
+                })
+            conn.execute(set_lexicon_id, updates)
+            last_id = rows[-1].id
+        
+        # Checked before anything is dropped: the transaction rolls back on failure
+        differing = conn.execute(text(
+            "SELECT count(*) FROM words w JOIN lexicon l ON l.id = w.lexicon_id "
+            "WHERE coalesce(nullif(w.translation_override, ''), l.translation) <> w.translation "
+            "OR coalesce(w.example, '') NOT IN ('', coalesce(nullif(w.example_override, ''), l.example, ''))"
+        )).scalar()
+        if differing:
+            raise RuntimeError(f"{differing} words would lose their content in the lexicon; nothing was migrated")
+        
+        # The old search index covers the columns being dropped
+        if conn.dialect.name == "sqlite":
+            for trigger in ("words_fts_ai", "words_fts_ad", "words_fts_au"):
+                conn.exec_driver_sql(f"DROP TRIGGER IF EXISTS {trigger}")
+            conn.exec_driver_sql("DROP TABLE IF EXISTS words_fts")
+        else:
+            conn.exec_driver_sql("DROP INDEX IF EXISTS ix_words_search_trgm")
+        
+        for column in ("word", "translation", "example"):
+            conn.exec_driver_sql(f"ALTER TABLE words DROP COLUMN {column}")
+        if conn.dialect.name == "postgresql":
+            conn.exec_driver_sql("ALTER TABLE words ALTER COLUMN lexicon_id SET NOT NULL")
+    
+    _create_lexicon_search_index(conn)
+
+def _partition_reviews(conn):
+    # SQLite has no partitioning; the compaction job deletes old rows there instead
+    if conn.dialect.name != "postgresql":
+        return
+    
+    # Constraint and index names are schema-wide, so the new table's differ until the old one is gone
+    conn.exec_driver_sql("ALTER TABLE reviews RENAME TO reviews_legacy")
+    conn.exec_driver_sql(
+        "CREATE TABLE reviews ("
+        "id INTEGER NOT NULL DEFAULT nextval('reviews_id_seq'), "
+        "word_id INTEGER REFERENCES words (id), "
+        "user_id BIGINT REFERENCES users (telegram_id), "
+        "knew BOOLEAN NOT NULL, "
+        "reviewed_at TIMESTAMP WITHOUT TIME ZONE NOT NULL, "
+        "CONSTRAINT reviews_partitioned_pkey PRIMARY KEY (id, reviewed_at)"
+        ") PARTITION BY RANGE (reviewed_at)"
+    )
+    # Catches anything outside the monthly partitions instead of failing the insert
+    conn.exec_driver_sql("CREATE TABLE reviews_default PARTITION OF reviews DEFAULT")
+    first = conn.exec_driver_sql("SELECT min(reviewed_at) FROM reviews_legacy").scalar()
+    ensure_partitions(conn, first or datetime.utcnow(), PARTITIONS_AHEAD)
+    
+    conn.exec_driver_sql(
+        "INSERT INTO reviews (id, word_id, user_id, knew, reviewed_at) "
+        "SELECT id, word_id, user_id, knew, coalesce(reviewed_at, now() AT TIME ZONE 'utc') FROM reviews_legacy"
+    )
+    # Keep the id sequence when the old table (which owns it) is dropped
+    conn.exec_driver_sql("ALTER SEQUENCE reviews_id_seq OWNED BY reviews.id")
+    conn.exec_driver_sql("DROP TABLE reviews_legacy")
+    conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_reviews_id ON reviews (id)")
+    conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_reviews_user_reviewed ON reviews (user_id, reviewed_at)")
+
+def _add_import_overrides(conn):
+    """Keep imported content on the user's card instead of the shared lexicon"""
+    false = "false" if conn.dialect.name == "postgresql" else "0"
+    if "imported" not in _columns(conn, "lexicon"):
+        conn.exec_driver_sql(f"ALTER TABLE lexicon ADD COLUMN imported BOOLEAN NOT NULL DEFAULT {false}")
+    # Already added by 0003 on schemas that predate the lexicon
+    _add_override_columns(conn)
+
+def _add_enrichment_attempts(conn):
+    if "enrichment_attempts" not in _columns(conn, "lexicon"):
+        conn.exec_driver_sql("ALTER TABLE lexicon ADD COLUMN enrichment_attempts INTEGER NOT NULL DEFAULT 0")
+
+MIGRATIONS = [
+    ("0001_backfill_context_counts", _backfill_context_counts),
+    ("0002_create_search_index", _create_search_index),
+    ("0003_move_words_to_lexicon", _move_words_to_lexicon),
+    ("0004_partition_reviews", _partition_reviews),
+    ("0005_add_import_overrides", _add_import_overrides),
+    ("0006_add_enrichment_attempts", _add_enrichment_attempts),
+]
+
+def run_migrations(bind=None):
+    """Apply pending migrations in order"""
+    bind = bind or engine
+    with bind.connect() as conn:
+        applied = set(conn.execute(select(SchemaMigration.name)).scalars())
+    
+    for name, migration in MIGRATIONS:
+        if name in applied:
+            continue
+        with bind.begin() as conn:
+            migration(conn)
+            conn.execute(insert(SchemaMigration).values(name=name, applied_at=datetime.utcnow()))
+        logger.info(f"Applied migration {name}")
@@ -1,15 +1,37 @@
-from sqlalchemy import create_engine, Column, Integer, String, Boolean, DateTime, BigInteger, Text, ForeignKey
+from sqlalchemy import create_engine, Column, Integer, String, Boolean, Date, DateTime, BigInteger, Text, ForeignKey, Index, LargeBinary, UniqueConstraint, JSON
+from sqlalchemy.ext.associationproxy import association_proxy
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
+from sqlalchemy.schema import CreateIndex
+from sqlalchemy import false, func, insert, select, update
 from datetime import datetime
+from typing import Callable, Dict, Optional
+import logging
 import os
+import threading
+import time
+from database import sqlite
+
+logger = logging.getLogger(__name__)
+
+def _create_engine(url: str, **kwargs):
+    """Engine for PostgreSQL, or a tuned SQLite file (see database/sqlite.py)"""
+    if not sqlite.is_sqlite(url):
+        return create_engine(url, **kwargs)
+    return sqlite.configure(create_engine(url, **sqlite.engine_options(url), **kwargs))
 
 # Database setup
 DATABASE_URL = os.getenv("DATABASE_URL", "postgresql://localhost/wordslearner")
-engine = create_engine(DATABASE_URL)
+engine = _create_engine(DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+# Optional read replica for stats, profile and browse queries (see ReplicaRouter)
+REPLICA_DATABASE_URL = os.getenv("REPLICA_DATABASE_URL")
+# Autocommit: no read transaction is held open on the replica between queries
+replica_engine = _create_engine(REPLICA_DATABASE_URL, isolation_level="AUTOCOMMIT") if REPLICA_DATABASE_URL else None
+ReplicaSessionLocal = sessionmaker(autoflush=False, bind=replica_engine) if replica_engine is not None else None
+
 class User(Base):
     __tablename__ = "users"
     
@@ -25,40 +47,320 @@ class User(Base):
     words = relationship("Word", back_populates="user")
     reviews = relationship("Review", back_populates="user")
 
+class LexiconEntry(Base):
+    """Vocabulary shared by all users, one entry per language pair and lemma"""
+    __tablename__ = "lexicon"
+    
+    id = Column(Integer, primary_key=True)
+    language_from = Column(String(10), nullable=False)
+    language_to = Column(String(10), nullable=False)
+    lemma = Column(String(255), nullable=False)
+    word = Column(String(255), nullable=False)
+    translation = Column(String(255), nullable=False)
+    example = Column(Text)
+    example_translation = Column(Text)
+    # Created from a user's deck import: the next generated list with the word replaces its content
+    imported = Column(Boolean, nullable=False, default=False, server_default=false())
+    # Enrichment responses that had no example for the word; the sweep gives up after a few
+    enrichment_attempts = Column(Integer, nullable=False, default=0, server_default="0")
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        UniqueConstraint("language_from", "language_to", "lemma", name="uq_lexicon_pair_lemma"),
+    )
+    
+    @staticmethod
+    def normalize_lemma(word: str) -> str:
+        """Lookup key for a word: casefolded, trimmed, single-spaced"""
+        return " ".join(word.casefold().split()).strip(".,!?;:")
+
 class Word(Base):
+    """A user's card: scheduling state for one lexicon entry"""
     __tablename__ = "words"
     
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(BigInteger, ForeignKey("users.telegram_id"))
-    word = Column(String(255), nullable=False)
-    translation = Column(String(255), nullable=False)
-    example = Column(Text)
+    lexicon_id = Column(Integer, ForeignKey("lexicon.id"), nullable=False)
     context = Column(String(255))
     difficulty = Column(Integer, default=1)
     next_review = Column(DateTime, default=datetime.utcnow)
     interval_days = Column(Integer, default=1)
     created_at = Column(DateTime, default=datetime.utcnow)
+    # The user's own content from a deck import, shown instead of the shared entry's
+    translation_override = Column(String(255))
+    example_override = Column(Text)
+    example_translation_override = Column(Text)
     
     # Relationships
     user = relationship("User", back_populates="words")
     reviews = relationship("Review", back_populates="word")
+    lexicon = relationship("LexiconEntry", lazy="joined", innerjoin=True)
+    
+    # Content lives in the shared lexicon entry
+    word = association_proxy("lexicon", "word")
+    
+    @property
+    def translation(self) -> str:
+        return self.translation_override or self.lexicon.translation
+    
+    @property
+    def example(self) -> Optional[str]:
+        return self.example_override or self.lexicon.example
+    
+    @property
+    def example_translation(self) -> Optional[str]:
+        return self.example_translation_override if self.example_override else self.lexicon.example_translation
+    
+    __table_args__ = (
+        # Covers due counts (the due queue uses ix_words_user_due_day)
+        Index("ix_words_user_due", "user_id", "next_review", "difficulty", "id"),
+        # Keyset pagination for browsing, with and without a context filter
+        Index("ix_words_user_created", "user_id", "created_at", "id"),
+        Index("ix_words_user_context_created", "user_id", "context", "created_at", "id"),
+        Index("ix_words_user_lexicon", "user_id", "lexicon_id"),
+    )
+
+# Covers the due queue: filter, priority order (day due, then difficulty) and keyset cursor
+Index(
+    "ix_words_user_due_day",
+    Word.user_id, func.date(Word.next_review), Word.difficulty, Word.next_review, Word.id
+)
+
+# Cards with imported content, which /find searches outside the lexicon index
+_overridden = Word.translation_override.isnot(None) | Word.example_override.isnot(None)
+Index("ix_words_user_overridden", Word.user_id, postgresql_where=_overridden, sqlite_where=_overridden)
 
 class Review(Base):
+    """Raw review log. On PostgreSQL it is partitioned by month of ``reviewed_at``
+    (migration 0004); old months are compacted into ReviewDaily and dropped."""
     __tablename__ = "reviews"
     
     id = Column(Integer, primary_key=True, index=True)
     word_id = Column(Integer, ForeignKey("words.id"))
     user_id = Column(BigInteger, ForeignKey("users.telegram_id"))
     knew = Column(Boolean, nullable=False)
-    reviewed_at = Column(DateTime, default=datetime.utcnow)
+    reviewed_at = Column(DateTime, nullable=False, default=datetime.utcnow)
     
     # Relationships
     word = relationship("Word", back_populates="reviews")
     user = relationship("User", back_populates="reviews")
+    
+    __table_args__ = (
+        Index("ix_reviews_user_reviewed", "user_id", "reviewed_at"),
+    )
+
+class ReviewDaily(Base):
+    """Per-word, per-day review counts compacted from old raw reviews.
+    
+    No foreign keys: history outlives deleted words.
+    """
+    __tablename__ = "review_daily"
+    
+    user_id = Column(BigInteger, primary_key=True)
+    day = Column(Date, primary_key=True)
+    word_id = Column(Integer, primary_key=True)
+    reviews = Column(Integer, nullable=False, default=0)
+    knew = Column(Integer, nullable=False, default=0)
+
+class ContextCount(Base):
+    """Per-user word count per context, maintained by the word write paths"""
+    __tablename__ = "context_counts"
+    
+    user_id = Column(BigInteger, ForeignKey("users.telegram_id"), primary_key=True)
+    # Words without a context are counted under ""
+    context = Column(String(255), primary_key=True)
+    word_count = Column(Integer, nullable=False, default=0)
+
+class KnownWordFilter(Base):
+    """Bloom filter of the lemmas a user has in a language pair, maintained by the word write paths"""
+    __tablename__ = "known_word_filters"
+    
+    user_id = Column(BigInteger, ForeignKey("users.telegram_id"), primary_key=True)
+    language_from = Column(String(10), primary_key=True)
+    language_to = Column(String(10), primary_key=True)
+    bits = Column(LargeBinary, nullable=False)
+    capacity = Column(Integer, nullable=False)
+    items = Column(Integer, nullable=False, default=0)
+
+class UsageDaily(Base):
+    """Daily usage counters for the admin analytics, added to by the services"""
+    __tablename__ = "usage_daily"
+    
+    day = Column(Date, primary_key=True)
+    metric = Column(String(32), primary_key=True)
+    # Language pair for per-pair metrics, "" otherwise
+    dimension = Column(String(32), primary_key=True, default="")
+    value = Column(BigInteger, nullable=False, default=0)
+
+class ActiveUser(Base):
+    """Users seen per day; rolled up into the "dau" counter and pruned"""
+    __tablename__ = "active_users"
+    
+    day = Column(Date, primary_key=True)
+    user_id = Column(BigInteger, primary_key=True)
+
+class WordPack(Base):
+    """Pre-generated word list for a popular context, versioned per rebuild"""
+    __tablename__ = "word_packs"
+    
+    id = Column(Integer, primary_key=True)
+    language_from = Column(String(10), nullable=False)
+    language_to = Column(String(10), nullable=False)
+    level = Column(String(10), nullable=False)
+    # Normalized context used for matching; ``context`` is a representative original
+    context_key = Column(String(255), nullable=False)
+    context = Column(String(255), nullable=False)
+    version = Column(Integer, nullable=False, default=1)
+    words = Column(JSON, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        UniqueConstraint("language_from", "language_to", "level", "context_key", "version", name="uq_word_packs_version"),
+    )
+
+class GeneratedList(Base):
+    """Word list returned by OpenAI, kept for reuse by similar contexts"""
+    __tablename__ = "generated_lists"
+    
+    id = Column(Integer, primary_key=True)
+    language_from = Column(String(10), nullable=False)
+    language_to = Column(String(10), nullable=False)
+    level = Column(String(10), nullable=False)
+    context = Column(String(255), nullable=False)
+    context_key = Column(String(255), nullable=False)
+    words = Column(JSON, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        Index("ix_generated_lists_scope", "language_from", "language_to", "level", "id"),
+    )
+
+class SchemaMigration(Base):
+    __tablename__ = "schema_migrations"
+    
+    name = Column(String(255), primary_key=True)
+    applied_at = Column(DateTime, default=datetime.utcnow)
+
+class ReplicaHeartbeat(Base):
+    """Single row the primary rewrites so replica lag can be measured on any backend"""
+    __tablename__ = "replica_heartbeat"
+    
+    id = Column(Integer, primary_key=True)
+    beat_at = Column(DateTime, nullable=False)
+
+class ReplicaRouter:
+    """Decides whether a read may be served by the replica.
+    
+    Reads go to the replica only while its measured lag is within
+    REPLICA_MAX_LAG_SECONDS, and never for a user who wrote within that
+    window, so users always see their own changes. Lag is measured by
+    rewriting the heartbeat row on the primary and reading it back from the
+    replica, every REPLICA_CHECK_SECONDS in a background task of each process
+    (main.replica_check_loop), so read paths never wait for it; until the
+    first measurement, and while the replica is unreachable or behind, reads
+    fall back to the primary. Writes and read-modify-write paths always use
+    the primary session.
+    """
+    
+    def __init__(self, replica, max_lag: float, check_interval: float):
+        self.replica = replica
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.lag: Optional[float] = None
+        self._recent_writes: Dict[int, float] = {}
+        self._lock = threading.Lock()
+    
+    def note_write(self, user_id: int):
+        """Pin the user's reads to the primary until the replica has surely caught up"""
+        now = time.monotonic()
+        with self._lock:
+            self._recent_writes[user_id] = now + self.max_lag
+            if len(self._recent_writes) > 10000:
+                self._recent_writes = {user: until for user, until in self._recent_writes.items() if until > now}
+    
+    def check(self):
+        """Measure the replica's lag; blocking, so run it off the event loop"""
+        try:
+            beat = datetime.utcnow()
+            with engine.begin() as conn:
+                if not conn.execute(update(ReplicaHeartbeat).where(ReplicaHeartbeat.id == 1).values(beat_at=beat)).rowcount:
+                    conn.execute(insert(ReplicaHeartbeat).values(id=1, beat_at=beat))
+            with self.replica.connect() as conn:
+                seen = conn.execute(select(ReplicaHeartbeat.beat_at).where(ReplicaHeartbeat.id == 1)).scalar()
+            
+            # The replica has every write up to the newest beat it has seen, so it is
+            # at most that beat's age behind (a check interval when it keeps up)
+            self.lag = max((beat - seen).total_seconds(), 0.0) if seen is not None else None
+        except Exception as e:
+            logger.warning(f"Replica lag check failed: {e}")
+            self.lag = None
+    
+    def healthy(self) -> bool:
+        """Whether the replica was within the staleness bound at the last check"""
+        return self.replica is not None and self.lag is not None and self.lag <= self.max_lag
+    
+    def use_replica(self, user_id: Optional[int] = None) -> bool:
+        if user_id is not None and self._recent_writes.get(user_id, 0) > time.monotonic():
+            return False
+        return self.healthy()
+    
+    def reader(self, primary, replica, user_id: Optional[int] = None):
+        """The session to read ``user_id``'s data with: ``replica`` if allowed, else ``primary``"""
+        if replica is not None and self.use_replica(user_id):
+            # Long-lived session: drop identity-map state so results are as fresh as the replica
+            replica.expire_all()
+            return replica
+        return primary
+    
+    def read(self, primary, replica, user_id: Optional[int], query: Callable):
+        """``query(session)`` on the session ``reader`` picks; if the replica fails, retried on ``primary``"""
+        db = self.reader(primary, replica, user_id)
+        if db is primary:
+            return query(primary)
+        try:
+            return query(db)
+        except Exception as e:
+            db.rollback()
+            self.replica_failed(e)
+            return query(primary)
+    
+    def replica_failed(self, error: Exception):
+        """Send reads to the primary until the next lag check finds the replica healthy"""
+        logger.warning(f"Replica read failed, reading from the primary: {error}")
+        self.lag = None
+    
+    def engine_for(self, user_id: Optional[int] = None):
+        """Engine for core-level reads, following the same rules as ``reader``"""
+        return self.replica if self.replica is not None and self.use_replica(user_id) else engine
+    
+    def new_session(self):
+        """A replica session for a service, or None without a replica"""
+        return ReplicaSessionLocal() if ReplicaSessionLocal is not None else None
+    
+    def status(self) -> Dict:
+        return {"configured": self.replica is not None, "healthy": self.healthy(), "lag_seconds": self.lag}
+
+replica_router = ReplicaRouter(
+    replica_engine,
+    max_lag=float(os.getenv("REPLICA_MAX_LAG_SECONDS", "5")),
+    check_interval=float(os.getenv("REPLICA_CHECK_SECONDS", "1"))
+)
 
 # Create tables
-def create_tables():
-    Base.metadata.create_all(bind=engine)
+def create_tables(bind=None):
+    bind = bind or engine
+    Base.metadata.create_all(bind=bind)
+    
+    from database.migrations import run_migrations
+    run_migrations(bind)
+    
+    # create_all skips existing tables, so add indexes introduced later
+    # (after migrations, which may add the columns they cover). IF NOT EXISTS
+    # rather than checkfirst: SQLite can't reflect expression indexes
+    with bind.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                conn.execute(CreateIndex(index, if_not_exists=True))
 
 # Database dependency
 def get_db():
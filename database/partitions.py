@@ -0,0 +1,75 @@
+"""Monthly range partitions of the PostgreSQL reviews table"""
+from datetime import date, datetime
+from typing import List, Tuple
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+PARTITION_PATTERN = re.compile(r"^reviews_(\d{4})_(\d{2})$")
+
+def month_start(value) -> date:
+    return date(value.year, value.month, 1)
+
+def add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+def partition_name(month: date) -> str:
+    return f"reviews_{month:%Y_%m}"
+
+def create_month_partition(conn, month: date):
+    """Create the partition holding reviews of ``month`` if it doesn't exist.
+    
+    PostgreSQL refuses to create a partition for a range the default
+    partition has rows in (written while the partition was missing), so the
+    default is detached meanwhile and those rows are moved into the new one.
+    """
+    name = partition_name(month)
+    if conn.exec_driver_sql(f"SELECT to_regclass('{name}')").scalar() is not None:
+        return
+    
+    bounds = (month.isoformat(), add_months(month, 1).isoformat())
+    in_month = f"reviewed_at >= '{bounds[0]}' AND reviewed_at < '{bounds[1]}'"
+    create = f"CREATE TABLE {name} PARTITION OF reviews FOR VALUES FROM ('{bounds[0]}') TO ('{bounds[1]}')"
+    if conn.exec_driver_sql(f"SELECT 1 FROM reviews_default WHERE {in_month} LIMIT 1").first() is None:
+        conn.exec_driver_sql(create)
+        return
+    
+    conn.exec_driver_sql("ALTER TABLE reviews DETACH PARTITION reviews_default")
+    conn.exec_driver_sql(create)
+    moved = conn.exec_driver_sql(
+        f"WITH moved AS (DELETE FROM reviews_default WHERE {in_month} RETURNING id, word_id, user_id, knew, reviewed_at) "
+        f"INSERT INTO {name} (id, word_id, user_id, knew, reviewed_at) SELECT * FROM moved"
+    ).rowcount
+    conn.exec_driver_sql("ALTER TABLE reviews ATTACH PARTITION reviews_default DEFAULT")
+    logger.info(f"Moved {moved} reviews from reviews_default into the new partition {name}")
+
+def ensure_partitions(conn, start, months_ahead: int):
+    """Partitions from the month of ``start`` through ``months_ahead`` months past the current one.
+    
+    A month that fails is logged and skipped (its reviews stay in the
+    default partition), so later months and the caller's work still happen.
+    """
+    month = month_start(start)
+    last = add_months(month_start(datetime.utcnow()), months_ahead)
+    while month <= last:
+        try:
+            with conn.begin_nested():
+                create_month_partition(conn, month)
+        except Exception as e:
+            logger.error(f"Error creating review partition {partition_name(month)}: {e}")
+        month = add_months(month, 1)
+
+def list_month_partitions(conn) -> List[Tuple[str, date]]:
+    """(name, month) of every monthly partition, oldest first; the default partition is excluded"""
+    rows = conn.exec_driver_sql(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = 'reviews'::regclass"
+    )
+    partitions = []
+    for (name,) in rows:
+        match = PARTITION_PATTERN.match(name)
+        if match:
+            partitions.append((name, date(int(match.group(1)), int(match.group(2)), 1)))
+    return sorted(partitions, key=lambda partition: partition[1])
@@ -0,0 +1,129 @@
+"""SQLite tuning for single-node deployments: DATABASE_URL=sqlite:///data/bot.db
+
+Every connection gets WAL journaling and the pragmas below. Writes of one
+process go through a single-writer queue: a transaction takes the writer
+lock at its first write statement and holds it until commit or rollback,
+so concurrent handlers and background jobs wait their turn in Python
+instead of failing with "database is locked". Other processes on the same
+file (update workers, `python -m` jobs) are covered by the busy timeout.
+"""
+import logging
+import os
+import re
+import threading
+from sqlalchemy import event
+from sqlalchemy.pool import StaticPool
+
+logger = logging.getLogger(__name__)
+
+# Seconds a write waits for the writer lock, and SQLite for a lock held by another process
+BUSY_TIMEOUT = float(os.getenv("SQLITE_BUSY_TIMEOUT", "30"))
+CACHE_MB = int(os.getenv("SQLITE_CACHE_MB", "64"))
+MMAP_MB = int(os.getenv("SQLITE_MMAP_MB", "256"))
+
+# WAL with synchronous=NORMAL is durable across application crashes; only an
+# OS crash or power loss can lose the last transactions, never corrupt the file
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA foreign_keys=ON",
+    "PRAGMA temp_store=MEMORY",
+    f"PRAGMA cache_size=-{CACHE_MB * 1024}",
+    f"PRAGMA mmap_size={MMAP_MB * 1024 * 1024}",
+    # Truncate the WAL after checkpoints instead of keeping it at its peak size
+    "PRAGMA journal_size_limit=67108864",
+    f"PRAGMA busy_timeout={int(BUSY_TIMEOUT * 1000)}",
+)
+
+_WRITE = re.compile(r"\s*(INSERT|UPDATE|DELETE|REPLACE|CREATE|DROP|ALTER|SAVEPOINT)\b", re.IGNORECASE)
+
+def is_sqlite(url: str) -> bool:
+    return url.startswith("sqlite")
+
+def engine_options(url: str) -> dict:
+    """create_engine keyword arguments for a SQLite URL"""
+    # pysqlite begins transactions only before writes; IMMEDIATE takes the write
+    # lock at BEGIN, so a writer never fails on a snapshot made stale by another
+    # process's commit (SQLITE_BUSY_SNAPSHOT skips the busy timeout)
+    options = {"connect_args": {"check_same_thread": False, "timeout": BUSY_TIMEOUT, "isolation_level": "IMMEDIATE"}}
+    if url.rstrip("/") in ("sqlite:", "sqlite:///:memory:"):
+        # An in-memory database exists once per connection; share one
+        options["poolclass"] = StaticPool
+    else:
+        # Connections are only file handles; the services' long-lived sessions
+        # must never wait for one (writes are bounded by the writer queue)
+        options.update(pool_size=20, max_overflow=-1)
+    return options
+
+class WriterQueue:
+    """Serializes the write transactions of one process.
+    
+    Selects run outside transactions (pysqlite only opens one before the first
+    write), so readers never wait here, and never hold a WAL snapshot open in
+    the long-lived sessions of the services.
+    """
+    
+    def __init__(self, timeout: float = BUSY_TIMEOUT):
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._owner_thread = None
+    
+    def acquire(self, connection_info: dict):
+        if connection_info.get("sqlite_writer"):
+            return
+        if self._owner_thread == threading.get_ident():
+            # Another session of this thread (the event loop) is mid-write;
+            # waiting would block the loop that has to finish it
+            logger.warning("Nested write transactions on one thread; relying on the SQLite busy timeout")
+            return
+        if not self._lock.acquire(timeout=self.timeout):
+            logger.warning(f"Waited {self.timeout}s for the SQLite writer lock; writing anyway")
+            return
+        self._owner_thread = threading.get_ident()
+        connection_info["sqlite_writer"] = True
+    
+    def release(self, connection_info: dict):
+        if connection_info.pop("sqlite_writer", False):
+            self._owner_thread = None
+            self._lock.release()
+
+# One queue per process, shared by the primary and replica engines
+writer_queue = WriterQueue()
+
+def configure(engine):
+    """Apply the pragmas and the writer queue to a SQLite engine"""
+    
+    @event.listens_for(engine, "connect")
+    def _set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma in PRAGMAS:
+            cursor.execute(pragma)
+        cursor.close()
+    
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_write(conn, cursor, statement, parameters, context, executemany):
+        if not _WRITE.match(statement):
+            return
+        writer_queue.acquire(conn.info)
+        dbapi_connection = conn.connection.dbapi_connection
+        if statement.lstrip()[:9].upper() == "SAVEPOINT" and not dbapi_connection.in_transaction:
+            # pysqlite doesn't begin a transaction before SAVEPOINT; without one the
+            # savepoint's RELEASE would commit everything, unlike on PostgreSQL
+            cursor.execute("BEGIN IMMEDIATE")
+    
+    # Fired just before the DBAPI commit; a writer let in during that moment
+    # is held for it by the busy timeout
+    @event.listens_for(engine, "commit")
+    def _on_commit(conn):
+        writer_queue.release(conn.info)
+    
+    @event.listens_for(engine, "rollback")
+    def _on_rollback(conn):
+        writer_queue.release(conn.info)
+    
+    @event.listens_for(engine, "checkin")
+    def _on_checkin(dbapi_connection, connection_record):
+        # Connections returned without commit or rollback are reset by the pool
+        writer_queue.release(connection_record.info)
+    
+    return engine
@@ -1,34 +1,47 @@
-from fastapi import FastAPI, Request
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, Response
 import uvicorn
 import os
 from dotenv import load_dotenv
 from telegram import Update
 from telegram.ext import Application, CommandHandler, MessageHandler, filters, CallbackContext
 import asyncio
+import hmac
 import logging
-from datetime import datetime
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from services.metrics import HANDLER_LATENCY, WEBHOOK_ERRORS, register_commands, update_label
+from services import tracing
 
 # Load environment variables
 load_dotenv()
 
-# Configure logging
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
+# Configure logging: records are queued and formatted on a background thread
+from services.log_pipeline import parse_sampling, setup_logging
+setup_logging(
+    level=os.getenv("LOG_LEVEL", "INFO"),
+    json_lines=os.getenv("LOG_FORMAT", "text") == "json",
+    burst=int(os.getenv("LOG_RATE_LIMIT_BURST", "20")),
+    period=float(os.getenv("LOG_RATE_LIMIT_PERIOD", "10")),
+    sampling=parse_sampling(os.getenv("LOG_SAMPLING", ""))
 )
 logger = logging.getLogger(__name__)
 
 # Initialize FastAPI app
 app = FastAPI(title="Words Learner Bot", version="1.0.0")
 
-# Initialize database (optional for testing)
-try:
-    from database.models import create_tables
-    create_tables()
-    logger.info("Database tables created successfully")
-except Exception as e:
-    logger.warning(f"Database initialization failed: {e}. Running in test mode.")
+# Database instrumentation; creating the engine doesn't connect. The schema is
+# managed by `python -m database`, run before deploys, not on import.
+from database.models import engine, replica_engine, replica_router
+from services.metrics import instrument_engine
+from services import review_tokens
+from services.analytics_service import analytics_service
+for db_engine in filter(None, (engine, replica_engine)):
+    instrument_engine(db_engine)
+    tracing.instrument_engine(db_engine)
 
 # Telegram bot setup
 TELEGRAM_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
@@ -36,7 +49,12 @@ if not TELEGRAM_TOKEN:
     logger.error("TELEGRAM_BOT_TOKEN not found in environment variables!")
     raise ValueError("TELEGRAM_BOT_TOKEN is required")
 
-telegram_app = Application.builder().token(TELEGRAM_TOKEN).build()
+# Bot API calls are recorded as spans of slow-update traces
+builder = Application.builder().token(TELEGRAM_TOKEN).request(tracing.TracingRequest(connection_pool_size=256))
+# Optional Bot API server, e.g. python -m tools.fake_telegram for load tests
+if os.getenv("TELEGRAM_API_BASE_URL"):
+    builder = builder.base_url(os.getenv("TELEGRAM_API_BASE_URL"))
+telegram_app = builder.build()
 
 # Initialize the application
 async def initialize_telegram():
@@ -45,16 +63,104 @@ async def initialize_telegram():
     await telegram_app.start()
     logger.info("Telegram application initialized successfully")
 
+def warm_up():
+    """Import services and build clients ahead of the first update that needs them"""
+    started = time.perf_counter()
+    from services.user_service import user_service
+    from services.word_service import word_service
+    from services.srs_service import srs_service
+    from services.ai_service import ai_service
+    ai_service.client
+    logger.info(f"Services warmed up in {time.perf_counter() - started:.2f}s")
+
+# With WORKER_PROCESSES > 0 this process only routes updates to worker processes
+WORKER_PROCESSES = int(os.getenv("WORKER_PROCESSES", "0"))
+dispatcher = None
+
+# Hours between review compaction passes; 0 disables the background job
+REVIEW_COMPACTION_HOURS = float(os.getenv("REVIEW_COMPACTION_HOURS", "24"))
+
+# Minutes between sweeps for words still missing examples; 0 disables the sweep
+ENRICHMENT_SWEEP_MINUTES = float(os.getenv("ENRICHMENT_SWEEP_MINUTES", "10"))
+# Minutes between daily-active-user rollups for /admin/analytics; 0 disables them
+ANALYTICS_ROLLUP_MINUTES = float(os.getenv("ANALYTICS_ROLLUP_MINUTES", "60"))
+
+async def enrichment_sweep_loop():
+    """Periodically queue lexicon entries whose example enrichment was lost"""
+    from services.enrichment_service import enrichment_service
+    loop = asyncio.get_running_loop()
+    while True:
+        enrichment_service.schedule(await loop.run_in_executor(None, enrichment_service.missing_entry_ids))
+        await asyncio.sleep(ENRICHMENT_SWEEP_MINUTES * 60)
+
+async def review_compaction_loop():
+    """Periodically compact old raw reviews into daily aggregates"""
+    from services.review_compaction import review_compactor
+    loop = asyncio.get_running_loop()
+    while True:
+        await loop.run_in_executor(None, review_compactor.run)
+        await asyncio.sleep(REVIEW_COMPACTION_HOURS * 3600)
+
+async def analytics_rollup_loop():
+    """Periodically count daily active users into the analytics aggregates"""
+    loop = asyncio.get_running_loop()
+    while True:
+        await loop.run_in_executor(None, analytics_service.rollup)
+        await asyncio.sleep(ANALYTICS_ROLLUP_MINUTES * 60)
+
+async def analytics_flush_loop():
+    """Periodically write this process's analytics counts, off the event loop"""
+    if analytics_service.FLUSH_SECONDS <= 0:
+        return
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(analytics_service.FLUSH_SECONDS)
+        await loop.run_in_executor(None, analytics_service.flush)
+
+async def replica_check_loop():
+    """Periodically measure replica lag off the event loop; read paths only look at the result"""
+    loop = asyncio.get_running_loop()
+    while True:
+        await loop.run_in_executor(None, replica_router.check)
+        await asyncio.sleep(replica_router.check_interval)
+
 # Initialize on startup
 @app.on_event("startup")
 async def startup_event():
-    """Initialize Telegram app on FastAPI startup"""
+    """Initialize Telegram app, or the update workers, on FastAPI startup"""
+    global dispatcher
+    # Maintenance runs once, in the main process
+    if REVIEW_COMPACTION_HOURS > 0 and os.getenv("WORKER_ROLE") != "worker":
+        asyncio.create_task(review_compaction_loop())
+    if ENRICHMENT_SWEEP_MINUTES > 0 and os.getenv("WORKER_ROLE") != "worker":
+        asyncio.create_task(enrichment_sweep_loop())
+    if ANALYTICS_ROLLUP_MINUTES > 0 and os.getenv("WORKER_ROLE") != "worker":
+        asyncio.create_task(analytics_rollup_loop())
+    # Every process that handles updates keeps its own counts
+    asyncio.create_task(analytics_flush_loop())
+    if replica_engine is not None:
+        asyncio.create_task(replica_check_loop())
+    
+    if WORKER_PROCESSES > 0 and os.getenv("WORKER_ROLE") != "worker":
+        from services.shard_dispatcher import ShardDispatcher
+        dispatcher = ShardDispatcher(WORKER_PROCESSES)
+        dispatcher.start()
+        return
+    
     await initialize_telegram()
+    # Services load lazily; warm them in the background so startup isn't delayed
+    if os.getenv("WARM_UP", "true").lower() in ("1", "true", "yes"):
+        asyncio.get_running_loop().run_in_executor(None, warm_up)
 
 # Shutdown event
 @app.on_event("shutdown")
 async def shutdown_event():
     """Shutdown Telegram app on FastAPI shutdown"""
+    await asyncio.get_running_loop().run_in_executor(None, analytics_service.flush)
+    if dispatcher is not None:
+        await asyncio.get_running_loop().run_in_executor(None, dispatcher.stop)
+        logger.info("Update workers stopped")
+        return
     await telegram_app.stop()
     await telegram_app.shutdown()
     logger.info("Telegram application shutdown successfully")
@@ -104,6 +210,11 @@ async def help_command(update: Update, context: CallbackContext) -> None:
 /help - Показать эту справку
 /generate - Создать новый список слов
 /learn - Изучить слова
+/batch - Повторить страницу слов одним сообщением (можно указать число: /batch 15)
+/words - Просмотреть коллекцию (можно указать контекст: /words ресторан)
+/find - Найти слово в коллекции (например: /find brood)
+/export - Экспорт коллекции (/export csv или /export anki)
+/import - Импорт слов из CSV или Anki
 /stats - Показать статистику
 /profile - Настройки профиля
 
@@ -141,19 +252,25 @@ async def generate_command(update: Update, context: CallbackContext) -> None:
         "Можно указать количество слов: 'ресторан 15'"
     )
 
+LEARN_PAGE_SIZE = 10
+
 async def learn_command(update: Update, context: CallbackContext) -> None:
     """Handle /learn command"""
+    await start_review_session(update, context)
+
+async def start_review_session(update: Update, context: CallbackContext, after=None, from_callback: bool = False) -> None:
+    """Load the next page of due words (after the ``after`` cursor) and show the first one"""
     user = update.effective_user
     
     try:
-        from services.srs_service import SRSService
-        srs_service = SRSService()
+        from services.srs_service import srs_service
         
         # Get due words for review
-        due_words = srs_service.get_due_words(user.id, limit=10)
+        due_words = srs_service.get_due_words(user.id, limit=LEARN_PAGE_SIZE, after=after)
         
         if not due_words:
-            await update.message.reply_text(
+            message = update.callback_query.message if from_callback else update.message
+            await message.reply_text(
                 "🎉 Отлично! У вас нет слов для изучения.\n\n"
                 "Все слова уже выучены или еще не готовы для повторения.\n"
                 "Используйте /generate для добавления новых слов!"
@@ -164,17 +281,130 @@ async def learn_command(update: Update, context: CallbackContext) -> None:
         context.user_data['review_words'] = due_words
         context.user_data['current_word_index'] = 0
         context.user_data['review_session_active'] = True
+        context.user_data['review_nonce'] = review_tokens.new_nonce()
+        # A full page means the backlog may continue past the last word
+        context.user_data['review_cursor'] = (
+            srs_service.get_due_cursor(due_words[-1]) if len(due_words) == LEARN_PAGE_SIZE else None
+        )
         
         # Show first word
-        await show_next_review_word(update, context)
+        await show_next_review_word(update, context, from_callback=from_callback)
         
     except Exception as e:
         logger.error(f"Error starting learning session: {e}")
-        await update.message.reply_text(
+        message = update.callback_query.message if from_callback else update.message
+        await message.reply_text(
             "❌ Ошибка при запуске изучения.\n"
             "Попробуйте позже."
         )
 
+# Cards per message in batch review mode; one keyboard row each, plus the submit row
+BATCH_REVIEW_SIZE = int(os.getenv("BATCH_REVIEW_SIZE", "10"))
+BATCH_REVIEW_MAX = 20
+
+def render_batch_review(batch: dict):
+    """Text and keyboard of a batch review page; each card's button shows its current answer"""
+    from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+    
+    lines = ["📋 Отметьте слова, которые вы не знали, и отправьте ответы:", ""]
+    keyboard = []
+    for index, (word, knew) in enumerate(zip(batch["words"], batch["knew"])):
+        lines.append(f"{index + 1}. {word['word']} → {word['translation']}")
+        keyboard.append([InlineKeyboardButton(
+            f"{index + 1}. {word['word']} — {'✅ знаю' if knew else '❌ не знаю'}",
+            callback_data=f"batch_toggle_{index}"
+        )])
+    keyboard.append([InlineKeyboardButton("📨 Отправить ответы", callback_data="batch_submit")])
+    return "\n".join(lines), InlineKeyboardMarkup(keyboard)
+
+async def batch_command(update: Update, context: CallbackContext) -> None:
+    """Handle /batch command: review a page of cards in one message"""
+    await start_batch_review(update, context)
+
+async def start_batch_review(update: Update, context: CallbackContext, from_callback: bool = False) -> None:
+    """Send the next page of due words as one message with a toggle button per card"""
+    user = update.effective_user
+    message = update.callback_query.message if from_callback else update.message
+    size = BATCH_REVIEW_SIZE
+    if context.args and context.args[0].isdigit():
+        size = int(context.args[0])
+    size = max(1, min(size, BATCH_REVIEW_MAX))
+    
+    try:
+        from services.srs_service import srs_service
+        due_words = srs_service.get_due_words(user.id, limit=size)
+        
+        if not due_words:
+            await message.reply_text(
+                "🎉 Отлично! У вас нет слов для изучения.\n\n"
+                "Используйте /generate для добавления новых слов!"
+            )
+            return
+        
+        # Everything starts as known; one tap marks a card as not known
+        batch = {
+            "words": [{"id": word.id, "word": word.word, "translation": word.translation} for word in due_words],
+            "knew": [True] * len(due_words)
+        }
+        text, reply_markup = render_batch_review(batch)
+        sent = await message.reply_text(text, reply_markup=reply_markup)
+        pages = context.user_data.setdefault('batch_reviews', {})
+        pages[sent.message_id] = batch
+        # Abandoned pages are forgotten; only the most recent few can still be submitted
+        for message_id in sorted(pages)[:-3]:
+            del pages[message_id]
+        
+    except Exception as e:
+        logger.error(f"Error starting batch review: {e}")
+        await message.reply_text(
+            "❌ Ошибка при запуске изучения.\n"
+            "Попробуйте позже."
+        )
+
+async def handle_batch_callback(update: Update, context: CallbackContext) -> None:
+    """Toggle a card's answer (editing the keyboard in place) or submit the whole page"""
+    query = update.callback_query
+    batch = context.user_data.get('batch_reviews', {}).get(query.message.message_id)
+    if batch is None:
+        # Already submitted (e.g. a double tap) or forgotten; leave the message as it is
+        await query.message.reply_text("⌛ Эта страница уже отправлена или устарела. Используйте /batch снова.")
+        return
+    
+    if query.data.startswith("batch_toggle_"):
+        index = int(query.data[len("batch_toggle_"):])
+        if 0 <= index < len(batch["knew"]):
+            batch["knew"][index] = not batch["knew"][index]
+            _, reply_markup = render_batch_review(batch)
+            await query.edit_message_reply_markup(reply_markup=reply_markup)
+        return
+    
+    # Submit: the whole page is applied in one transaction
+    from services.srs_service import srs_service
+    answers = [(word["id"], knew) for word, knew in zip(batch["words"], batch["knew"])]
+    applied = srs_service.process_reviews(query.from_user.id, answers)
+    if applied is None:
+        await query.edit_message_text(
+            "❌ Ошибка при обработке ответов.\n"
+            "Попробуйте /batch снова."
+        )
+        return
+    del context.user_data['batch_reviews'][query.message.message_id]
+    
+    from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+    # Words deleted or already answered elsewhere (e.g. in /learn) are left as they are
+    applied = set(applied)
+    known = sum(knew for word, knew in zip(batch["words"], batch["knew"]) if word["id"] in applied)
+    lines = [f"✅ Ответы сохранены: знаю {known}, не знаю {len(applied) - known}.", ""]
+    for word, knew in zip(batch["words"], batch["knew"]):
+        mark = ('✅' if knew else '❌') if word["id"] in applied else '⏭'
+        lines.append(f"{mark} {word['word']} → {word['translation']}")
+    if len(applied) < len(answers):
+        lines += ["", f"⏭ Не сохранено {len(answers) - len(applied)}: эти слова уже повторены или удалены."]
+    await query.edit_message_text(
+        "\n".join(lines),
+        reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("▶️ Следующая страница", callback_data="batch_more")]])
+    )
+
 async def show_next_review_word(update: Update, context: CallbackContext, from_callback: bool = False) -> None:
     """Show next word for review"""
     try:
@@ -189,17 +419,26 @@ async def show_next_review_word(update: Update, context: CallbackContext, from_c
                 "Используйте /stats для просмотра статистики."
             )
             
+            review_cursor = context.user_data.get('review_cursor')
+            reply_markup = None
+            if review_cursor is not None:
+                from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+                reply_markup = InlineKeyboardMarkup([
+                    [InlineKeyboardButton("▶️ Продолжить", callback_data="learn_more")]
+                ])
+            
             if from_callback and update.callback_query:
                 # We're in a callback query context
-                await update.callback_query.message.reply_text(completion_message)
+                await update.callback_query.message.reply_text(completion_message, reply_markup=reply_markup)
             elif update.message:
                 # We're in a regular message context
-                await update.message.reply_text(completion_message)
+                await update.message.reply_text(completion_message, reply_markup=reply_markup)
             else:
                 logger.error("Cannot send message: neither callback_query nor message available")
             
-            # Clear session data
-            context.user_data.clear()
+            # Clear session data, keeping the position in the due queue and other features' state
+            for key in ('review_words', 'current_word_index', 'review_session_active', 'review_nonce'):
+                context.user_data.pop(key, None)
             return
         
         word = words[current_index]
@@ -207,14 +446,22 @@ async def show_next_review_word(update: Update, context: CallbackContext, from_c
         # Create inline keyboard for "Знаю/Не знаю" buttons
         from telegram import InlineKeyboardButton, InlineKeyboardMarkup
         
+        # Signed answers carry everything the review needs, so it is applied without reading the word
+        nonce = context.user_data.setdefault('review_nonce', review_tokens.new_nonce())
         keyboard = [
             [
-                InlineKeyboardButton("✅ Знаю", callback_data=f"review_knew_{word.id}"),
-                InlineKeyboardButton("❌ Не знаю", callback_data=f"review_didnt_know_{word.id}")
+                InlineKeyboardButton("✅ Знаю", callback_data=review_tokens.issue(word.id, word.user_id, word.interval_days, nonce, True)),
+                InlineKeyboardButton("❌ Не знаю", callback_data=review_tokens.issue(word.id, word.user_id, word.interval_days, nonce, False))
             ]
         ]
         reply_markup = InlineKeyboardMarkup(keyboard)
         
+        # Examples are filled in after the word list is stored; re-read the entry if this card has none yet
+        example = word.example
+        if not example:
+            from services.enrichment_service import enrichment_service
+            example = enrichment_service.get_example(word.lexicon_id)
+        
         # Show word
         word_message = f"""
 📖 Слово {current_index + 1} из {len(words)}:
@@ -222,7 +469,7 @@ async def show_next_review_word(update: Update, context: CallbackContext, from_c
 **{word.word}** → {word.translation}
 
 💡 Пример:
-{word.example if word.example else 'Пример не доступен'}
+{example if example else '⏳ Пример скоро появится'}
 """
         
         if from_callback and update.callback_query:
@@ -337,6 +584,286 @@ async def profile_command(update: Update, context: CallbackContext) -> None:
             "Попробуйте позже."
         )
 
+WORDS_PAGE_SIZE = 10
+_CURSOR_EPOCH = datetime(1970, 1, 1)
+
+def encode_page_cursor(cursor) -> str:
+    """Pack a (created_at, id) cursor into callback data: '<microseconds>_<id>'"""
+    created_at, word_id = cursor
+    return f"{(created_at - _CURSOR_EPOCH) // timedelta(microseconds=1)}_{word_id}"
+
+def decode_page_cursor(data: str):
+    """Inverse of encode_page_cursor"""
+    micros, word_id = data.split("_")
+    return (_CURSOR_EPOCH + timedelta(microseconds=int(micros)), int(word_id))
+
+async def words_command(update: Update, context: CallbackContext) -> None:
+    """Handle /words command: browse the collection, optionally filtered by context"""
+    words_context = " ".join(context.args) if context.args else None
+    await show_words_page(update, context, words_context)
+
+async def handle_words_callback(update: Update, context: CallbackContext) -> None:
+    """Turn a /words message to the next or previous page, keeping that message's filter"""
+    query = update.callback_query
+    # Context names don't fit in callback data; each list message keeps its own filter
+    lists = context.user_data.get('words_lists', {})
+    if query.message.message_id not in lists:
+        await query.message.reply_text("⌛ Этот список устарел. Используйте /words снова.")
+        return
+    words_context = lists[query.message.message_id]
+    
+    if query.data.startswith("words_next_"):
+        await show_words_page(update, context, words_context, before=decode_page_cursor(query.data[len("words_next_"):]))
+    else:
+        await show_words_page(update, context, words_context, after=decode_page_cursor(query.data[len("words_prev_"):]))
+
+async def show_words_page(update: Update, context: CallbackContext, words_context=None, before=None, after=None) -> None:
+    """Render one page of the collection, filtered by ``words_context``, with prev/next buttons"""
+    user = update.effective_user
+    
+    try:
+        from services.word_service import word_service
+        words = word_service.get_words_page(
+            user.id, context=words_context, before=before, after=after, limit=WORDS_PAGE_SIZE
+        )
+        
+        # One extra row is fetched to tell whether there is more in the paging direction
+        has_more = len(words) > WORDS_PAGE_SIZE
+        if after is not None:
+            words = words[-WORDS_PAGE_SIZE:]
+            has_prev, has_next = has_more, True
+        else:
+            words = words[:WORDS_PAGE_SIZE]
+            has_prev, has_next = before is not None, has_more
+        
+        if not words:
+            text = "📭 В вашей коллекции пока нет слов.\n\nИспользуйте /generate для добавления новых слов!"
+            if words_context:
+                text = f"📭 Нет слов для контекста '{words_context}'."
+            reply_markup = None
+        else:
+            header = f"📚 Ваши слова ({words_context}):" if words_context else "📚 Ваши слова:"
+            lines = [header, ""]
+            for word in words:
+                lines.append(f"• {word.word} → {word.translation}")
+            text = "\n".join(lines)
+            
+            from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+            buttons = []
+            if has_prev:
+                cursor = encode_page_cursor(word_service.get_page_cursor(words[0]))
+                buttons.append(InlineKeyboardButton("⬅️ Назад", callback_data=f"words_prev_{cursor}"))
+            if has_next:
+                cursor = encode_page_cursor(word_service.get_page_cursor(words[-1]))
+                buttons.append(InlineKeyboardButton("Далее ➡️", callback_data=f"words_next_{cursor}"))
+            reply_markup = InlineKeyboardMarkup([buttons]) if buttons else None
+        
+        if update.callback_query:
+            await update.callback_query.edit_message_text(text, reply_markup=reply_markup)
+        else:
+            sent = await update.message.reply_text(text, reply_markup=reply_markup)
+            lists = context.user_data.setdefault('words_lists', {})
+            lists[sent.message_id] = words_context
+            # Only the most recent lists can still be paged
+            for message_id in sorted(lists)[:-10]:
+                del lists[message_id]
+        
+    except Exception as e:
+        logger.error(f"Error showing words page: {e}")
+        message = update.callback_query.message if update.callback_query else update.message
+        await message.reply_text(
+            "❌ Ошибка при загрузке слов.\n"
+            "Попробуйте позже."
+        )
+
+async def find_command(update: Update, context: CallbackContext) -> None:
+    """Handle /find command: fuzzy search over the user's words"""
+    user = update.effective_user
+    query_text = " ".join(context.args) if context.args else ""
+    
+    if not query_text:
+        await update.message.reply_text(
+            "🔍 Укажите, что искать.\n\n"
+            "Например: /find brood"
+        )
+        return
+    
+    try:
+        from services.search_service import search_service
+        words = search_service.search(user.id, query_text, limit=10)
+        
+        if not words:
+            await update.message.reply_text(f"🔍 Ничего не найдено по запросу '{query_text}'.")
+            return
+        
+        lines = [f"🔍 Результаты по запросу '{query_text}':", ""]
+        for word in words:
+            lines.append(f"• {word.word} → {word.translation}")
+        await update.message.reply_text("\n".join(lines))
+        
+    except Exception as e:
+        logger.error(f"Error searching words: {e}")
+        await update.message.reply_text(
+            "❌ Ошибка при поиске.\n"
+            "Попробуйте позже."
+        )
+
+async def export_command(update: Update, context: CallbackContext) -> None:
+    """Handle /export command: send the collection as CSV or an Anki text file"""
+    user = update.effective_user
+    fmt = context.args[0].lower() if context.args else "csv"
+    if fmt not in ("csv", "anki"):
+        await update.message.reply_text(
+            "📤 Формат экспорта: /export csv или /export anki"
+        )
+        return
+    
+    handle, path = tempfile.mkstemp(suffix=".csv" if fmt == "csv" else ".txt")
+    os.close(handle)
+    try:
+        from services.deck_service import deck_service
+        # Rows are streamed from the database into the file off the event loop
+        count = await asyncio.get_running_loop().run_in_executor(
+            None, deck_service.export_words, user.id, fmt, path
+        )
+        if count == 0:
+            await update.message.reply_text("📚 В вашей коллекции пока нет слов.")
+            return
+        
+        filename = "words.csv" if fmt == "csv" else "words_anki.txt"
+        caption = f"📤 Экспортировано слов: {count}"
+        if fmt == "anki":
+            caption += "\nВ Anki: Файл → Импорт"
+        with open(path, "rb") as document:
+            await update.message.reply_document(document=document, filename=filename, caption=caption)
+        
+    except Exception as e:
+        logger.error(f"Error exporting words: {e}")
+        await update.message.reply_text(
+            "❌ Ошибка при экспорте.\n"
+            "Попробуйте позже."
+        )
+    finally:
+        os.remove(path)
+
+async def import_command(update: Update, context: CallbackContext) -> None:
+    """Handle /import command: explain the accepted file formats"""
+    await update.message.reply_text(
+        "📥 Отправьте файл со словами как документ.\n\n"
+        "Поддерживаются:\n"
+        "• CSV с заголовком word,translation (а также example, example_translation, context, "
+        "difficulty, interval_days, next_review — как в /export csv)\n"
+        "• Текстовый файл Anki (Файл → Экспорт → Заметки в простом тексте)\n\n"
+        "Слова, которые уже есть в коллекции, пропускаются."
+    )
+
+async def handle_document(update: Update, context: CallbackContext) -> None:
+    """Import an uploaded deck file"""
+    user = update.effective_user
+    document = update.message.document
+    from services.deck_service import deck_service, DeckImportError
+    
+    try:
+        from services.user_service import user_service
+        profile = user_service.get_user_profile(user.id)
+        if not profile or not profile["language_from"] or not profile["language_to"]:
+            await update.message.reply_text(
+                "⚠️ Сначала выберите языковую пару!\n\n"
+                "Используйте /start для настройки профиля."
+            )
+            return
+        if document.file_size and document.file_size > deck_service.max_bytes:
+            await update.message.reply_text(
+                f"❌ Файл слишком большой (максимум {deck_service.max_bytes // (1024 * 1024)} МБ)."
+            )
+            return
+        
+        status_message = await update.message.reply_text("⏳ Проверяю файл...")
+        handle, path = tempfile.mkstemp()
+        os.close(handle)
+        try:
+            telegram_file = await document.get_file()
+            await telegram_file.download_to_drive(path)
+            rows, added = await asyncio.get_running_loop().run_in_executor(
+                None, deck_service.import_file, user.id, profile["language_from"], profile["language_to"], path
+            )
+        finally:
+            os.remove(path)
+        
+        await status_message.edit_text(
+            f"✅ Импорт завершён.\n\n"
+            f"Строк в файле: {rows}\n"
+            f"Добавлено новых слов: {added}\n\n"
+            f"Используйте /learn для изучения!"
+        )
+        
+    except DeckImportError as e:
+        await update.message.reply_text(f"❌ Файл не импортирован:\n{e}")
+    except Exception as e:
+        logger.error(f"Error importing words: {e}")
+        await update.message.reply_text(
+            "❌ Ошибка при импорте.\n"
+            "Попробуйте позже."
+        )
+
+async def handle_review_answer(update: Update, context: CallbackContext) -> None:
+    """Apply a signed "Знаю/Не знаю" answer"""
+    query = update.callback_query
+    token = review_tokens.verify(query.data)
+    
+    # Forged, foreign, repeated and stale answers are turned away before touching the database
+    if token is None or token.user_id != query.from_user.id:
+        logger.warning(f"Rejected review callback from user {query.from_user.id}")
+        await query.edit_message_text("❌ Ошибка при обработке ответа. Попробуйте /learn снова.")
+        return
+    # No nonce means the session is over (or the bot restarted): every card out there is stale
+    if token.nonce != context.user_data.get('review_nonce'):
+        await query.edit_message_text("⌛ Эта карточка из прошлой сессии. Используйте /learn снова.")
+        return
+    if not review_tokens.replay_guard.claim(token):
+        logger.debug("Ignoring repeated answer", extra={"word_id": token.word_id, "user_id": token.user_id})
+        return
+    
+    try:
+        from services.srs_service import srs_service
+        
+        logger.debug("Processing review", extra={"word_id": token.word_id, "knew": token.knew, "user_id": token.user_id})
+        success = srs_service.apply_review(token.word_id, token.user_id, token.interval_days, token.knew)
+        if not success:
+            # Stale answers are turned away by the database again; failed writes can be retried
+            review_tokens.replay_guard.release(token)
+        
+        if success:
+            # Move to next word
+            context.user_data['current_word_index'] = context.user_data.get('current_word_index', 0) + 1
+            
+            # Show feedback (don't edit the message, just send a new one)
+            feedback = "✅ Правильно!" if token.knew else "❌ Неправильно. Попробуйте еще раз!"
+            await query.message.reply_text(feedback)
+            
+            # Show next word after a short delay
+            await asyncio.sleep(1)
+            try:
+                await show_next_review_word(update, context, from_callback=True)
+            except Exception as e:
+                logger.error(f"Error showing next review word: {e}")
+                await query.edit_message_text(
+                    "❌ Ошибка при показе следующего слова.\n"
+                    "Попробуйте /learn снова."
+                )
+        else:
+            await query.edit_message_text(
+                "❌ Этот ответ уже учтён или слово изменилось.\n"
+                "Попробуйте /learn снова."
+            )
+    except Exception as e:
+        review_tokens.replay_guard.release(token)
+        logger.error(f"Error processing review: {e}")
+        await query.edit_message_text(
+            "❌ Ошибка при обработке ответа.\n"
+            "Попробуйте /learn снова."
+        )
+
 async def handle_callback_query(update: Update, context: CallbackContext) -> None:
     """Handle callback queries from inline keyboards"""
     query = update.callback_query
@@ -358,69 +885,28 @@ async def handle_callback_query(update: Update, context: CallbackContext) -> Non
                 "• /stats - посмотреть статистику"
             )
         
+        elif query.data.startswith(("words_next_", "words_prev_")):
+            await handle_words_callback(update, context)
+        
+        elif query.data == "learn_more":
+            # Continue the review backlog after the last page
+            await start_review_session(
+                update, context, after=context.user_data.get('review_cursor'), from_callback=True
+            )
+        
+        elif query.data == "batch_more":
+            await query.edit_message_reply_markup(reply_markup=None)
+            await start_batch_review(update, context, from_callback=True)
+        
+        elif query.data.startswith("batch_"):
+            await handle_batch_callback(update, context)
+        
+        elif query.data.startswith(review_tokens.PREFIX):
+            await handle_review_answer(update, context)
+        
         elif query.data.startswith("review_"):
-            # Review session buttons
-            user = query.from_user
-            logger.info(f"Processing review callback: {query.data}")
-            
-            # Parse callback data: "review_knew_123" or "review_didnt_know_123"
-            if query.data.startswith("review_knew_"):
-                action = "knew"
-                word_id_str = query.data.replace("review_knew_", "")
-            elif query.data.startswith("review_didnt_know_"):
-                action = "didnt_know"
-                word_id_str = query.data.replace("review_didnt_know_", "")
-            else:
-                logger.error(f"Unknown review callback format: {query.data}")
-                await query.edit_message_text("❌ Ошибка при обработке ответа. Попробуйте /learn снова.")
-                return
-            
-            try:
-                word_id = int(word_id_str)
-                logger.info(f"Parsed: action={action}, word_id={word_id}")
-            except ValueError as e:
-                logger.error(f"Error parsing word_id from '{word_id_str}' in callback '{query.data}': {e}")
-                await query.edit_message_text("❌ Ошибка при обработке ответа. Попробуйте /learn снова.")
-                return
-            
-            try:
-                from services.srs_service import SRSService
-                srs_service = SRSService()
-                
-                # Process the review
-                knew = (action == "knew")
-                logger.info(f"Processing review: word_id={word_id}, action='{action}', knew={knew}")
-                success = srs_service.process_review(word_id, user.id, knew)
-                
-                if success:
-                    # Move to next word
-                    context.user_data['current_word_index'] = context.user_data.get('current_word_index', 0) + 1
-                    
-                    # Show feedback (don't edit the message, just send a new one)
-                    feedback = "✅ Правильно!" if knew else "❌ Неправильно. Попробуйте еще раз!"
-                    await query.message.reply_text(feedback)
-                    
-                    # Show next word after a short delay
-                    await asyncio.sleep(1)
-                    try:
-                        await show_next_review_word(update, context, from_callback=True)
-                    except Exception as e:
-                        logger.error(f"Error showing next review word: {e}")
-                        await query.edit_message_text(
-                            "❌ Ошибка при показе следующего слова.\n"
-                            "Попробуйте /learn снова."
-                        )
-                else:
-                    await query.edit_message_text(
-                        "❌ Ошибка при обработке ответа.\n"
-                        "Попробуйте /learn снова."
-                    )
-            except Exception as e:
-                logger.error(f"Error processing review: {e}")
-                await query.edit_message_text(
-                    "❌ Ошибка при обработке ответа.\n"
-                    "Попробуйте /review снова."
-                )
+            # Buttons sent before answers were signed
+            await query.edit_message_text("⌛ Эта карточка устарела. Используйте /learn снова.")
             
     except Exception as e:
         logger.error(f"Error handling callback query: {e}")
@@ -444,7 +930,7 @@ async def handle_text_message(update: Update, context: CallbackContext) -> None:
         
         # Parse context and count
         parts = text.strip().split()
-        logger.info(f"Parsing text: '{text}' into parts: {parts}")
+        logger.debug("Parsing text %r into parts %s", text, parts)
         
         # Look for a number in the text (not just the last part)
         count = 20  # default
@@ -457,24 +943,24 @@ async def handle_text_message(update: Update, context: CallbackContext) -> None:
         
         if match:
             count = int(match.group(1))
-            logger.info(f"Found count pattern: {count} words")
+            logger.debug("Found count pattern: %d words", count)
             # Remove the number and "слов" from context
             context_text = re.sub(number_pattern, '', text.lower()).strip()
             # Capitalize first letter
             if context_text:
                 context_text = context_text[0].upper() + context_text[1:]
-            logger.info(f"Context after removing count: '{context_text}', count: {count}")
+            logger.debug("Context after removing count: %r, count: %d", context_text, count)
         else:
             # Try to find just a number at the end
             try:
                 last_part = parts[-1]
                 if last_part.isdigit():
                     count = int(last_part)
-                    logger.info(f"Found count in last part: {count}")
+                    logger.debug("Found count in last part: %d", count)
                     context_text = " ".join(parts[:-1])
-                    logger.info(f"Context without count: '{context_text}', count: {count}")
+                    logger.debug("Context without count: %r, count: %d", context_text, count)
             except (IndexError, ValueError):
-                logger.info(f"No count found, using default: context='{context_text}', count={count}")
+                logger.debug("No count found, using default: context=%r, count=%d", context_text, count)
         
         # Validate count
         if count > 100:
@@ -495,14 +981,20 @@ async def handle_text_message(update: Update, context: CallbackContext) -> None:
             "Это может занять несколько секунд."
         )
         
-        # Generate words
+        # Generate words the user doesn't have yet
         from services.ai_service import ai_service
-        words = await ai_service.generate_word_list(context_text, lang_from, lang_to, count)
+        from services.known_words import known_words
+        known = known_words.get(user.id, lang_from, lang_to)
+        words = await ai_service.generate_word_list(context_text, lang_from, lang_to, count, known=known)
         
         if words:
             # Add words to database
             from services.word_service import word_service
-            added_words = word_service.add_words_from_list(user.id, words, context_text)
+            added_words = word_service.add_words_from_list(user.id, words, context_text, lang_from, lang_to)
+            # Second phase: examples are generated in the background
+            from services.enrichment_service import enrichment_service
+            enrichment_service.schedule(word.lexicon_id for word in added_words if not word.example)
+            analytics_service.record_generation(f"{lang_from}-{lang_to}", len(added_words))
             
             # Show results
             result_message = f"""
@@ -548,8 +1040,14 @@ telegram_app.add_handler(CommandHandler("start", start_command))
 telegram_app.add_handler(CommandHandler("help", help_command))
 telegram_app.add_handler(CommandHandler("generate", generate_command))
 telegram_app.add_handler(CommandHandler("learn", learn_command))
+telegram_app.add_handler(CommandHandler("batch", batch_command))
 telegram_app.add_handler(CommandHandler("stats", stats_command))
 telegram_app.add_handler(CommandHandler("profile", profile_command))
+telegram_app.add_handler(CommandHandler("words", words_command))
+telegram_app.add_handler(CommandHandler("find", find_command))
+telegram_app.add_handler(CommandHandler("export", export_command))
+telegram_app.add_handler(CommandHandler("import", import_command))
+register_commands(telegram_app)
 
 # Add callback query handler for inline keyboards
 from telegram.ext import CallbackQueryHandler
@@ -557,6 +1055,7 @@ telegram_app.add_handler(CallbackQueryHandler(handle_callback_query))
 
 # Add message handler for text input
 telegram_app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_text_message))
+telegram_app.add_handler(MessageHandler(filters.Document.ALL, handle_document))
 
 # Webhook endpoint for Telegram
 @app.post("/webhook")
@@ -564,22 +1063,124 @@ async def webhook(request: Request):
     """Handle Telegram webhook"""
     try:
         data = await request.json()
-        logger.info(f"Received webhook update: {data.get('update_id', 'unknown')}")
-        
-        update = Update.de_json(data, telegram_app.bot)
-        await telegram_app.process_update(update)
-        
+        if dispatcher is not None:
+            dispatcher.submit(data)
+        else:
+            await process_update_data(data)
         return JSONResponse(content={"status": "ok"})
     except Exception as e:
+        WEBHOOK_ERRORS.labels(type(e).__name__).inc()
         logger.error(f"Webhook error: {e}")
         # Return 200 even on error to prevent Telegram from retrying
         return JSONResponse(content={"status": "error", "message": str(e)})
 
+async def process_update_data(data: dict):
+    """Process one raw update, here or in an update worker"""
+    trace = tracing.start_trace(data.get("update_id"))
+    try:
+        with tracing.span("parse"):
+            update = Update.de_json(data, telegram_app.bot)
+        trace.label = update_label(update)
+        if update.effective_user is not None:
+            analytics_service.record_active(update.effective_user.id)
+        logger.debug("Received webhook update %s", update.update_id)
+        
+        started = time.perf_counter()
+        with tracing.span("handler", "/".join(trace.label)):
+            await telegram_app.process_update(update)
+        HANDLER_LATENCY.labels(*trace.label).observe(time.perf_counter() - started)
+    finally:
+        tracing.finish_trace(trace)
+
+# Prometheus metrics endpoint
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics"""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        # Update workers write their samples to files there; merge them
+        from prometheus_client import CollectorRegistry, multiprocess
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return Response(content=generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
+    return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+def require_admin(request: Request):
+    """Reject requests without the ADMIN_TOKEN bearer token; admin endpoints are off without one"""
+    admin_token = os.getenv("ADMIN_TOKEN")
+    supplied = request.headers.get("authorization", "").removeprefix("Bearer ")
+    if not admin_token or not hmac.compare_digest(supplied.encode(), admin_token.encode()):
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+# Sampling profiler endpoint
+@app.get("/admin/profile")
+async def admin_profile(request: Request, seconds: float = 10, interval_ms: float = 5, all_threads: bool = False):
+    """Profile the event loop (or every thread) for ``seconds`` and return collapsed stacks for flamegraphs"""
+    require_admin(request)
+    from services.profiler import profiler
+    
+    # This handler runs on the event loop thread, which is what we want to sample
+    finish = profiler.start(None if all_threads else threading.get_ident(), interval_ms / 1000)
+    if finish is None:
+        raise HTTPException(status_code=409, detail="A profiling session is already running")
+    try:
+        await asyncio.sleep(min(max(seconds, 1), 120))
+    finally:
+        profile = finish()
+    return PlainTextResponse(profile)
+
+# Slow update breakdowns
+@app.get("/admin/slow-updates")
+async def admin_slow_updates(request: Request):
+    """Span breakdowns of recent updates slower than SLOW_UPDATE_SECONDS, newest first"""
+    require_admin(request)
+    return {"threshold_seconds": tracing.SLOW_UPDATE_SECONDS, "updates": list(reversed(tracing.slow_updates))}
+
+# Update worker health and resizing
+@app.get("/admin/workers")
+async def admin_workers(request: Request):
+    """Health of each update worker"""
+    require_admin(request)
+    if dispatcher is None:
+        raise HTTPException(status_code=404, detail="Update workers are not enabled")
+    return dispatcher.status()
+
+@app.post("/admin/workers")
+async def admin_resize_workers(request: Request, count: int):
+    """Change the number of update workers; moved chats are handed over in order"""
+    require_admin(request)
+    if dispatcher is None:
+        raise HTTPException(status_code=404, detail="Update workers are not enabled")
+    try:
+        dispatcher.resize(count)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return dispatcher.status()
+
+# Usage analytics
+@app.get("/admin/analytics")
+async def admin_analytics(request: Request, days: int = 30):
+    """Daily active users, reviews, generations per language pair and OpenAI spend for the last ``days`` days"""
+    require_admin(request)
+    if not 1 <= days <= 366:
+        raise HTTPException(status_code=400, detail="days must be between 1 and 366")
+    return await asyncio.get_running_loop().run_in_executor(None, analytics_service.report, days)
+
 # Health check endpoint
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
-    return {"status": "healthy", "bot": "Words Learner Bot"}
+    health = {"status": "healthy", "bot": "Words Learner Bot"}
+    if dispatcher is not None:
+        workers = dispatcher.status()["workers"]
+        healthy = sum(worker["healthy"] for worker in workers)
+        health["status"] = "healthy" if healthy else "unhealthy"
+        health["workers"] = {"healthy": healthy, "total": len(workers)}
+    if replica_engine is not None:
+        # Last measured lag; reads fall back to the primary when it's over the bound or unknown
+        health["replica"] = {"lag_seconds": replica_router.lag, "max_lag_seconds": replica_router.max_lag}
+    return health
 
 # Root endpoint
 @app.get("/")
@@ -594,6 +1195,11 @@ if __name__ == "__main__":
         logger.info(f"OpenAI Key: {'SET' if os.getenv('OPENAI_API_KEY') else 'MISSING'}")
         logger.info(f"Database URL: {'SET' if os.getenv('DATABASE_URL') else 'MISSING'}")
         
+        if os.getenv("AUTO_MIGRATE", "false").lower() in ("1", "true", "yes"):
+            from database.models import create_tables
+            create_tables()
+            logger.info("Database tables created successfully")
+        
         uvicorn.run(app, host="0.0.0.0", port=int(os.getenv("PORT", 8000)))
     except Exception as e:
         logger.error(f"Failed to start application: {e}")
@@ -1,143 +1,427 @@
-import openai
 import os
+import asyncio
 import logging
-from typing import List, Dict, Optional
+import math
+import random
+import time
+from typing import Container, Dict, Iterator, List, Optional, Tuple
+from services.analytics_service import analytics_service
+from services.metrics import OPENAI_FAILURES, observe_openai
+from services.resilience import CircuitBreaker, CircuitOpenError, LatencyTracker
+from services.tracing import span
 
 logger = logging.getLogger(__name__)
 
 class AIService:
+    # Completion tokens per word ([word, translation] as a JSON array) and fixed overhead;
+    # Cyrillic takes roughly twice as many tokens per character
+    TOKENS_PER_WORD = {"latin": 15, "cyrillic": 28}
+    # Completion tokens per example item ([word, example, example translation])
+    TOKENS_PER_EXAMPLE = {"latin": 40, "cyrillic": 75}
+    TOKENS_OVERHEAD = 50
+    MAX_COMPLETION_TOKENS = 4000
+    MAX_GENERATION_ROUNDS = 4
+    # Extra words requested per missing word when the user already has words in the pair
+    KNOWN_OVERREQUEST = float(os.getenv("GENERATION_OVERREQUEST", "0.5"))
+    
+    # Field order of the compact array schema; lists are generated without examples,
+    # which are added later by generate_examples (older cached lists still have them)
+    WORD_FIELDS = ("word", "translation", "example_sentence_L1", "example_sentence_L2")
+    LANGUAGE_NAMES = {"en": "English", "nl": "Dutch", "ru": "Russian"}
+    
+    # Resilience settings for OpenAI calls
+    REQUEST_DEADLINE = float(os.getenv("OPENAI_REQUEST_DEADLINE", "30"))
+    MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "2"))
+    RETRY_BACKOFF_BASE = 0.5
+    RETRY_BACKOFF_CAP = 8.0
+    HEDGE_ENABLED = os.getenv("OPENAI_HEDGE_ENABLED", "false").lower() in ("1", "true", "yes")
+    # Similarity accepted for cached lists while OpenAI is unavailable
+    FALLBACK_SIMILARITY = 0.4
+    
     def __init__(self):
-        self.client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        # The openai package takes about half a second to import; it is loaded with the client
+        self._client = None
+        self._transient_errors = None
+        self.breaker = CircuitBreaker(
+            "openai",
+            failure_threshold=int(os.getenv("OPENAI_BREAKER_FAILURES", "5")),
+            reset_timeout=float(os.getenv("OPENAI_BREAKER_RESET", "30"))
+        )
+        self.latency = LatencyTracker()
+    
+    @property
+    def client(self):
+        """OpenAI client, created on first use"""
+        if self._client is None:
+            import openai
+            # Retries are handled by _call_openai, not the client
+            self._client = openai.AsyncOpenAI(
+                api_key=os.getenv("OPENAI_API_KEY"),
+                base_url=os.getenv("OPENAI_BASE_URL") or None,
+                max_retries=0
+            )
+        return self._client
+    
+    @property
+    def transient_errors(self) -> tuple:
+        """Errors worth retrying"""
+        if self._transient_errors is None:
+            import openai
+            self._transient_errors = (
+                openai.APITimeoutError,
+                openai.APIConnectionError,
+                openai.RateLimitError,
+                openai.InternalServerError,
+                asyncio.TimeoutError
+            )
+        return self._transient_errors
     
     async def generate_word_list(
         self, 
         context: str, 
         language_from: str, 
         language_to: str, 
-        count: int = 20
+        count: int = 20,
+        level: str = "A1-A2",
+        use_cache: bool = True,
+        known: Optional[Container[str]] = None
     ) -> List[Dict[str, str]]:
         """
-        Generate a custom word list based on context and language pair
+        Generate a custom word list based on context and language pair.
+        Requests matching a curated pack or a list generated earlier for a
+        similar context are served without calling OpenAI.
+        
+        Words in ``known`` (the user's collection, see known_words) are left
+        out: cached lists are topped up from OpenAI, and OpenAI is asked for
+        KNOWN_OVERREQUEST more words than are missing to make up for them.
         """
         try:
-            logger.info(f"AI Service: Generating {count} words for context '{context}', languages {language_from}->{language_to}")
+            logger.info(
+                "Generating %d words for context '%s'", count, context,
+                extra={"pair": f"{language_from}-{language_to}", "level": level}
+            )
             
             # Validate count (max 100 words)
             if count > 100:
                 count = 100
                 logger.warning(f"Requested count {count} exceeds maximum, setting to 100")
             
-            # Create prompt based on language pair
-            if language_from == "en" and language_to == "nl":
-                prompt = self._create_dutch_prompt(context, count)
-            elif language_from == "en" and language_to == "ru":
-                prompt = self._create_russian_prompt(context, count)
-            elif language_from == "nl" and language_to == "en":
-                prompt = self._create_english_from_dutch_prompt(context, count)
-            elif language_from == "ru" and language_to == "en":
-                prompt = self._create_english_from_russian_prompt(context, count)
-            else:
-                raise ValueError(f"Unsupported language pair: {language_from} -> {language_to}")
+            words = []
+            # Words already offered (known ones included), by casefolded spelling and as written
+            seen = {}
+            cached_words = None
             
-            # Call OpenAI API
-            response = await self._call_openai(prompt)
+            if use_cache:
+                from services.pack_service import pack_service
+                from services.generation_cache import generation_cache
+                cached_words = (
+                    pack_service.find_pack_words(context, language_from, language_to, level, count)
+                    or generation_cache.find(context, language_from, language_to, level, count)
+                )
+                if cached_words:
+                    if not known:
+                        return cached_words
+                    for word in cached_words:
+                        seen[word["word"].casefold()] = word["word"]
+                        if word["word"] not in known:
+                            words.append(word)
+                    if len(words) >= count:
+                        return words
+                    logger.debug("User already has %d of the cached words, generating the rest", count - len(words))
             
-            # Parse response
-            words = self._parse_word_list(response)
+            generated = []
+            skipped = 0
+            # A truncated completion keeps its complete items; ask only for what is missing
+            for _ in range(self.MAX_GENERATION_ROUNDS):
+                missing = count - len(words)
+                requested = min(missing + (math.ceil(missing * self.KNOWN_OVERREQUEST) if known else 0), 100)
+                prompt = self._build_prompt(context, language_from, language_to, requested, level)
+                if seen:
+                    prompt += "\nDo not repeat these words: " + ", ".join(seen.values())
+                
+                # Call OpenAI API
+                try:
+                    response = await self._call_openai(
+                        prompt, self._token_budget(requested, language_from, language_to), f"{language_from}-{language_to}"
+                    )
+                except Exception as e:
+                    if words:
+                        logger.warning(f"OpenAI failed after {len(words)} words, returning partial list: {e!r}")
+                        break
+                    if not use_cache:
+                        raise
+                    return self._fallback_word_list(context, language_from, language_to, level, count, e, known)
+                
+                # Parse response
+                new = 0
+                for word in self._parse_word_list(response):
+                    if word["word"].casefold() in seen:
+                        continue
+                    seen[word["word"].casefold()] = word["word"]
+                    generated.append(word)
+                    new += 1
+                    if known and word["word"] in known:
+                        skipped += 1
+                    elif len(words) < count:
+                        words.append(word)
+                if not new or len(words) >= count:
+                    break
+                logger.debug("Got %d of %d words, requesting the remainder", len(words), count)
             
-            logger.info(f"Generated {len(words)} words for context: {context}")
+            if skipped:
+                logger.debug("Left out %d words the user already has", skipped)
+            # The cache is shared, so it gets the list as generated, known words included;
+            # a top-up holds only the remainder and would shadow the full cached list
+            if use_cache and generated and not cached_words:
+                generation_cache.store(context, language_from, language_to, level, generated)
+            
+            logger.debug("Generated %d words for context %r", len(words), context)
             return words
             
         except Exception as e:
             logger.error(f"Error generating word list: {e}")
             return []
     
-    def _create_dutch_prompt(self, context: str, count: int) -> str:
+    def _fallback_word_list(
+        self,
+        context: str,
+        language_from: str,
+        language_to: str,
+        level: str,
+        count: int,
+        error: Exception,
+        known: Optional[Container[str]] = None
+    ) -> List[Dict[str, str]]:
+        """Serve a loosely matching pack or cached list while OpenAI is unavailable"""
+        from services.pack_service import pack_service
+        from services.generation_cache import generation_cache
+        
+        words = (
+            pack_service.find_pack_words(context, language_from, language_to, level, count, self.FALLBACK_SIMILARITY)
+            or generation_cache.find(context, language_from, language_to, level, count, self.FALLBACK_SIMILARITY)
+            or []
+        )
+        if known:
+            words = [word for word in words if word["word"] not in known]
+        if words:
+            logger.warning(f"OpenAI unavailable ({error!r}), serving fallback list for '{context}'")
+            return words
+        raise error
+    
+    async def generate_examples(
+        self,
+        language_from: str,
+        language_to: str,
+        words: List[str]
+    ) -> Dict[str, Tuple[str, str]]:
+        """Example sentence and its translation for each word, keyed by casefolded word.
+        
+        Words the model skipped or answered unusably are missing from the result.
+        Raises on OpenAI errors so the caller can retry the batch later.
+        """
+        prompt = self._create_examples_prompt(language_from, language_to, words)
+        script = "cyrillic" if "ru" in (language_from, language_to) else "latin"
+        max_tokens = min(self.TOKENS_OVERHEAD + len(words) * self.TOKENS_PER_EXAMPLE[script], self.MAX_COMPLETION_TOKENS)
+        response = await self._call_openai(prompt, max_tokens, f"{language_from}-{language_to}")
+        
+        examples = {}
+        for item in self._iter_json_items(response):
+            if not isinstance(item, list) or len(item) < 3:
+                continue
+            word, example, example_translation = (str(value or "").strip() for value in item[:3])
+            if word and example:
+                examples[word.casefold()] = (example, example_translation)
+        logger.debug("Got examples for %d of %d words", len(examples), len(words))
+        return examples
+    
+    def _create_examples_prompt(self, language_from: str, language_to: str, words: List[str]) -> str:
+        """Prompt for example sentences; words are in the learned language (``language_to``)"""
+        import json
+        learned = self.LANGUAGE_NAMES[language_to]
+        known = self.LANGUAGE_NAMES[language_from]
+        return f"""For each {learned} word give a short, simple example sentence in {learned} and its {known} translation. Words: {json.dumps(words, ensure_ascii=False)}. Return only a JSON array of arrays:
+[["{learned} word", "{learned} example", "{known} example"]]"""
+    
+    def _token_budget(self, count: int, language_from: str, language_to: str) -> int:
+        """max_tokens sized to the requested count, capped at the model's completion limit"""
+        script = "cyrillic" if "ru" in (language_from, language_to) else "latin"
+        return min(self.TOKENS_OVERHEAD + count * self.TOKENS_PER_WORD[script], self.MAX_COMPLETION_TOKENS)
+    
+    def _build_prompt(self, context: str, language_from: str, language_to: str, count: int, level: str) -> str:
+        """Create prompt based on language pair"""
+        if language_from == "en" and language_to == "nl":
+            return self._create_dutch_prompt(context, count, level)
+        elif language_from == "en" and language_to == "ru":
+            return self._create_russian_prompt(context, count, level)
+        elif language_from == "nl" and language_to == "en":
+            return self._create_english_from_dutch_prompt(context, count, level)
+        elif language_from == "ru" and language_to == "en":
+            return self._create_english_from_russian_prompt(context, count, level)
+        raise ValueError(f"Unsupported language pair: {language_from} -> {language_to}")
+    
+    def _create_dutch_prompt(self, context: str, count: int, level: str = "A1-A2") -> str:
         """Create prompt for English to Dutch translation"""
-        return f"""Generate {count} Dutch words with English translations for context: {context}. Level A1-A2. Return only JSON array:
-[{{"word": "Dutch word", "translation": "English translation", "example_sentence_L1": "Dutch example", "example_sentence_L2": "English example"}}]"""
+        return f"""Generate {count} Dutch words with English translations for context: {context}. Level {level}. Return only a JSON array of arrays:
+[["Dutch word", "English translation"]]"""
 
-    def _create_russian_prompt(self, context: str, count: int) -> str:
+    def _create_russian_prompt(self, context: str, count: int, level: str = "A1-A2") -> str:
         """Create prompt for English to Russian translation"""
-        return f"""Generate {count} Russian words with English translations for context: {context}. Level A1-A2. Return only JSON array:
-[{{"word": "Russian word", "translation": "English translation", "example_sentence_L1": "Russian example", "example_sentence_L2": "English example"}}]"""
+        return f"""Generate {count} Russian words with English translations for context: {context}. Level {level}. Return only a JSON array of arrays:
+[["Russian word", "English translation"]]"""
 
-    def _create_english_from_dutch_prompt(self, context: str, count: int) -> str:
+    def _create_english_from_dutch_prompt(self, context: str, count: int, level: str = "A1-A2") -> str:
         """Create prompt for Dutch to English translation"""
-        return f"""Generate {count} English words with Dutch translations for context: {context}. Level A1-A2. Return only JSON array:
-[{{"word": "English word", "translation": "Dutch translation", "example_sentence_L1": "English example", "example_sentence_L2": "Dutch example"}}]"""
+        return f"""Generate {count} English words with Dutch translations for context: {context}. Level {level}. Return only a JSON array of arrays:
+[["English word", "Dutch translation"]]"""
 
-    def _create_english_from_russian_prompt(self, context: str, count: int) -> str:
+    def _create_english_from_russian_prompt(self, context: str, count: int, level: str = "A1-A2") -> str:
         """Create prompt for Russian to English translation"""
-        return f"""Generate {count} English words with Russian translations for context: {context}. Level A1-A2. Return only JSON array:
-[{{"word": "English word", "translation": "Russian translation", "example_sentence_L1": "English example", "example_sentence_L2": "Russian example"}}]"""
+        return f"""Generate {count} English words with Russian translations for context: {context}. Level {level}. Return only a JSON array of arrays:
+[["English word", "Russian translation"]]"""
 
-    async def _call_openai(self, prompt: str) -> str:
-        """Call OpenAI API"""
-        response = self.client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": "You are a helpful language learning assistant. Always respond with valid JSON only. Do not include any explanations or markdown formatting."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.7,
-            max_tokens=2000
-        )
+    async def _call_openai(self, prompt: str, max_tokens: int = 2000, pair: str = "unknown") -> str:
+        """Call OpenAI API with retries, hedging, a deadline and the circuit breaker"""
+        if not self.breaker.allow():
+            OPENAI_FAILURES.labels(pair, "CircuitOpenError").inc()
+            raise CircuitOpenError("OpenAI circuit is open")
+        
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.REQUEST_DEADLINE
+        error = None
+        for attempt in range(self.MAX_RETRIES + 1):
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                content = await asyncio.wait_for(self._hedged_completion(prompt, max_tokens, pair), remaining)
+                self.breaker.record_success()
+                return content
+            except self.transient_errors as e:
+                error = e
+                logger.warning(f"OpenAI attempt {attempt + 1} failed: {e!r}")
+            except Exception as e:
+                # Not an upstream health problem (bad request, auth): don't retry or trip the breaker
+                self.breaker.record_success()
+                OPENAI_FAILURES.labels(pair, type(e).__name__).inc()
+                raise
+            
+            # Full jitter: a random delay up to the exponential backoff
+            delay = random.uniform(0, min(self.RETRY_BACKOFF_CAP, self.RETRY_BACKOFF_BASE * 2 ** attempt))
+            if attempt == self.MAX_RETRIES or loop.time() + delay >= deadline:
+                break
+            await asyncio.sleep(delay)
+        
+        self.breaker.record_failure()
+        OPENAI_FAILURES.labels(pair, type(error).__name__ if error else "DeadlineExceeded").inc()
+        raise error or asyncio.TimeoutError("OpenAI request deadline exceeded")
+    
+    async def _hedged_completion(self, prompt: str, max_tokens: int, pair: str) -> str:
+        """Send the request and, if it outlives the recent p95 latency, a second identical one.
+        
+        The first successful response wins and the other request is cancelled.
+        """
+        hedge_delay = self.latency.percentile(95) if self.HEDGE_ENABLED else None
+        tasks = {asyncio.ensure_future(self._completion(prompt, max_tokens, pair))}
+        try:
+            if hedge_delay is not None:
+                done, _ = await asyncio.wait(tasks, timeout=hedge_delay)
+                if not done:
+                    logger.info("OpenAI request exceeded p95 (%.2fs), sending hedge request", hedge_delay)
+                    tasks.add(asyncio.ensure_future(self._completion(prompt, max_tokens, pair)))
+            
+            error = None
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+    
+    async def _completion(self, prompt: str, max_tokens: int, pair: str) -> str:
+        """Single chat completion request"""
+        started = time.monotonic()
+        with span("openai", pair):
+            response = await self.client.chat.completions.create(
+                model="gpt-3.5-turbo",
+                messages=[
+                    {"role": "system", "content": "You are a helpful language learning assistant. Always respond with valid JSON only. Do not include any explanations or markdown formatting."},
+                    {"role": "user", "content": prompt}
+                ],
+                temperature=0.7,
+                max_tokens=max_tokens
+            )
+        elapsed = time.monotonic() - started
+        self.latency.record(elapsed)
+        observe_openai(pair, elapsed, response.usage)
+        analytics_service.record_openai(pair, response.usage)
         return response.choices[0].message.content
-
+    
     def _parse_word_list(self, response: str) -> List[Dict[str, str]]:
-        """Parse OpenAI response into word list"""
-        import json
-        import re
+        """Parse OpenAI response into word list.
         
+        Items are decoded one at a time, so a completion cut off mid-array
+        still yields every complete item before the cut. Both the compact
+        array schema and the older object schema are accepted.
+        """
         try:
-            # Log the raw response for debugging
-            logger.info(f"Raw OpenAI response length: {len(response)}")
-            logger.info(f"Raw OpenAI response preview: {response[:200]}...")
-            
-            # Clean up response and parse JSON
-            cleaned_response = response.strip()
-            
-            # Remove markdown code blocks
-            if cleaned_response.startswith("```json"):
-                cleaned_response = cleaned_response[7:]
-            if cleaned_response.endswith("```"):
-                cleaned_response = cleaned_response[:-3]
-            
-            # Remove any leading/trailing whitespace
-            cleaned_response = cleaned_response.strip()
-            
-            # Try to find JSON array in the response
-            json_match = re.search(r'\[.*\]', cleaned_response, re.DOTALL)
-            if json_match:
-                cleaned_response = json_match.group(0)
+            # Arguments are formatted lazily, only if DEBUG is enabled
+            logger.debug("Raw OpenAI response (%d chars): %.200s", len(response), response)
             
-            logger.info(f"Cleaned response preview: {cleaned_response[:200]}...")
+            words = []
+            for item in self._iter_json_items(response):
+                word = self._normalize_word_item(item)
+                if word is not None:
+                    words.append(word)
             
-            # Parse JSON
-            words = json.loads(cleaned_response)
-            
-            # Validate structure
-            if not isinstance(words, list):
-                raise ValueError("Response is not a list")
-            
-            for word in words:
-                if not all(key in word for key in ["word", "translation", "example_sentence_L1", "example_sentence_L2"]):
-                    raise ValueError("Invalid word structure")
-            
-            logger.info(f"Successfully parsed {len(words)} words")
+            logger.debug("Successfully parsed %d words", len(words))
             return words
             
-        except json.JSONDecodeError as e:
-            logger.error(f"Failed to parse JSON response: {e}")
-            logger.error(f"Response that failed to parse: {response}")
-            return []
-        except Exception as e:
-            logger.error(f"Unexpected error parsing response: {e}")
-            return []
         except Exception as e:
-            logger.error(f"Error parsing word list: {e}")
+            logger.error("Unexpected error parsing response (%d chars): %s", len(response), e, extra={"preview": response[:200]})
+            logger.debug("Response that failed to parse: %s", response)
             return []
+    
+    @staticmethod
+    def _iter_json_items(response: str) -> Iterator:
+        """Items of the first JSON array in ``response``, stopping quietly at a truncation"""
+        import json
+        
+        start = response.find("[")
+        if start == -1:
+            raise ValueError("No JSON array in response")
+        
+        decoder = json.JSONDecoder()
+        position = start + 1
+        count = 0
+        while True:
+            # Skip separators between items
+            while position < len(response) and response[position] in " \t\r\n,":
+                position += 1
+            if position >= len(response) or response[position] == "]":
+                return
+            try:
+                item, position = decoder.raw_decode(response, position)
+            except json.JSONDecodeError:
+                logger.warning(f"Response truncated after {count} complete items")
+                return
+            count += 1
+            yield item
+    
+    def _normalize_word_item(self, item) -> Optional[Dict[str, str]]:
+        """Map one decoded item to the word dict format, or None if it is unusable"""
+        if isinstance(item, list):
+            item = dict(zip(self.WORD_FIELDS, item))
+        if not isinstance(item, dict):
+            return None
+        
+        word = {field: str(item.get(field) or "").strip() for field in self.WORD_FIELDS}
+        if not word["word"] or not word["translation"]:
+            return None
+        return word
 
 # Global instance
 ai_service = AIService()
@@ -0,0 +1,182 @@
+from collections import Counter, defaultdict
+from datetime import date, datetime, timedelta
+from typing import Dict, Optional
+import logging
+import os
+import threading
+from sqlalchemy import func, text
+from database.models import ActiveUser, SessionLocal, UsageDaily, engine
+
+logger = logging.getLogger(__name__)
+
+class AnalyticsService:
+    """Usage figures for /admin/analytics, kept in small daily aggregates.
+    
+    Services record events in memory (active users, reviews, generations,
+    OpenAI tokens and spend); every FLUSH_SECONDS a background task of each
+    process (main.analytics_flush_loop) adds its counts to usage_daily with
+    upserts and inserts the users it saw into active_users. A rollup job
+    counts daily active users into usage_daily and prunes active_users.
+    Reports read only these two tables, never users, words or reviews.
+    """
+    
+    FLUSH_SECONDS = float(os.getenv("ANALYTICS_FLUSH_SECONDS", "60"))
+    # active_users rows are kept this many days, so late flushes of other processes still count
+    ACTIVE_USERS_DAYS = 2
+    # USD per 1000 tokens of the completion model
+    PROMPT_PRICE = float(os.getenv("OPENAI_PROMPT_PRICE_PER_1K", "0.0005"))
+    COMPLETION_PRICE = float(os.getenv("OPENAI_COMPLETION_PRICE_PER_1K", "0.0015"))
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Counter = Counter()
+        self._active: set = set()
+        # Users already recorded today by this process
+        self._seen_day: Optional[date] = None
+        self._seen: set = set()
+    
+    def _add(self, metric: str, value: int, dimension: str = ""):
+        with self._lock:
+            self._counters[(datetime.utcnow().date(), metric, dimension)] += value
+    
+    def record_active(self, user_id: int):
+        today = datetime.utcnow().date()
+        with self._lock:
+            if self._seen_day != today:
+                self._seen_day, self._seen = today, set()
+            if user_id in self._seen:
+                return
+            self._seen.add(user_id)
+            self._active.add((today, user_id))
+    
+    def record_reviews(self, count: int):
+        if count:
+            self._add("reviews", count)
+    
+    def record_generation(self, pair: str, words: int):
+        self._add("generations", 1, pair)
+        self._add("generated_words", words, pair)
+    
+    def record_openai(self, pair: str, usage: Optional[object]):
+        if usage is None:
+            return
+        prompt_tokens, completion_tokens = usage.prompt_tokens or 0, usage.completion_tokens or 0
+        # Spend is kept in millionths of a dollar so the counters stay integers
+        cost = (prompt_tokens * self.PROMPT_PRICE + completion_tokens * self.COMPLETION_PRICE) / 1000
+        self._add("openai_prompt_tokens", prompt_tokens, pair)
+        self._add("openai_completion_tokens", completion_tokens, pair)
+        self._add("openai_cost_micros", round(cost * 1_000_000), pair)
+    
+    def flush(self):
+        """Write the counts recorded since the last flush"""
+        with self._lock:
+            counters, active = self._counters, self._active
+            self._counters, self._active = Counter(), set()
+        if not counters and not active:
+            return
+        
+        try:
+            with engine.begin() as conn:
+                if counters:
+                    conn.execute(text(
+                        "INSERT INTO usage_daily (day, metric, dimension, value) "
+                        "VALUES (:day, :metric, :dimension, :value) "
+                        "ON CONFLICT (day, metric, dimension) DO UPDATE SET value = usage_daily.value + excluded.value"
+                    ), [
+                        {"day": day, "metric": metric, "dimension": dimension, "value": value}
+                        for (day, metric, dimension), value in counters.items()
+                    ])
+                if active:
+                    conn.execute(text(
+                        "INSERT INTO active_users (day, user_id) VALUES (:day, :user_id) ON CONFLICT DO NOTHING"
+                    ), [{"day": day, "user_id": user_id} for day, user_id in active])
+        except Exception as e:
+            logger.error(f"Error flushing analytics: {e}")
+            # Kept for the next flush
+            with self._lock:
+                self._counters.update(counters)
+                self._active |= active
+    
+    def rollup(self, now: Optional[datetime] = None):
+        """Count daily active users of finished days into usage_daily and prune active_users"""
+        today = (now or datetime.utcnow()).date()
+        since = today - timedelta(days=self.ACTIVE_USERS_DAYS)
+        try:
+            with engine.begin() as conn:
+                conn.execute(text(
+                    "INSERT INTO usage_daily (day, metric, dimension, value) "
+                    "SELECT day, 'dau', '', count(*) FROM active_users WHERE day < :today GROUP BY day "
+                    "ON CONFLICT (day, metric, dimension) DO UPDATE SET value = excluded.value"
+                ), {"today": today})
+                conn.execute(text("DELETE FROM active_users WHERE day < :since"), {"since": since})
+        except Exception as e:
+            logger.error(f"Error rolling up analytics: {e}")
+    
+    def report(self, days: int = 30) -> Dict:
+        """Per-day figures and totals for the last ``days`` days, today included"""
+        self.flush()
+        today = datetime.utcnow().date()
+        start = today - timedelta(days=days - 1)
+        
+        db = SessionLocal()
+        try:
+            rows = db.query(UsageDaily).filter(UsageDaily.day >= start).all()
+            # Days still in active_users are counted live; the rollup only covers finished days
+            live_dau = dict(db.query(ActiveUser.day, func.count()).filter(
+                ActiveUser.day >= max(start, today - timedelta(days=self.ACTIVE_USERS_DAYS))
+            ).group_by(ActiveUser.day).all())
+        finally:
+            db.close()
+        
+        by_day = defaultdict(lambda: defaultdict(dict))
+        for row in rows:
+            by_day[row.day][row.metric][row.dimension] = row.value
+        
+        report_days = []
+        totals = defaultdict(lambda: defaultdict(int))
+        for offset in range(days):
+            day = start + timedelta(days=offset)
+            metrics = by_day.get(day, {})
+            dau = live_dau.get(day, metrics.get("dau", {}).get("", 0))
+            entry = {
+                "day": day.isoformat(),
+                "dau": dau,
+                "reviews": metrics.get("reviews", {}).get("", 0),
+                "generations": dict(metrics.get("generations", {})),
+                "generated_words": dict(metrics.get("generated_words", {})),
+                "openai_tokens": {
+                    pair: {
+                        "prompt": metrics.get("openai_prompt_tokens", {}).get(pair, 0),
+                        "completion": metrics.get("openai_completion_tokens", {}).get(pair, 0)
+                    }
+                    for pair in set(metrics.get("openai_prompt_tokens", {})) | set(metrics.get("openai_completion_tokens", {}))
+                },
+                "openai_cost_usd": {
+                    pair: round(micros / 1_000_000, 4) for pair, micros in metrics.get("openai_cost_micros", {}).items()
+                }
+            }
+            report_days.append(entry)
+            
+            totals["dau"][""] += dau
+            totals["reviews"][""] += entry["reviews"]
+            for metric in ("generations", "generated_words", "openai_cost_micros"):
+                for pair, value in metrics.get(metric, {}).items():
+                    totals[metric][pair] += value
+        
+        cost = {pair: round(micros / 1_000_000, 4) for pair, micros in totals["openai_cost_micros"].items()}
+        return {
+            "from": start.isoformat(),
+            "to": today.isoformat(),
+            "days": report_days,
+            "totals": {
+                "average_dau": round(totals["dau"][""] / days, 1),
+                "reviews": totals["reviews"][""],
+                "generations": dict(totals["generations"]),
+                "generated_words": dict(totals["generated_words"]),
+                "openai_cost_usd": cost,
+                "openai_cost_usd_total": round(sum(cost.values()), 4)
+            }
+        }
+
+# Global instance
+analytics_service = AnalyticsService()
@@ -0,0 +1,103 @@
+from collections import Counter
+from math import ceil
+from typing import Dict, FrozenSet, Hashable, List, Optional, Tuple
+import re
+
+def normalize_context(context: str) -> str:
+    """Matching key for a context: casefolded words, without counts or punctuation"""
+    words = re.findall(r"[^\W\d_]+", context.casefold())
+    return " ".join(words)
+
+class ContextIndex:
+    """Character-trigram similarity index over normalized contexts.
+    
+    Items are stored as sets of trigram ids, with an inverted index from
+    trigram to items bucketed by item size. Jaccard similarity ``t`` between
+    a query of ``q`` trigrams and an item of ``x`` trigrams needs an overlap
+    of at least ``t * (q + x) / (1 + t)``, so for each compatible size only
+    the postings of the query's rarest ``q - overlap + 1`` trigrams are
+    scanned (any match must share one of them) and the candidates are then
+    verified exactly. Sizes closest to the query are tried first and the
+    threshold is raised to the best similarity found so far, shrinking the
+    remaining prefixes. Frequent trigrams and items of incompatible size are
+    never touched, which keeps lookups under a millisecond with hundreds of
+    thousands of items.
+    """
+    
+    # Trigrams scanned beyond the minimal prefix, see lookup
+    EXTRA_PREFIX = 3
+    
+    def __init__(self):
+        self._gram_ids: Dict[str, int] = {}
+        self._gram_counts: List[int] = []
+        self._postings: List[Dict[int, List[Hashable]]] = []
+        self._items: Dict[Hashable, FrozenSet[int]] = {}
+        self._exact: Dict[str, Hashable] = {}
+    
+    def __len__(self) -> int:
+        return len(self._items)
+    
+    @staticmethod
+    def _trigrams(key: str) -> set:
+        padded = f"  {key} "
+        return {padded[i:i + 3] for i in range(len(padded) - 2)}
+    
+    def _encode(self, key: str, create: bool) -> FrozenSet[int]:
+        gram_ids = set()
+        for gram in self._trigrams(key):
+            gram_id = self._gram_ids.get(gram)
+            if gram_id is None:
+                if not create:
+                    continue
+                gram_id = self._gram_ids[gram] = len(self._postings)
+                self._postings.append({})
+                self._gram_counts.append(0)
+            gram_ids.add(gram_id)
+        return frozenset(gram_ids)
+    
+    def add(self, item_id: Hashable, key: str):
+        """Index ``item_id`` under a normalized context key"""
+        if item_id in self._items or not key:
+            return
+        grams = self._encode(key, create=True)
+        self._items[item_id] = grams
+        self._exact.setdefault(key, item_id)
+        for gram_id in grams:
+            self._postings[gram_id].setdefault(len(grams), []).append(item_id)
+            self._gram_counts[gram_id] += 1
+    
+    def lookup(self, key: str, threshold: float) -> Optional[Tuple[Hashable, float]]:
+        """Most similar item with Jaccard similarity >= ``threshold``, or None"""
+        if not key or threshold <= 0:
+            return None
+        if key in self._exact:
+            return (self._exact[key], 1.0)
+        query_size = len(self._trigrams(key))
+        # Trigrams never seen can't match anything but still count towards the union
+        grams = self._encode(key, create=False)
+        by_rarity = sorted(grams, key=lambda gram_id: self._gram_counts[gram_id])
+        
+        best = None
+        sizes = range(ceil(threshold * query_size), int(query_size / threshold) + 1)
+        for size in sorted(sizes, key=lambda size: abs(size - query_size)):
+            bound = best[1] if best is not None else threshold
+            if not bound * query_size <= size <= query_size / bound:
+                continue
+            min_overlap = ceil(bound * (query_size + size) / (1 + bound) - 1e-9)
+            if min_overlap > min(len(grams), size):
+                continue
+            
+            # Scanning EXTRA_PREFIX more trigrams than strictly needed lets
+            # candidates be pruned by hit count before exact verification
+            prefix_length = min(len(grams), len(grams) - min_overlap + 1 + self.EXTRA_PREFIX)
+            min_hits = min_overlap - (len(grams) - prefix_length)
+            hits = Counter()
+            for gram_id in by_rarity[:prefix_length]:
+                hits.update(self._postings[gram_id].get(size, ()))
+            
+            for item_id in [item_id for item_id, count in hits.items() if count >= min_hits]:
+                overlap = len(grams & self._items[item_id])
+                similarity = overlap / (query_size + size - overlap)
+                if similarity >= bound and (best is None or similarity > best[1]):
+                    best = (item_id, similarity)
+        return best
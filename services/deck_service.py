@@ -0,0 +1,317 @@
+from datetime import datetime, timezone
+from typing import Iterator, List, Optional, Tuple
+import csv
+import logging
+import os
+import tempfile
+from sqlalchemy import case, func, select, text
+from database.models import engine, Word, LexiconEntry, replica_router
+from services.due_index import due_index
+
+logger = logging.getLogger(__name__)
+
+# Columns of the CSV export; the same header is accepted on import
+CSV_COLUMNS = (
+    "word", "translation", "example", "example_translation", "context",
+    "difficulty", "interval_days", "next_review", "created_at"
+)
+# Fields of Anki's plain-text note format; the context becomes the note's tag
+ANKI_COLUMNS = ("Front", "Back", "Example", "Example translation", "Tags")
+# Staging columns, in COPY order
+STAGING_COLUMNS = (
+    "line", "lemma", "word", "translation", "example", "example_translation",
+    "context", "difficulty", "interval_days", "next_review"
+)
+
+class DeckImportError(ValueError):
+    """The uploaded file was rejected; the message is meant for the user"""
+
+def _tag(context: Optional[str]) -> str:
+    return "_".join(context.split()) if context else ""
+
+class DeckService:
+    """Streaming export and bulk import of a user's collection.
+    
+    Export walks the user's words with a server-side cursor (``stream_results``),
+    writing each row to a file as it arrives, so memory stays flat however big
+    the collection is. Import validates the whole file first, writing
+    normalized rows to a temporary file, then bulk-loads them into a staging
+    table (COPY on PostgreSQL, batched executemany elsewhere) and creates
+    lexicon entries and cards with set-based INSERT ... SELECT statements.
+    Nothing is imported unless every row is valid.
+    """
+    
+    EXPORT_BATCH = 1000
+    IMPORT_BATCH = 1000
+    MAX_ERRORS = 10
+    
+    def __init__(self):
+        self.max_rows = int(os.getenv("IMPORT_MAX_ROWS", "20000"))
+        self.max_bytes = int(os.getenv("IMPORT_MAX_BYTES", str(10 * 1024 * 1024)))
+    
+    def iter_words(self, user_id: int) -> Iterator[Tuple]:
+        """A user's words with content and schedule, oldest first, streamed from the database"""
+        query = select(
+            LexiconEntry.word,
+            func.coalesce(Word.translation_override, LexiconEntry.translation).label("translation"),
+            func.coalesce(Word.example_override, LexiconEntry.example).label("example"),
+            case(
+                (Word.example_override.isnot(None), Word.example_translation_override),
+                else_=LexiconEntry.example_translation
+            ).label("example_translation"),
+            Word.context, Word.difficulty, Word.interval_days, Word.next_review, Word.created_at
+        ).join(LexiconEntry, Word.lexicon_id == LexiconEntry.id).where(
+            Word.user_id == user_id
+        ).order_by(Word.created_at, Word.id)
+        
+        read_engine = replica_router.engine_for(user_id)
+        conn = read_engine.connect()
+        try:
+            try:
+                result = conn.execution_options(stream_results=True, yield_per=self.EXPORT_BATCH).execute(query)
+            except Exception as e:
+                if read_engine is engine:
+                    raise
+                # The replica failed before any row was written; export from the primary
+                conn.close()
+                replica_router.replica_failed(e)
+                conn = engine.connect()
+                result = conn.execution_options(stream_results=True, yield_per=self.EXPORT_BATCH).execute(query)
+            yield from result
+        finally:
+            conn.close()
+    
+    def export_words(self, user_id: int, fmt: str, path: str) -> int:
+        """Write the user's words to ``path`` as ``csv`` or ``anki``; returns the number of words"""
+        count = 0
+        with open(path, "w", encoding="utf-8", newline="") as output:
+            if fmt == "anki":
+                columns = "\t".join(ANKI_COLUMNS)
+                output.write(f"#separator:tab\n#html:false\n#columns:{columns}\n#tags column:{len(ANKI_COLUMNS)}\n")
+                writer = csv.writer(output, delimiter="\t", lineterminator="\n")
+                for row in self.iter_words(user_id):
+                    writer.writerow((row.word, row.translation, row.example or "", row.example_translation or "", _tag(row.context)))
+                    count += 1
+            else:
+                writer = csv.writer(output)
+                writer.writerow(CSV_COLUMNS)
+                for row in self.iter_words(user_id):
+                    writer.writerow((
+                        row.word, row.translation, row.example or "", row.example_translation or "",
+                        row.context or "", row.difficulty, row.interval_days,
+                        row.next_review.isoformat(sep=" ") if row.next_review else "",
+                        row.created_at.isoformat(sep=" ") if row.created_at else ""
+                    ))
+                    count += 1
+        
+        logger.info(f"Exported {count} words for user {user_id} as {fmt}")
+        return count
+    
+    def _read_rows(self, path: str) -> Iterator[Tuple[int, dict]]:
+        """(line number, fields) of a CSV export or an Anki plain-text file"""
+        with open(path, encoding="utf-8-sig", newline="") as source:
+            first = source.readline()
+            delimiter = ","
+            columns = None
+            line_number = 1
+            # Anki files start with #key:value headers and have no header row
+            if first.startswith("#"):
+                delimiter = "\t"
+                headers = {}
+                while first.startswith("#"):
+                    key, _, value = first[1:].rstrip("\r\n").partition(":")
+                    headers[key.strip().lower()] = value
+                    first = source.readline()
+                    line_number += 1
+                separator = headers.get("separator", "tab").lower()
+                delimiter = {"tab": "\t", "comma": ",", "semicolon": ";", "space": " ", "pipe": "|"}.get(separator, separator[:1] or "\t")
+                columns = ["word", "translation", "example", "example_translation"]
+                tags_column = headers.get("tags column")
+                if tags_column and tags_column.strip().isdigit():
+                    columns += [None] * (int(tags_column) - len(columns))
+                    columns[int(tags_column) - 1] = "context"
+            
+            if columns is None:
+                columns = [name.strip().lower() for name in next(csv.reader([first]))]
+                missing = {"word", "translation"} - set(columns)
+                if missing:
+                    raise DeckImportError(f"В заголовке нет столбцов: {', '.join(sorted(missing))}")
+                first = source.readline()
+                line_number += 1
+            
+            def lines():
+                if first:
+                    yield first
+                yield from source
+            
+            reader = csv.reader(lines(), delimiter=delimiter)
+            for values in reader:
+                if not any(value.strip() for value in values):
+                    continue
+                fields = {name: value.strip() for name, value in zip(columns, values) if name}
+                yield line_number - 1 + reader.line_num, fields
+    
+    @staticmethod
+    def _validate(fields: dict) -> Tuple[Optional[tuple], Optional[str]]:
+        """Normalized staging values, or an error message"""
+        word, translation = fields.get("word", ""), fields.get("translation", "")
+        if not word or not translation:
+            return None, "нужны слово и перевод"
+        lemma = LexiconEntry.normalize_lemma(word)
+        if not lemma:
+            return None, "пустое слово"
+        if max(len(word), len(translation), len(fields.get("context", ""))) > 255:
+            return None, "слишком длинное значение (максимум 255 символов)"
+        if max(len(fields.get("example", "")), len(fields.get("example_translation", ""))) > 2000:
+            return None, "слишком длинный пример"
+        
+        try:
+            difficulty = int(fields.get("difficulty") or 1)
+            interval_days = int(fields.get("interval_days") or 1)
+            next_review = datetime.fromisoformat(fields["next_review"]) if fields.get("next_review") else None
+            if next_review is not None and next_review.tzinfo is not None:
+                next_review = next_review.astimezone(timezone.utc).replace(tzinfo=None)
+        except ValueError:
+            return None, "неверный формат расписания"
+        if difficulty < 0 or not 1 <= interval_days <= 36500:
+            return None, "неверные значения расписания"
+        
+        return (
+            lemma, word, translation, fields.get("example", ""), fields.get("example_translation", ""),
+            " ".join(fields.get("context", "").replace("_", " ").split()), difficulty, interval_days,
+            next_review.strftime("%Y-%m-%d %H:%M:%S.%f") if next_review else ""
+        ), None
+    
+    def validate_file(self, path: str, staged_path: str) -> int:
+        """Check every row of ``path``, writing normalized rows to ``staged_path``; returns the row count"""
+        if os.path.getsize(path) > self.max_bytes:
+            raise DeckImportError(f"Файл больше {self.max_bytes // (1024 * 1024)} МБ")
+        
+        errors: List[str] = []
+        count = 0
+        try:
+            with open(staged_path, "w", encoding="utf-8", newline="") as staged:
+                writer = csv.writer(staged)
+                for line_number, fields in self._read_rows(path):
+                    values, error = self._validate(fields)
+                    if error:
+                        errors.append(f"строка {line_number}: {error}")
+                        if len(errors) >= self.MAX_ERRORS:
+                            break
+                        continue
+                    count += 1
+                    if count > self.max_rows:
+                        raise DeckImportError(f"Слишком много слов (максимум {self.max_rows})")
+                    writer.writerow((line_number,) + values)
+        except UnicodeDecodeError:
+            raise DeckImportError("Файл должен быть в кодировке UTF-8")
+        except csv.Error as e:
+            raise DeckImportError(f"Не удалось прочитать файл: {e}")
+        
+        if errors:
+            raise DeckImportError("\n".join(errors))
+        if count == 0:
+            raise DeckImportError("В файле нет слов")
+        return count
+    
+    def _stage(self, conn, staged_path: str):
+        """Bulk-load normalized rows into the deck_import staging table"""
+        conn.exec_driver_sql("DROP TABLE IF EXISTS deck_import")
+        conn.exec_driver_sql(
+            "CREATE TEMPORARY TABLE deck_import ("
+            "line INTEGER, lemma VARCHAR(255), word VARCHAR(255), translation VARCHAR(255), "
+            "example TEXT, example_translation TEXT, context VARCHAR(255), "
+            "difficulty INTEGER, interval_days INTEGER, next_review TIMESTAMP)"
+        )
+        
+        if conn.dialect.name == "postgresql":
+            # Empty unquoted CSV fields load as NULL
+            with open(staged_path, encoding="utf-8", newline="") as staged:
+                cursor = conn.connection.dbapi_connection.cursor()
+                cursor.copy_expert(f"COPY deck_import ({', '.join(STAGING_COLUMNS)}) FROM STDIN WITH (FORMAT csv)", staged)
+        else:
+            insert = text(
+                f"INSERT INTO deck_import ({', '.join(STAGING_COLUMNS)}) "
+                f"VALUES ({', '.join(':' + column for column in STAGING_COLUMNS)})"
+            )
+            with open(staged_path, encoding="utf-8", newline="") as staged:
+                batch = []
+                for values in csv.reader(staged):
+                    batch.append({column: value or None for column, value in zip(STAGING_COLUMNS, values)})
+                    if len(batch) >= self.IMPORT_BATCH:
+                        conn.execute(insert, batch)
+                        batch = []
+                if batch:
+                    conn.execute(insert, batch)
+        conn.exec_driver_sql("CREATE INDEX ix_deck_import_lemma ON deck_import (lemma, line)")
+    
+    def import_words(self, user_id: int, language_from: str, language_to: str, staged_path: str) -> int:
+        """Load validated rows as new cards in one transaction; returns the number of cards added.
+        
+        Words already in the collection (same lexicon entry) and repeats within
+        the file are skipped. The file's translation and example are kept on
+        the card where they differ from the shared lexicon entry. Entries that
+        don't exist yet are created from the file's content but marked as
+        imported, so other users never see it: the next generated list with
+        the word replaces it, and the importers keep theirs on the card.
+        """
+        params = {
+            "user_id": user_id, "language_from": language_from, "language_to": language_to,
+            "now": datetime.utcnow(), "imported": True
+        }
+        with engine.begin() as conn:
+            self._stage(conn, staged_path)
+            conn.execute(text(
+                "INSERT INTO lexicon (language_from, language_to, lemma, word, translation, example, example_translation, imported, created_at) "
+                "SELECT :language_from, :language_to, s.lemma, s.word, s.translation, "
+                "NULLIF(s.example, ''), NULLIF(s.example_translation, ''), :imported, :now "
+                "FROM deck_import s WHERE s.line = (SELECT min(d.line) FROM deck_import d WHERE d.lemma = s.lemma) "
+                "ON CONFLICT (language_from, language_to, lemma) DO NOTHING"
+            ), params)
+            added = conn.execute(text(
+                "INSERT INTO words (user_id, lexicon_id, context, difficulty, next_review, interval_days, created_at, "
+                "translation_override, example_override, example_translation_override) "
+                "SELECT :user_id, l.id, NULLIF(s.context, ''), s.difficulty, coalesce(s.next_review, :now), s.interval_days, :now, "
+                "CASE WHEN l.imported OR s.translation <> l.translation THEN s.translation END, "
+                "CASE WHEN l.imported OR s.example <> coalesce(l.example, '') THEN NULLIF(s.example, '') END, "
+                "CASE WHEN l.imported OR s.example <> coalesce(l.example, '') THEN NULLIF(s.example_translation, '') END "
+                "FROM deck_import s JOIN lexicon l ON l.language_from = :language_from "
+                "AND l.language_to = :language_to AND l.lemma = s.lemma "
+                "WHERE s.line = (SELECT min(d.line) FROM deck_import d WHERE d.lemma = s.lemma) "
+                "AND NOT EXISTS (SELECT 1 FROM words w WHERE w.user_id = :user_id AND w.lexicon_id = l.id) "
+                # Ids in file order: the cards share created_at, and lists sort by (created_at, id)
+                "ORDER BY s.line"
+            ), params).rowcount
+            # Recount the touched contexts rather than tracking which rows were skipped
+            conn.execute(text(
+                "INSERT INTO context_counts (user_id, context, word_count) "
+                "SELECT :user_id, coalesce(w.context, ''), count(*) FROM words w "
+                "WHERE w.user_id = :user_id AND coalesce(w.context, '') IN (SELECT coalesce(context, '') FROM deck_import) "
+                "GROUP BY coalesce(w.context, '') "
+                "ON CONFLICT (user_id, context) DO UPDATE SET word_count = excluded.word_count"
+            ), params)
+            # Rebuilt with the imported words on the next generation
+            conn.execute(text(
+                "DELETE FROM known_word_filters WHERE user_id = :user_id "
+                "AND language_from = :language_from AND language_to = :language_to"
+            ), params)
+            conn.exec_driver_sql("DROP TABLE deck_import")
+        
+        replica_router.note_write(user_id)
+        if due_index is not None:
+            due_index.invalidate(user_id)
+        logger.info(f"Imported {added} words for user {user_id}")
+        return added
+    
+    def import_file(self, user_id: int, language_from: str, language_to: str, path: str) -> Tuple[int, int]:
+        """Validate and import an uploaded file; returns (valid rows, cards added)"""
+        handle, staged_path = tempfile.mkstemp(suffix=".csv")
+        os.close(handle)
+        try:
+            rows = self.validate_file(path, staged_path)
+            return rows, self.import_words(user_id, language_from, language_to, staged_path)
+        finally:
+            os.remove(staged_path)
+
+# Global instance
+deck_service = DeckService()
@@ -0,0 +1,229 @@
+from collections import OrderedDict
+from datetime import date, datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+import heapq
+import logging
+import os
+import threading
+import time
+from database.models import Word, SessionLocal
+
+logger = logging.getLogger(__name__)
+
+# Heap entries are due-queue priority keys: (day due, difficulty, next_review, word_id)
+DueKey = Tuple[date, int, datetime, int]
+
+def due_key(next_review: datetime, difficulty: int, word_id: int) -> DueKey:
+    """Priority key of a word, in the order of SRSService.get_due_words"""
+    return (next_review.date(), difficulty, next_review, word_id)
+
+class _UserHeap:
+    """Min-heap of due-queue keys for one user.
+
+    Rescheduled and deleted words are not removed from the heap; instead
+    ``schedule`` holds the authoritative key per word and heap entries that
+    disagree with it are skipped as stale. The heap is rebuilt when stale
+    entries start to dominate it.
+    """
+
+    def __init__(self, entries: Iterable[Tuple[int, datetime, int]]):
+        self.schedule: Dict[int, DueKey] = {}
+        self.heap: List[DueKey] = []
+        for word_id, next_review, difficulty in entries:
+            key = due_key(next_review, difficulty, word_id)
+            self.schedule[word_id] = key
+            self.heap.append(key)
+        heapq.heapify(self.heap)
+        self.last_used = time.monotonic()
+
+    def _is_live(self, entry: DueKey) -> bool:
+        return self.schedule.get(entry[3]) == entry
+
+    def put(self, word_id: int, next_review: datetime, difficulty: int):
+        key = due_key(next_review, difficulty, word_id)
+        if self.schedule.get(word_id) == key:
+            # Already there: a load that ran after the write's commit saw it
+            return
+        self.schedule[word_id] = key
+        heapq.heappush(self.heap, key)
+        self._maybe_compact()
+
+    def remove(self, word_id: int):
+        self.schedule.pop(word_id, None)
+        self._maybe_compact()
+
+    def _maybe_compact(self):
+        if len(self.heap) > 2 * len(self.schedule) + 64:
+            self.heap = list(self.schedule.values())
+            heapq.heapify(self.heap)
+
+    def due(self, now: datetime, limit: int, after: Optional[DueKey] = None) -> List[int]:
+        """Return up to ``limit`` due word ids in priority order.
+
+        Walks the heap best-first through a frontier of indices, so only the
+        days due so far (plus their boundary) are visited. Keys up to and
+        including ``after`` are skipped, matching the SQL keyset cursor.
+        """
+        result = []
+        today = now.date()
+        frontier = [(self.heap[0], 0)] if self.heap else []
+        while frontier and len(result) < limit:
+            entry, index = heapq.heappop(frontier)
+            if entry[0] > today:
+                break
+            # Later today: not due yet, but its children may be
+            if entry[2] <= now and self._is_live(entry) and (after is None or entry > after):
+                result.append(entry[3])
+            for child in (2 * index + 1, 2 * index + 2):
+                if child < len(self.heap):
+                    heapq.heappush(frontier, (self.heap[child], child))
+        return result
+
+    def due_count(self, now: datetime) -> int:
+        """Count due words; subtrees whose root falls due after today are pruned"""
+        count = 0
+        today = now.date()
+        stack = [0] if self.heap else []
+        while stack:
+            index = stack.pop()
+            entry = self.heap[index]
+            if entry[0] > today:
+                continue
+            if entry[2] <= now and self._is_live(entry):
+                count += 1
+            for child in (2 * index + 1, 2 * index + 2):
+                if child < len(self.heap):
+                    stack.append(child)
+        return count
+
+class DueIndex:
+    """In-process index of due cards per user.
+
+    Users are loaded lazily with a single (id, next_review, difficulty)
+    query and kept current by the review, insert and delete write paths. At
+    most ``max_users`` users are held; the least recently used ones are evicted,
+    as are users idle for longer than ``idle_seconds``.
+    """
+
+    def __init__(self, max_users: int = 10000, idle_seconds: int = 3600):
+        self.max_users = max_users
+        self.idle_seconds = idle_seconds
+        self._users: "OrderedDict[int, _UserHeap]" = OrderedDict()
+        # Loads in flight per user, and writes seen for those users while loading
+        self._loading: Dict[int, int] = {}
+        self._changes: Dict[int, int] = {}
+        self._lock = threading.Lock()
+
+    def _load(self, user_id: int) -> _UserHeap:
+        db = SessionLocal()
+        try:
+            rows = db.query(Word.id, Word.next_review, Word.difficulty).filter(Word.user_id == user_id).all()
+        finally:
+            db.close()
+        logger.debug(f"Loaded {len(rows)} words into due index for user {user_id}")
+        return _UserHeap((row.id, row.next_review, row.difficulty) for row in rows)
+
+    # Loads retried when writes keep landing during them; the last one serves the caller uncached
+    LOAD_ATTEMPTS = 3
+
+    def _get(self, user_id: int) -> _UserHeap:
+        for _ in range(self.LOAD_ATTEMPTS):
+            with self._lock:
+                user_heap = self._users.get(user_id)
+                if user_heap is not None:
+                    self._users.move_to_end(user_id)
+                    user_heap.last_used = time.monotonic()
+                    return user_heap
+                # Writes for a user that isn't loaded don't touch the index; count them
+                # while the load runs, since its snapshot may predate them
+                self._loading[user_id] = self._loading.get(user_id, 0) + 1
+                generation = self._changes.get(user_id, 0)
+
+            try:
+                user_heap = self._load(user_id)
+            finally:
+                with self._lock:
+                    changed = self._changes.get(user_id, 0) != generation
+                    self._loading[user_id] -= 1
+                    if not self._loading[user_id]:
+                        del self._loading[user_id]
+                        self._changes.pop(user_id, None)
+                    if not changed:
+                        # Another caller may have loaded the user meanwhile; keep theirs
+                        user_heap = self._users.setdefault(user_id, user_heap)
+                        self._users.move_to_end(user_id)
+                        self._evict()
+            if not changed:
+                return user_heap
+        return user_heap
+
+    def _changed(self, user_id: int):
+        """Record a write for a user being loaded; call with the lock held"""
+        if user_id in self._loading:
+            self._changes[user_id] = self._changes.get(user_id, 0) + 1
+
+    def _evict(self):
+        cutoff = time.monotonic() - self.idle_seconds
+        while self._users:
+            user_id, user_heap = next(iter(self._users.items()))
+            if len(self._users) <= self.max_users and user_heap.last_used >= cutoff:
+                break
+            del self._users[user_id]
+
+    def get_due_ids(
+        self,
+        user_id: int,
+        limit: int = 20,
+        after: Optional[Tuple[datetime, int, int]] = None,
+        now: Optional[datetime] = None
+    ) -> List[int]:
+        """Ids of the next ``limit`` due words after the ``after`` (next_review, difficulty, id) cursor"""
+        now = now or datetime.utcnow()
+        user_heap = self._get(user_id)
+        with self._lock:
+            return user_heap.due(now, limit, due_key(*after) if after is not None else None)
+
+    def get_due_count(self, user_id: int, now: Optional[datetime] = None) -> int:
+        """Number of words due now"""
+        now = now or datetime.utcnow()
+        user_heap = self._get(user_id)
+        with self._lock:
+            return user_heap.due_count(now)
+
+    def get_total_count(self, user_id: int) -> int:
+        """Number of words in the user's collection"""
+        user_heap = self._get(user_id)
+        with self._lock:
+            return len(user_heap.schedule)
+
+    def on_words_scheduled(self, user_id: int, words: Iterable[Tuple[int, datetime, int]]):
+        """Record inserted or rescheduled (id, next_review, difficulty) words;
+        no-op for users not loaded"""
+        with self._lock:
+            self._changed(user_id)
+            user_heap = self._users.get(user_id)
+            if user_heap is None:
+                return
+            for word_id, next_review, difficulty in words:
+                user_heap.put(word_id, next_review, difficulty)
+
+    def on_word_deleted(self, user_id: int, word_id: int):
+        """Drop a deleted word; no-op for users not loaded"""
+        with self._lock:
+            self._changed(user_id)
+            user_heap = self._users.get(user_id)
+            if user_heap is None:
+                return
+            user_heap.remove(word_id)
+
+    def invalidate(self, user_id: int):
+        """Forget a user so the next access reloads from the database"""
+        with self._lock:
+            self._changed(user_id)
+            self._users.pop(user_id, None)
+
+# Global instance; None unless enabled via DUE_INDEX_ENABLED
+due_index = DueIndex(
+    max_users=int(os.getenv("DUE_INDEX_MAX_USERS", "10000")),
+    idle_seconds=int(os.getenv("DUE_INDEX_IDLE_SECONDS", "3600"))
+) if os.getenv("DUE_INDEX_ENABLED", "false").lower() in ("1", "true", "yes") else None
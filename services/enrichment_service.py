@@ -0,0 +1,149 @@
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Iterable, List, Optional
+import asyncio
+import logging
+import os
+from sqlalchemy import update
+from database.models import LexiconEntry, SessionLocal
+
+logger = logging.getLogger(__name__)
+
+class EnrichmentService:
+    """Second generation phase: fills in example sentences in the background.
+    
+    Word lists are generated and stored with words and translations only, so
+    users get them without waiting for examples. Entries still missing an
+    example are queued here and sent to OpenAI in batches per language pair;
+    examples land in the shared lexicon, so every card of that word gets them.
+    A periodic sweep picks up entries whose enrichment was lost (restart,
+    OpenAI outage); entries OpenAI answered MAX_ATTEMPTS times without an
+    example for them are not asked for again.
+    """
+    
+    BATCH_SIZE = int(os.getenv("ENRICHMENT_BATCH_SIZE", "20"))
+    # Entries older than this without an example are no longer retried by the sweep
+    SWEEP_MAX_AGE_DAYS = 7
+    MAX_ATTEMPTS = 3
+    
+    def __init__(self):
+        self.db = SessionLocal()
+        self._pending: set = set()
+        self._in_flight: set = set()
+        self._worker: Optional[asyncio.Task] = None
+    
+    def schedule(self, entry_ids: Iterable[int]):
+        """Queue lexicon entries for enrichment; must be called on the event loop"""
+        new_ids = {entry_id for entry_id in entry_ids if entry_id is not None} - self._in_flight
+        if not new_ids:
+            return
+        self._pending |= new_ids
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+    
+    async def _run(self):
+        while self._pending:
+            batch = set(list(self._pending)[:self.BATCH_SIZE * 5])
+            self._pending -= batch
+            self._in_flight |= batch
+            try:
+                await self.enrich(batch)
+            except Exception as e:
+                logger.error(f"Error enriching examples: {e}")
+            finally:
+                self._in_flight -= batch
+    
+    async def enrich(self, entry_ids: Iterable[int]) -> int:
+        """Fetch and store examples for the given entries that still lack one; returns how many were filled"""
+        entries = self.db.query(LexiconEntry).filter(
+            LexiconEntry.id.in_(list(entry_ids)),
+            LexiconEntry.example.is_(None),
+            LexiconEntry.enrichment_attempts < self.MAX_ATTEMPTS
+        ).all()
+        by_pair = defaultdict(list)
+        for entry in entries:
+            by_pair[(entry.language_from, entry.language_to)].append(entry)
+        
+        from services.ai_service import ai_service
+        filled = 0
+        for (language_from, language_to), pair_entries in by_pair.items():
+            for start in range(0, len(pair_entries), self.BATCH_SIZE):
+                batch = pair_entries[start:start + self.BATCH_SIZE]
+                try:
+                    examples = await ai_service.generate_examples(language_from, language_to, [entry.word for entry in batch])
+                except Exception as e:
+                    # Left for the next sweep
+                    logger.warning(f"Example generation failed for {len(batch)} words: {e!r}")
+                    continue
+                filled += self._store(batch, examples)
+        
+        logger.debug("Filled examples for %d of %d lexicon entries", filled, len(entries))
+        return filled
+    
+    def _store(self, entries: List[LexiconEntry], examples: dict) -> int:
+        filled = 0
+        missed = []
+        try:
+            for entry in entries:
+                example = examples.get(entry.word.casefold())
+                if example is None:
+                    missed.append(entry.id)
+                    continue
+                # Conditional, not on the entry loaded before the OpenAI call:
+                # another worker's example stored meanwhile is kept
+                filled += self.db.execute(
+                    update(LexiconEntry).where(
+                        LexiconEntry.id == entry.id,
+                        LexiconEntry.example.is_(None)
+                    ).values(example=example[0], example_translation=example[1] or None),
+                    execution_options={"synchronize_session": False}
+                ).rowcount
+            if missed:
+                self.db.execute(
+                    update(LexiconEntry).where(
+                        LexiconEntry.id.in_(missed),
+                        LexiconEntry.example.is_(None)
+                    ).values(enrichment_attempts=LexiconEntry.enrichment_attempts + 1),
+                    execution_options={"synchronize_session": False}
+                )
+            self.db.commit()
+            return filled
+        except Exception as e:
+            self.db.rollback()
+            logger.error(f"Error storing examples: {e}")
+            return 0
+    
+    def get_example(self, entry_id: int) -> Optional[str]:
+        """Current example of an entry, read fresh; queues enrichment if there is none yet"""
+        try:
+            example = self.db.query(LexiconEntry.example).filter(LexiconEntry.id == entry_id).scalar()
+        except Exception as e:
+            self.db.rollback()
+            logger.error(f"Error reading example: {e}")
+            return None
+        if not example:
+            self.schedule([entry_id])
+        return example
+    
+    def missing_entry_ids(self, limit: int = 500) -> List[int]:
+        """Recent lexicon entries still without an example.
+        
+        Uses its own session so the sweep can run in an executor thread.
+        """
+        db = SessionLocal()
+        try:
+            since = datetime.utcnow() - timedelta(days=self.SWEEP_MAX_AGE_DAYS)
+            rows = db.query(LexiconEntry.id).filter(
+                LexiconEntry.example.is_(None),
+                LexiconEntry.enrichment_attempts < self.MAX_ATTEMPTS,
+                LexiconEntry.created_at >= since
+            ).order_by(LexiconEntry.id.desc()).limit(limit).all()
+            return [row.id for row in rows]
+        except Exception as e:
+            logger.error(f"Error finding entries without examples: {e}")
+            return []
+        finally:
+            db.close()
+
+# Global instance
+enrichment_service = EnrichmentService()
@@ -0,0 +1,110 @@
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+import logging
+import os
+import threading
+from database.models import GeneratedList, SessionLocal
+from services.context_index import ContextIndex, normalize_context
+
+logger = logging.getLogger(__name__)
+
+class GenerationCache:
+    """Reuse of previously generated word lists for similar contexts.
+    
+    Every OpenAI result is stored in ``generated_lists``. Per language pair
+    and level, a ContextIndex over the stored contexts is built lazily from
+    (id, context_key) rows only; the matching list itself is then read by
+    primary key.
+    """
+    
+    # Minimum context similarity to reuse a list
+    SIMILARITY = float(os.getenv("GENERATION_CACHE_SIMILARITY", "0.6"))
+    
+    def __init__(self):
+        self.db = SessionLocal()
+        self._indexes: Dict[Tuple[str, str, str], ContextIndex] = {}
+        self._lock = threading.Lock()
+    
+    def _get_index(self, scope: Tuple[str, str, str]) -> ContextIndex:
+        with self._lock:
+            index = self._indexes.get(scope)
+        if index is not None:
+            return index
+        
+        language_from, language_to, level = scope
+        index = ContextIndex()
+        rows = self.db.query(GeneratedList.id, GeneratedList.context_key).filter(
+            GeneratedList.language_from == language_from,
+            GeneratedList.language_to == language_to,
+            GeneratedList.level == level
+        ).order_by(GeneratedList.id.desc()).yield_per(10000)
+        # Newest first, so the freshest list wins among identical keys
+        keys_seen = set()
+        for row in rows:
+            if row.context_key not in keys_seen:
+                keys_seen.add(row.context_key)
+                index.add(row.id, row.context_key)
+        logger.info(f"Built generation cache index for {scope} with {len(index)} contexts")
+        
+        with self._lock:
+            return self._indexes.setdefault(scope, index)
+    
+    def find(
+        self,
+        context: str,
+        language_from: str,
+        language_to: str,
+        level: str,
+        count: int,
+        similarity: Optional[float] = None
+    ) -> Optional[List[Dict]]:
+        """Return ``count`` words from a list generated for a similar context, or None"""
+        try:
+            index = self._get_index((language_from, language_to, level))
+            match = index.lookup(normalize_context(context), similarity or self.SIMILARITY)
+            if match is None:
+                return None
+            
+            cached = self.db.get(GeneratedList, match[0])
+            if cached is None or len(cached.words) < count:
+                return None
+            
+            logger.debug("Reusing list generated for %r for %r (similarity %.2f)", cached.context, context, match[1])
+            return [dict(word) for word in cached.words[:count]]
+        
+        except Exception as e:
+            self.db.rollback()
+            logger.error(f"Error looking up generation cache: {e}")
+            return None
+    
+    def store(self, context: str, language_from: str, language_to: str, level: str, words: List[Dict]):
+        """Record a freshly generated list for later reuse"""
+        context_key = normalize_context(context)
+        if not words or not context_key:
+            return
+        
+        try:
+            cached = GeneratedList(
+                language_from=language_from,
+                language_to=language_to,
+                level=level,
+                context=context[:255],
+                context_key=context_key[:255],
+                words=words,
+                created_at=datetime.utcnow()
+            )
+            self.db.add(cached)
+            self.db.commit()
+            
+            scope = (language_from, language_to, level)
+            with self._lock:
+                index = self._indexes.get(scope)
+            if index is not None:
+                index.add(cached.id, context_key)
+        
+        except Exception as e:
+            self.db.rollback()
+            logger.error(f"Error storing generated list: {e}")
+
+# Global instance
+generation_cache = GenerationCache()
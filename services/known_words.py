@@ -0,0 +1,132 @@
+from typing import Iterable, Iterator, List, Optional
+import hashlib
+import logging
+from database.models import KnownWordFilter, LexiconEntry, SessionLocal, Word
+
+logger = logging.getLogger(__name__)
+
+class BloomFilter:
+    """Set membership in about 10 bits per item: no false negatives, ~1% false positives at capacity"""
+    
+    BITS_PER_ITEM = 10
+    HASHES = 7
+    
+    def __init__(self, bits: bytearray):
+        self.bits = bits
+        self.size = len(bits) * 8
+    
+    @classmethod
+    def for_capacity(cls, capacity: int) -> "BloomFilter":
+        return cls(bytearray((capacity * cls.BITS_PER_ITEM + 7) // 8))
+    
+    def _positions(self, key: str) -> Iterator[int]:
+        # Double hashing: k positions from two 64-bit halves of one digest
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "big")
+        step = int.from_bytes(digest[8:], "big") | 1
+        return ((first + i * step) % self.size for i in range(self.HASHES))
+    
+    def add(self, key: str):
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+    
+    def __contains__(self, key: str) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+class KnownWordSet:
+    """Words a user already has in a language pair; tests any spelling of a word by its lemma"""
+    
+    def __init__(self, bloom: BloomFilter, items: int):
+        self.bloom = bloom
+        self.items = items
+    
+    def __contains__(self, word: str) -> bool:
+        return LexiconEntry.normalize_lemma(word) in self.bloom
+    
+    def __len__(self) -> int:
+        return self.items
+
+class KnownWords:
+    """Per-user, per-language-pair Bloom filters of the lemmas in a collection.
+    
+    Generation checks candidates against them instead of scanning the user's
+    words. A filter is built from the collection on first use and kept in
+    known_word_filters; the insert paths add to it in their own transaction.
+    Bloom filters can't remove items, so deleting a word or importing a deck
+    drops the filter and it is rebuilt on next use, as is a filter that
+    outgrew its capacity (twice as large).
+    """
+    
+    MIN_CAPACITY = 256
+    
+    def __init__(self):
+        self.db = SessionLocal()
+    
+    def get(self, user_id: int, language_from: str, language_to: str) -> Optional[KnownWordSet]:
+        """The user's known words in a pair, or None if the filter can't be read"""
+        try:
+            # populate_existing: other sessions update the row
+            row = self.db.get(KnownWordFilter, (user_id, language_from, language_to), populate_existing=True)
+            if row is None:
+                row = self._build(user_id, language_from, language_to)
+            return KnownWordSet(BloomFilter(bytearray(row.bits)), row.items)
+        except Exception as e:
+            self.db.rollback()
+            logger.error(f"Error reading known words: {e}")
+            return None
+    
+    def _build(self, user_id: int, language_from: str, language_to: str) -> KnownWordFilter:
+        lemmas = self.db.query(LexiconEntry.lemma).join(Word, Word.lexicon_id == LexiconEntry.id).filter(
+            Word.user_id == user_id,
+            LexiconEntry.language_from == language_from,
+            LexiconEntry.language_to == language_to
+        ).distinct().all()
+        capacity = max(self.MIN_CAPACITY, 2 * len(lemmas))
+        bloom = BloomFilter.for_capacity(capacity)
+        for row in lemmas:
+            bloom.add(row.lemma)
+        
+        row = self.db.merge(KnownWordFilter(
+            user_id=user_id,
+            language_from=language_from,
+            language_to=language_to,
+            bits=bytes(bloom.bits),
+            capacity=capacity,
+            items=len(lemmas)
+        ))
+        self.db.commit()
+        logger.debug(
+            "Built known-word filter of %d words for user %s (%s-%s)", len(lemmas), user_id, language_from, language_to
+        )
+        return row
+    
+    @staticmethod
+    def add(db, user_id: int, language_from: str, language_to: str, lemmas: Iterable[str]):
+        """Add lemmas to the user's filter within the caller's transaction"""
+        lemmas: List[str] = list(lemmas)
+        row = db.get(
+            KnownWordFilter, (user_id, language_from, language_to), with_for_update=True, populate_existing=True
+        )
+        if row is None or not lemmas:
+            # Built from the collection on next use
+            return
+        if row.items + len(lemmas) > row.capacity:
+            db.delete(row)
+            return
+        bloom = BloomFilter(bytearray(row.bits))
+        for lemma in lemmas:
+            bloom.add(lemma)
+        row.bits = bytes(bloom.bits)
+        row.items = row.items + len(lemmas)
+    
+    @staticmethod
+    def invalidate(db, user_id: int, language_from: str, language_to: str):
+        """Drop the user's filter within the caller's transaction"""
+        db.query(KnownWordFilter).filter(
+            KnownWordFilter.user_id == user_id,
+            KnownWordFilter.language_from == language_from,
+            KnownWordFilter.language_to == language_to
+        ).delete(synchronize_session=False)
+
+# Global instance
+known_words = KnownWords()
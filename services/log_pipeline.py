@@ -0,0 +1,150 @@
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional
+import atexit
+import json
+import logging
+import queue
+import random
+import threading
+import time
+
+# Attributes every LogRecord has; anything else was passed via ``extra`` and is a structured field
+_RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+class StructuredFormatter(logging.Formatter):
+    """Text or JSON lines; fields passed via ``extra`` are appended as key=value or JSON keys"""
+    
+    def __init__(self, json_lines: bool = False):
+        super().__init__('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+        self.json_lines = json_lines
+    
+    def format(self, record: logging.LogRecord) -> str:
+        fields = {key: value for key, value in vars(record).items() if key not in _RECORD_ATTRS}
+        if self.json_lines:
+            entry = {
+                "time": self.formatTime(record),
+                "level": record.levelname,
+                "logger": record.name,
+                "message": record.getMessage(),
+                **fields
+            }
+            if record.exc_info:
+                entry["exception"] = self.formatException(record.exc_info)
+            elif record.exc_text:
+                entry["exception"] = record.exc_text
+            return json.dumps(entry, ensure_ascii=False, default=str)
+        
+        line = super().format(record)
+        if fields:
+            line += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+        return line
+
+_exception_formatter = logging.Formatter()
+
+class RateLimitFilter(logging.Filter):
+    """Per call site rate limiting plus per-logger sampling of low-severity records.
+    
+    Each logging call site (file and line, so f-string messages count as one)
+    may emit ``burst`` records per ``period`` seconds; the rest are dropped and
+    counted, and the next record let through notes how many were suppressed.
+    Records below WARNING from loggers listed in ``sampling`` are kept with
+    the given probability. Warnings and errors are never sampled.
+    """
+    
+    def __init__(self, burst: int = 20, period: float = 10.0, sampling: Optional[Dict[str, float]] = None):
+        super().__init__()
+        self.burst = burst
+        self.period = period
+        self.sampling = sampling or {}
+        self._windows: Dict[tuple, list] = {}
+        self._lock = threading.Lock()
+    
+    def _sample_rate(self, name: str) -> float:
+        while name:
+            if name in self.sampling:
+                return self.sampling[name]
+            name = name.rpartition(".")[0]
+        return 1.0
+    
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno < logging.WARNING and random.random() >= self._sample_rate(record.name):
+            return False
+        if self.burst <= 0:
+            return True
+        
+        key = (record.pathname, record.lineno)
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None or now - window[0] >= self.period:
+                suppressed = window[2] if window else 0
+                window = self._windows[key] = [now, 0, 0]
+                if suppressed:
+                    record.suppressed = suppressed
+            if window[1] >= self.burst:
+                window[2] += 1
+                return False
+            window[1] += 1
+        return True
+
+class DroppingQueueHandler(QueueHandler):
+    """Enqueues records, dropping them when the queue is full.
+    
+    Only the message and arguments are merged on the calling thread: the
+    arguments may be ORM objects, whose sessions must not be touched from
+    the listener thread and whose state must be logged as of the call.
+    Records rejected by the level or the filters are never merged; the
+    timestamp and line layout are formatted on the listener thread.
+    """
+    
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+    
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = _exception_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+    
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+def parse_sampling(value: str) -> Dict[str, float]:
+    """"services.ai_service=0.1,main=0.5" -> {"services.ai_service": 0.1, "main": 0.5}"""
+    sampling = {}
+    for part in filter(None, (part.strip() for part in value.split(","))):
+        name, _, rate = part.partition("=")
+        sampling[name.strip()] = float(rate)
+    return sampling
+
+def setup_logging(
+    level: str = "INFO",
+    json_lines: bool = False,
+    burst: int = 20,
+    period: float = 10.0,
+    sampling: Optional[Dict[str, float]] = None,
+    queue_size: int = 10000
+) -> QueueListener:
+    """Route all logging through a bounded queue drained by a background thread"""
+    log_queue = queue.Queue(maxsize=queue_size)
+    handler = DroppingQueueHandler(log_queue)
+    handler.addFilter(RateLimitFilter(burst, period, sampling))
+    
+    output = logging.StreamHandler()
+    output.setFormatter(StructuredFormatter(json_lines))
+    listener = QueueListener(log_queue, output, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    
+    root = logging.getLogger()
+    for existing in root.handlers[:]:
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level.upper())
+    return listener
@@ -0,0 +1,118 @@
+from typing import Optional
+import logging
+import time
+from prometheus_client import Counter, Gauge, Histogram
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from services import review_tokens
+
+logger = logging.getLogger(__name__)
+
+# Buckets from fast DB-only handlers up to generation waiting on OpenAI
+HANDLER_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+QUERY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5)
+
+HANDLER_LATENCY = Histogram(
+    "bot_handler_seconds", "Time to process one Telegram update",
+    ["kind", "name"], buckets=HANDLER_BUCKETS
+)
+WEBHOOK_ERRORS = Counter("bot_webhook_errors_total", "Webhook requests that failed", ["error"])
+
+DB_QUERIES = Counter("db_queries_total", "SQL statements executed", ["operation"])
+DB_QUERY_LATENCY = Histogram(
+    "db_query_seconds", "SQL statement execution time",
+    ["operation"], buckets=QUERY_BUCKETS
+)
+DB_POOL_WAIT = Histogram(
+    "db_pool_checkout_seconds", "Time waiting for a pooled connection",
+    buckets=QUERY_BUCKETS
+)
+DB_POOL_CHECKED_OUT = Gauge("db_pool_checked_out", "Connections currently checked out of the pool")
+
+OPENAI_LATENCY = Histogram(
+    "openai_request_seconds", "OpenAI chat completion latency",
+    ["pair"], buckets=HANDLER_BUCKETS
+)
+OPENAI_TOKENS = Counter("openai_tokens_total", "OpenAI tokens used", ["pair", "kind"])
+OPENAI_FAILURES = Counter("openai_failures_total", "OpenAI calls that failed after retries", ["pair", "error"])
+
+# Callback data prefixes; anything after them is an id or a cursor
+CALLBACK_NAMES = ("lang", "words_next", "words_prev", "learn_more", "batch")
+
+# Commands the bot handles; any other command a user types is labelled "unknown"
+KNOWN_COMMANDS = set()
+
+def register_commands(application):
+    """Label updates with the commands of ``application``'s CommandHandlers"""
+    from telegram.ext import CommandHandler
+    for handlers in application.handlers.values():
+        for handler in handlers:
+            if isinstance(handler, CommandHandler):
+                KNOWN_COMMANDS.update(handler.commands)
+
+def update_label(update) -> tuple:
+    """(kind, name) for an update with bounded cardinality: the command or callback type"""
+    if update.callback_query is not None:
+        data = update.callback_query.data or ""
+        if data.startswith(review_tokens.PREFIX):
+            # Signed review answer
+            return ("callback", "review")
+        for name in CALLBACK_NAMES:
+            if data.startswith(name):
+                return ("callback", name)
+        return ("callback", "other")
+    message = update.message
+    if message is not None and message.text:
+        if message.text.startswith("/"):
+            command = message.text.split()[0][1:].split("@")[0].lower()
+            return ("command", command if command in KNOWN_COMMANDS else "unknown")
+        return ("message", "text")
+    return ("other", "other")
+
+def _operation(statement: str) -> str:
+    words = statement.lstrip().split(None, 1)
+    operation = words[0].upper() if words else ""
+    return operation if operation in ("SELECT", "INSERT", "UPDATE", "DELETE") else "OTHER"
+
+def instrument_engine(engine: Engine):
+    """Count and time statements and pool checkouts of ``engine``"""
+    if getattr(engine, "_metrics_instrumented", False):
+        return
+    
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+    
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["query_started"].pop()
+        operation = _operation(statement)
+        DB_QUERIES.labels(operation).inc()
+        DB_QUERY_LATENCY.labels(operation).observe(time.perf_counter() - started)
+    
+    @event.listens_for(engine, "handle_error")
+    def handle_error(context):
+        if context.connection is not None and context.connection.info.get("query_started"):
+            context.connection.info["query_started"].pop()
+    
+    # The pool has no "before checkout" event, so time the checkout call itself
+    pool = engine.pool
+    connect = pool.connect
+    
+    def timed_connect():
+        started = time.perf_counter()
+        try:
+            return connect()
+        finally:
+            DB_POOL_WAIT.observe(time.perf_counter() - started)
+    
+    pool.connect = timed_connect
+    if hasattr(pool, "checkedout"):
+        DB_POOL_CHECKED_OUT.set_function(pool.checkedout)
+    engine._metrics_instrumented = True
+
+def observe_openai(pair: str, seconds: float, usage: Optional[object]):
+    OPENAI_LATENCY.labels(pair).observe(seconds)
+    if usage is not None:
+        OPENAI_TOKENS.labels(pair, "prompt").inc(usage.prompt_tokens or 0)
+        OPENAI_TOKENS.labels(pair, "completion").inc(usage.completion_tokens or 0)
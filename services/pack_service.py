@@ -0,0 +1,217 @@
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+import argparse
+import asyncio
+import logging
+import os
+import time
+from sqlalchemy import func
+from database.models import User, ContextCount, WordPack, LexiconEntry, SessionLocal
+from services.context_index import ContextIndex, normalize_context
+
+logger = logging.getLogger(__name__)
+
+class PackService:
+    """Curated word packs for the most popular contexts.
+    
+    Packs are built offline (``python -m services.pack_service``) and the
+    latest version of each is served from memory, so matching generation
+    requests skip OpenAI entirely. Contexts are matched by trigram
+    similarity, so rephrasings of a pack's topic are served from it too.
+    """
+    
+    # Words generated per pack; requests for at most this many can be served
+    PACK_SIZE = 100
+    # Words requested from OpenAI per call while building a pack
+    BUILD_BATCH = 20
+    # Seconds before the in-memory pack table is reloaded
+    CACHE_TTL = 300
+    # Minimum context similarity to serve a pack
+    SIMILARITY = float(os.getenv("PACK_SIMILARITY", "0.7"))
+    
+    def __init__(self):
+        self.db = SessionLocal()
+        self._packs: Dict[Tuple[str, str, str, str], List[Dict]] = {}
+        self._indexes: Dict[Tuple[str, str, str], ContextIndex] = {}
+        self._loaded_at = 0.0
+    
+    def _load_packs(self):
+        """Load the latest version of every pack into memory"""
+        latest = self.db.query(
+            WordPack.language_from,
+            WordPack.language_to,
+            WordPack.level,
+            WordPack.context_key,
+            func.max(WordPack.version).label("version")
+        ).group_by(
+            WordPack.language_from, WordPack.language_to, WordPack.level, WordPack.context_key
+        ).subquery()
+        
+        packs = self.db.query(WordPack).join(latest, (
+            (WordPack.language_from == latest.c.language_from)
+            & (WordPack.language_to == latest.c.language_to)
+            & (WordPack.level == latest.c.level)
+            & (WordPack.context_key == latest.c.context_key)
+            & (WordPack.version == latest.c.version)
+        )).all()
+        
+        self._packs = {
+            (pack.language_from, pack.language_to, pack.level, pack.context_key): pack.words for pack in packs
+        }
+        self._indexes = {}
+        for language_from, language_to, level, context_key in self._packs:
+            scope = (language_from, language_to, level)
+            self._indexes.setdefault(scope, ContextIndex()).add(context_key, context_key)
+        self._loaded_at = time.monotonic()
+        # Pack rows can be large; keep only the dict copies
+        self.db.expunge_all()
+        logger.info(f"Loaded {len(self._packs)} word packs")
+    
+    def find_pack_words(
+        self,
+        context: str,
+        language_from: str,
+        language_to: str,
+        level: str,
+        count: int,
+        similarity: Optional[float] = None
+    ) -> Optional[List[Dict]]:
+        """Return ``count`` words from a matching pack, or None if there is none"""
+        try:
+            if time.monotonic() - self._loaded_at > self.CACHE_TTL:
+                self._load_packs()
+            
+            index = self._indexes.get((language_from, language_to, level))
+            match = index.lookup(normalize_context(context), similarity or self.SIMILARITY) if index else None
+            if match is None:
+                return None
+            
+            words = self._packs[(language_from, language_to, level, match[0])]
+            if len(words) < count:
+                return None
+            
+            logger.debug("Serving %d words for %r from pack", count, context)
+            return [dict(word) for word in words[:count]]
+        
+        except Exception as e:
+            self.db.rollback()
+            logger.error(f"Error looking up word pack: {e}")
+            return None
+    
+    def get_popular_contexts(self, limit: int = 50, min_users: int = 3) -> List[Dict]:
+        """Most popular contexts per language pair, by number of users who generated them"""
+        rows = self.db.query(
+            ContextCount.context,
+            User.language_from,
+            User.language_to,
+            func.count(ContextCount.user_id).label("users")
+        ).join(User, User.telegram_id == ContextCount.user_id).filter(
+            ContextCount.context != "",
+            ContextCount.word_count > 0,
+            User.language_from.isnot(None),
+            User.language_to.isnot(None)
+        ).group_by(ContextCount.context, User.language_from, User.language_to).all()
+        
+        # Merge spelling variants that normalize to the same key
+        popular = defaultdict(lambda: {"users": 0, "context": None, "best": 0})
+        for row in rows:
+            key = normalize_context(row.context)
+            if not key:
+                continue
+            entry = popular[(row.language_from, row.language_to, key)]
+            entry["users"] += row.users
+            if row.users > entry["best"]:
+                entry["context"], entry["best"] = row.context, row.users
+        
+        ranked = sorted(popular.items(), key=lambda item: -item[1]["users"])
+        return [
+            {
+                "language_from": language_from,
+                "language_to": language_to,
+                "context_key": key,
+                "context": entry["context"],
+                "users": entry["users"]
+            }
+            for (language_from, language_to, key), entry in ranked
+            if entry["users"] >= min_users
+        ][:limit]
+    
+    async def build_pack(self, context: str, language_from: str, language_to: str, level: str) -> Optional[WordPack]:
+        """Generate a pack in batches, dropping duplicate lemmas, and store it as a new version"""
+        from services.ai_service import ai_service
+        
+        words, lemmas = [], set()
+        for _ in range(self.PACK_SIZE // self.BUILD_BATCH * 2):
+            batch = await ai_service.generate_word_list(
+                context, language_from, language_to, self.BUILD_BATCH, level=level, use_cache=False
+            )
+            for word in batch:
+                lemma = LexiconEntry.normalize_lemma(word["word"])
+                if lemma not in lemmas:
+                    lemmas.add(lemma)
+                    words.append(word)
+            if len(words) >= self.PACK_SIZE:
+                break
+        
+        if len(words) < self.PACK_SIZE:
+            logger.warning(f"Only generated {len(words)} words for pack '{context}', skipping")
+            return None
+        
+        context_key = normalize_context(context)
+        try:
+            current = self.db.query(func.max(WordPack.version)).filter(
+                WordPack.language_from == language_from,
+                WordPack.language_to == language_to,
+                WordPack.level == level,
+                WordPack.context_key == context_key
+            ).scalar()
+            
+            pack = WordPack(
+                language_from=language_from,
+                language_to=language_to,
+                level=level,
+                context_key=context_key,
+                context=context,
+                version=(current or 0) + 1,
+                words=words[:self.PACK_SIZE],
+                created_at=datetime.utcnow()
+            )
+            self.db.add(pack)
+            self.db.commit()
+            logger.info(f"Built pack '{context_key}' v{pack.version} for {language_from}->{language_to} {level}")
+            return pack
+        
+        except Exception as e:
+            self.db.rollback()
+            logger.error(f"Error storing word pack: {e}")
+            return None
+    
+    async def build_popular_packs(self, top: int = 50, levels: List[str] = None, min_users: int = 3) -> int:
+        """Build packs for the most popular contexts; returns the number built"""
+        built = 0
+        for popular in self.get_popular_contexts(limit=top, min_users=min_users):
+            for level in levels or ["A1-A2"]:
+                pack = await self.build_pack(
+                    popular["context"], popular["language_from"], popular["language_to"], level
+                )
+                if pack is not None:
+                    built += 1
+        return built
+
+# Global instance
+pack_service = PackService()
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    load_dotenv()
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+    
+    parser = argparse.ArgumentParser(description="Build word packs for the most popular contexts")
+    parser.add_argument("--top", type=int, default=50, help="number of contexts to build")
+    parser.add_argument("--levels", default="A1-A2", help="comma-separated levels, e.g. A1-A2,B1-B2")
+    parser.add_argument("--min-users", type=int, default=3, help="minimum users per context")
+    args = parser.parse_args()
+    
+    count = asyncio.run(pack_service.build_popular_packs(args.top, args.levels.split(","), args.min_users))
+    print(f"Built {count} packs")
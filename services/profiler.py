@@ -0,0 +1,69 @@
+from collections import Counter
+from typing import Optional
+import logging
+import os
+import sys
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+class SamplingProfiler:
+    """Wall-clock sampling profiler producing collapsed stacks.
+    
+    A background thread snapshots the stack of the target thread (the event
+    loop by default) every ``interval`` seconds via ``sys._current_frames``.
+    The result is in the collapsed format (``frame;frame;frame count`` per
+    line) read by flamegraph.pl, speedscope and inferno. Idle time shows up
+    as the event loop's selector wait.
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def _frame_name(frame) -> str:
+        code = frame.f_code
+        return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+    
+    def _stack(self, frame) -> str:
+        names = []
+        while frame is not None:
+            names.append(self._frame_name(frame))
+            frame = frame.f_back
+        return ";".join(reversed(names))
+    
+    def _sample(self, stacks: Counter, target: Optional[int], stop: threading.Event, interval: float):
+        own = threading.get_ident()
+        while not stop.is_set():
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id != own and (target is None or thread_id == target):
+                    stacks[self._stack(frame)] += 1
+            time.sleep(interval)
+    
+    def start(self, target: Optional[int], interval: float = 0.005):
+        """Start sampling ``target`` (a thread ident, or None for every thread).
+        
+        Returns a stop function that ends the session and returns the collapsed
+        profile, or None if another session is already running.
+        """
+        if not self._lock.acquire(blocking=False):
+            return None
+        
+        stacks = Counter()
+        stop = threading.Event()
+        sampler = threading.Thread(target=self._sample, args=(stacks, target, stop, interval), daemon=True)
+        sampler.start()
+        started = time.monotonic()
+        
+        def finish() -> str:
+            stop.set()
+            sampler.join()
+            self._lock.release()
+            logger.info(f"Profiled {sum(stacks.values())} samples over {time.monotonic() - started:.1f}s")
+            return "\n".join(f"{stack} {count}" for stack, count in stacks.most_common()) + "\n"
+        
+        return finish
+
+# Global instance
+profiler = SamplingProfiler()
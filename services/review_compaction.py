@@ -0,0 +1,112 @@
+from datetime import date, datetime, timedelta
+from typing import Dict, Optional
+import argparse
+import logging
+import os
+from sqlalchemy import text
+from database.models import engine
+from database.partitions import add_months, ensure_partitions, list_month_partitions, month_start
+
+logger = logging.getLogger(__name__)
+
+class ReviewCompactor:
+    """Keeps the raw review log small by compacting old months into review_daily.
+    
+    Raw reviews are kept for the current month plus REVIEWS_RAW_MONTHS full
+    months. Older reviews are summed per user, word and day into review_daily;
+    on PostgreSQL their monthly partitions are then detached and dropped in
+    the same transaction, elsewhere the rows are deleted. Daily aggregates are
+    kept for REVIEWS_AGGREGATE_DAYS days (0 keeps them forever).
+    """
+    
+    def __init__(self):
+        self.raw_months = int(os.getenv("REVIEWS_RAW_MONTHS", "3"))
+        self.aggregate_days = int(os.getenv("REVIEWS_AGGREGATE_DAYS", "0"))
+        self.partitions_ahead = int(os.getenv("REVIEW_PARTITIONS_AHEAD", "2"))
+    
+    def cutoff(self, now: Optional[datetime] = None) -> date:
+        """Reviews before this day are compacted"""
+        return add_months(month_start(now or datetime.utcnow()), -self.raw_months)
+    
+    @staticmethod
+    def _compact_rows(conn, source: str, cutoff: date) -> int:
+        """Add reviews of ``source`` before ``cutoff`` to review_daily"""
+        day = "date(reviewed_at)" if conn.dialect.name == "sqlite" else "CAST(reviewed_at AS DATE)"
+        # Reviews of deleted words lost their word_id; they still count towards the day as word 0
+        result = conn.execute(text(
+            f"INSERT INTO review_daily (user_id, day, word_id, reviews, knew) "
+            f"SELECT user_id, {day}, coalesce(word_id, 0), count(*), sum(CASE WHEN knew THEN 1 ELSE 0 END) "
+            f"FROM {source} WHERE reviewed_at < :cutoff AND user_id IS NOT NULL "
+            f"GROUP BY user_id, {day}, coalesce(word_id, 0) "
+            f"ON CONFLICT (user_id, day, word_id) DO UPDATE SET "
+            f"reviews = review_daily.reviews + excluded.reviews, knew = review_daily.knew + excluded.knew"
+        ), {"cutoff": cutoff})
+        return max(result.rowcount, 0)
+    
+    def ensure_partitions(self):
+        """Create the monthly partitions for the coming months (PostgreSQL only)"""
+        if engine.dialect.name != "postgresql":
+            return
+        with engine.begin() as conn:
+            ensure_partitions(conn, datetime.utcnow(), self.partitions_ahead)
+    
+    def compact(self, now: Optional[datetime] = None) -> Dict[str, int]:
+        """Compact and remove raw reviews older than the cutoff; returns what was done"""
+        cutoff = self.cutoff(now)
+        summary = {"partitions_dropped": 0, "aggregated_groups": 0, "aggregates_deleted": 0}
+        
+        if engine.dialect.name == "postgresql":
+            with engine.connect() as conn:
+                partitions = list_month_partitions(conn)
+            for name, month in partitions:
+                if add_months(month, 1) > cutoff:
+                    continue
+                # Aggregating and dropping in one transaction: a failure leaves the partition intact
+                with engine.begin() as conn:
+                    summary["aggregated_groups"] += self._compact_rows(conn, name, cutoff)
+                    conn.exec_driver_sql(f"ALTER TABLE reviews DETACH PARTITION {name}")
+                    conn.exec_driver_sql(f"DROP TABLE {name}")
+                summary["partitions_dropped"] += 1
+                logger.info(f"Compacted and dropped review partition {name}")
+            # Stray rows outside the monthly partitions
+            source = "reviews_default"
+        else:
+            source = "reviews"
+        
+        with engine.begin() as conn:
+            summary["aggregated_groups"] += self._compact_rows(conn, source, cutoff)
+            conn.execute(text(f"DELETE FROM {source} WHERE reviewed_at < :cutoff"), {"cutoff": cutoff})
+        
+        if self.aggregate_days > 0:
+            expired = (now or datetime.utcnow()).date() - timedelta(days=self.aggregate_days)
+            with engine.begin() as conn:
+                result = conn.execute(text("DELETE FROM review_daily WHERE day < :expired"), {"expired": expired})
+                summary["aggregates_deleted"] = max(result.rowcount, 0)
+        
+        logger.info(f"Review compaction before {cutoff}: {summary}")
+        return summary
+    
+    def run(self, now: Optional[datetime] = None) -> Dict[str, int]:
+        """One maintenance pass: partitions ahead, then compaction"""
+        try:
+            self.ensure_partitions()
+            return self.compact(now)
+        except Exception as e:
+            logger.error(f"Error compacting reviews: {e}")
+            return {}
+
+# Global instance
+review_compactor = ReviewCompactor()
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    load_dotenv()
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+    
+    parser = argparse.ArgumentParser(description="Compact old raw reviews into daily aggregates")
+    parser.add_argument("--raw-months", type=int, help="full months of raw reviews to keep besides the current one")
+    args = parser.parse_args()
+    
+    if args.raw_months is not None:
+        review_compactor.raw_months = args.raw_months
+    print(review_compactor.run())
@@ -0,0 +1,90 @@
+from collections import OrderedDict
+from typing import NamedTuple, Optional
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+import struct
+import threading
+
+# Callback data prefix of review answer buttons
+PREFIX = "r:"
+# action, word id, user id, interval days, session nonce
+_LAYOUT = struct.Struct(">BIqHI")
+_SIGNATURE_BYTES = 12
+
+def _secret() -> bytes:
+    # Every worker process derives the same key from the bot token unless one is configured
+    configured = os.getenv("REVIEW_TOKEN_SECRET")
+    if configured:
+        return configured.encode()
+    return hashlib.sha256(b"review-tokens:" + os.getenv("TELEGRAM_BOT_TOKEN", "").encode()).digest()
+
+_SECRET = _secret()
+
+class ReviewToken(NamedTuple):
+    word_id: int
+    user_id: int
+    interval_days: int
+    nonce: int
+    knew: bool
+
+def new_nonce() -> int:
+    """Nonce identifying one review session"""
+    return secrets.randbits(32)
+
+def issue(word_id: int, user_id: int, interval_days: int, nonce: int, knew: bool) -> str:
+    """Callback data for one answer button: 46 characters, within Telegram's 64-byte limit"""
+    payload = _LAYOUT.pack(1 if knew else 0, word_id, user_id, min(interval_days or 0, 0xFFFF), nonce)
+    signature = hmac.new(_SECRET, payload, hashlib.sha256).digest()[:_SIGNATURE_BYTES]
+    return PREFIX + base64.urlsafe_b64encode(payload + signature).decode()
+
+def verify(data: str) -> Optional[ReviewToken]:
+    """The token in ``data`` if it is well-formed and its signature is valid, else None"""
+    if not data.startswith(PREFIX):
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(data[len(PREFIX):])
+    except ValueError:
+        return None
+    if len(raw) != _LAYOUT.size + _SIGNATURE_BYTES:
+        return None
+    payload, signature = raw[:_LAYOUT.size], raw[_LAYOUT.size:]
+    expected = hmac.new(_SECRET, payload, hashlib.sha256).digest()[:_SIGNATURE_BYTES]
+    if not hmac.compare_digest(signature, expected):
+        return None
+    action, word_id, user_id, interval_days, nonce = _LAYOUT.unpack(payload)
+    return ReviewToken(word_id, user_id, interval_days, nonce, bool(action))
+
+class ReplayGuard:
+    """Remembers answered (word, session) pairs so a second tap on a card is rejected in memory.
+    
+    Updates of a chat are handled by one process (see ShardDispatcher), so
+    an in-process record catches double taps; after a restart the
+    conditional UPDATE in SRSService.apply_review still rejects stale answers.
+    """
+    
+    def __init__(self, size: int = 100000):
+        self.size = size
+        self._seen: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def claim(self, token: ReviewToken) -> bool:
+        """True the first time a card of a session is answered"""
+        key = (token.user_id, token.word_id, token.nonce)
+        with self._lock:
+            if key in self._seen:
+                return False
+            self._seen[key] = True
+            if len(self._seen) > self.size:
+                self._seen.popitem(last=False)
+            return True
+    
+    def release(self, token: ReviewToken):
+        """Forget a claim whose answer wasn't applied, so the user can tap again"""
+        with self._lock:
+            self._seen.pop((token.user_id, token.word_id, token.nonce), None)
+
+# Global instance
+replay_guard = ReplayGuard()
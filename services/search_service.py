@@ -0,0 +1,156 @@
+from typing import List, Set
+import logging
+from sqlalchemy import text
+from database.models import Word, LexiconEntry, SessionLocal
+
+logger = logging.getLogger(__name__)
+
+def _trigrams(value: str) -> Set[str]:
+    """Character trigrams of a lowercased string, padded so short words still match"""
+    padded = f"  {value.lower()} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+class SearchService:
+    """Fuzzy search over a user's words, translations and examples.
+    
+    Content lives in the shared lexicon, so the index covers lexicon entries
+    and matches are joined to the user's cards via ``ix_words_user_lexicon``.
+    PostgreSQL uses the pg_trgm GIN index (``ix_lexicon_search_trgm``);
+    SQLite uses the ``lexicon_fts`` FTS5 trigram table. Both are created by
+    migration 0003. Short or misspelled queries that match too little are
+    retried on the same indexes, looser: a lower similarity threshold on
+    PostgreSQL, the first three letters (or, for shorter queries, a lemma
+    prefix range) on SQLite. Other backends fall back to a plain LIKE scan.
+    """
+    
+    # Minimum trigram similarity for a result to be returned
+    MIN_SIMILARITY = 0.3
+    # pg_trgm word_similarity threshold for the index lookup (the extension's default)
+    WORD_SIMILARITY = 0.6
+    # Candidates fetched from the index before re-ranking
+    CANDIDATES = 50
+    
+    def __init__(self):
+        self.db = SessionLocal()
+    
+    def search(self, user_id: int, query: str, limit: int = 10) -> List[Word]:
+        """Find words matching ``query`` by prefix or approximately, best first"""
+        query = query.strip().lower()
+        if not query:
+            return []
+        
+        try:
+            dialect = self.db.get_bind().dialect.name
+            if dialect == "postgresql":
+                candidate_ids = self._postgres_candidates(user_id, query, self.WORD_SIMILARITY)
+                if len(candidate_ids) < limit:
+                    # Short or misspelled queries share few trigrams with the text
+                    candidate_ids += self._postgres_candidates(user_id, query, self.MIN_SIMILARITY)
+            elif dialect == "sqlite":
+                candidate_ids = self._sqlite_candidates(user_id, query) if len(query) >= 3 else []
+                if len(candidate_ids) < limit:
+                    # A typo can break every trigram of the query; widen to its first letters
+                    if len(query) > 3:
+                        candidate_ids += self._sqlite_candidates(user_id, query[:3])
+                    else:
+                        candidate_ids += self._prefix_candidates(user_id, query[:2])
+            else:
+                candidate_ids = self._like_candidates(user_id, query)
+            if dialect in ("postgresql", "sqlite"):
+                # Imported translations and examples live on the cards, outside the lexicon index
+                candidate_ids += self._override_candidates(user_id, query)
+            
+            if not candidate_ids:
+                return []
+            
+            words = self.db.query(Word).filter(Word.id.in_(candidate_ids)).all()
+            ranked = sorted(((self._score(word, query), word) for word in words), key=lambda pair: -pair[0])
+            results = [word for score, word in ranked if score >= self.MIN_SIMILARITY][:limit]
+            
+            logger.debug("Search for user %s: %d results", user_id, len(results))
+            return results
+        
+        except Exception as e:
+            self.db.rollback()
+            logger.error(f"Error searching words: {e}")
+            return []
+    
+    def _postgres_candidates(self, user_id: int, query: str, threshold: float) -> List[int]:
+        # Transaction-local, and set on every lookup since the session's transaction outlives it
+        self.db.execute(
+            text("SELECT set_config('pg_trgm.word_similarity_threshold', :threshold, true)"),
+            {"threshold": str(threshold)}
+        )
+        # The expression must match ix_lexicon_search_trgm for the index to be used
+        rows = self.db.execute(text(
+            "SELECT w.id FROM lexicon l JOIN words w ON w.lexicon_id = l.id "
+            "WHERE w.user_id = :user_id "
+            "AND :query <% lower(l.word || ' ' || l.translation || ' ' || coalesce(l.example, '')) "
+            "ORDER BY word_similarity(:query, lower(l.word || ' ' || l.translation || ' ' || coalesce(l.example, ''))) DESC "
+            "LIMIT :limit"
+        ), {"user_id": user_id, "query": query, "limit": self.CANDIDATES})
+        return [row.id for row in rows]
+    
+    def _sqlite_candidates(self, user_id: int, query: str) -> List[int]:
+        # OR over the query's trigrams tolerates typos; bm25 favours the most shared
+        grams = {query[i:i + 3] for i in range(len(query) - 2)}
+        match = " OR ".join('"' + gram.replace('"', '""') + '"' for gram in grams)
+        rows = self.db.execute(text(
+            "SELECT words.id FROM lexicon_fts JOIN words ON words.lexicon_id = lexicon_fts.rowid "
+            "WHERE lexicon_fts MATCH :match AND words.user_id = :user_id "
+            "ORDER BY bm25(lexicon_fts) LIMIT :limit"
+        ), {"match": match, "user_id": user_id, "limit": self.CANDIDATES})
+        return [row.id for row in rows]
+    
+    def _like_candidates(self, user_id: int, query: str) -> List[int]:
+        pattern = f"%{query}%"
+        rows = self.db.query(Word.id).join(Word.lexicon).filter(
+            Word.user_id == user_id,
+            LexiconEntry.word.ilike(pattern)
+            | LexiconEntry.translation.ilike(pattern)
+            | LexiconEntry.example.ilike(pattern)
+            | Word.translation_override.ilike(pattern)
+            | Word.example_override.ilike(pattern)
+        ).limit(self.CANDIDATES).all()
+        return [row.id for row in rows]
+    
+    def _prefix_candidates(self, user_id: int, prefix: str) -> List[int]:
+        # Lemma range on uq_lexicon_pair_lemma in the user's language pair, then ix_words_user_lexicon
+        rows = self.db.execute(text(
+            "SELECT w.id FROM users u "
+            "JOIN lexicon l ON l.language_from = u.language_from AND l.language_to = u.language_to "
+            "AND l.lemma >= :prefix AND l.lemma < :prefix_end "
+            "JOIN words w ON w.user_id = u.telegram_id AND w.lexicon_id = l.id "
+            "WHERE u.telegram_id = :user_id LIMIT :limit"
+        ), {"user_id": user_id, "prefix": prefix, "prefix_end": prefix + "\U0010ffff", "limit": self.CANDIDATES})
+        return [row.id for row in rows]
+    
+    def _override_candidates(self, user_id: int, query: str) -> List[int]:
+        # Scans only the user's cards with overrides, which are few; the second
+        # condition must match ix_words_user_overridden's WHERE for it to be used
+        pattern = f"%{query[:2]}%"
+        rows = self.db.query(Word.id).filter(
+            Word.user_id == user_id,
+            Word.translation_override.isnot(None) | Word.example_override.isnot(None),
+            Word.translation_override.ilike(pattern) | Word.example_override.ilike(pattern)
+        ).limit(self.CANDIDATES).all()
+        return [row.id for row in rows]
+    
+    def _score(self, word: Word, query: str) -> float:
+        """Rank by the best-matching field; prefix hits on the word or translation come first"""
+        for value in (word.word, word.translation):
+            if value and value.lower().startswith(query):
+                return 1.0 + len(query) / max(len(value), 1)
+        
+        query_grams = _trigrams(query)
+        best = 0.0
+        for value in (word.word, word.translation, word.example):
+            if not value:
+                continue
+            for token in [value] + value.split():
+                token_grams = _trigrams(token)
+                best = max(best, len(query_grams & token_grams) / len(query_grams | token_grams))
+        return best
+
+# Global instance
+search_service = SearchService()
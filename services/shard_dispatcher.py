@@ -0,0 +1,287 @@
+from bisect import bisect
+from typing import Dict, List, Optional
+import asyncio
+import hashlib
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+def chat_key(data: dict) -> int:
+    """Shard key of a raw update: its chat id, else the sender, else the update id"""
+    for field in ("message", "edited_message", "channel_post", "edited_channel_post"):
+        if field in data:
+            return data[field]["chat"]["id"]
+    callback = data.get("callback_query")
+    if callback is not None:
+        if callback.get("message"):
+            return callback["message"]["chat"]["id"]
+        return callback["from"]["id"]
+    for payload in data.values():
+        if isinstance(payload, dict) and isinstance(payload.get("from"), dict):
+            return payload["from"]["id"]
+    return data.get("update_id", 0)
+
+def _hash(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "big")
+
+class HashRing:
+    """Consistent hash ring; adding or removing a worker moves only ~1/N of the keys"""
+    
+    VIRTUAL_NODES = 128
+    
+    def __init__(self, worker_ids):
+        points = sorted(
+            (_hash(f"worker-{worker_id}-{i}"), worker_id)
+            for worker_id in worker_ids for i in range(self.VIRTUAL_NODES)
+        )
+        self._hashes = [point for point, _ in points]
+        self._owners = [owner for _, owner in points]
+    
+    def get(self, key) -> int:
+        index = bisect(self._hashes, _hash(str(key))) % len(self._hashes)
+        return self._owners[index]
+
+class _Worker:
+    def __init__(self, worker_id: int, inbox):
+        self.worker_id = worker_id
+        self.inbox = inbox
+        self.process = None
+        self.heartbeat: Dict = {}
+        self.last_seen = 0.0
+        self.restarts = 0
+        self.retiring = False
+
+class ShardDispatcher:
+    """Routes webhook updates to N worker processes by consistent hash of chat id.
+    
+    Every update of a chat goes to the same worker, which processes a chat's
+    updates in order (different chats concurrently), so per-user ordering and
+    in-process caches such as the due index stay coherent per shard. Workers
+    report heartbeats on a shared status queue; a monitor thread restarts
+    dead workers on their existing inbox, so queued updates survive.
+    
+    Resizing is graceful: every old worker gets a barrier, and updates for
+    chats whose owner changed are buffered until their old owner has worked
+    through everything queued before the barrier. Retired workers stop after
+    acknowledging it.
+    """
+    
+    HEARTBEAT_INTERVAL = 2.0
+    
+    def __init__(self, count: int):
+        self._context = multiprocessing.get_context("spawn")
+        self._status = self._context.Queue()
+        self._lock = threading.Lock()
+        self._workers: Dict[int, _Worker] = {}
+        self._ring: Optional[HashRing] = None
+        self._previous_ring: Optional[HashRing] = None
+        self._pending_barriers: set = set()
+        self._buffered: Dict[int, List[tuple]] = {}
+        self._barrier_token = 0
+        self._stopping = False
+        self._initial_count = count
+        self._monitor = threading.Thread(target=self._monitor_loop, name="shard-monitor", daemon=True)
+    
+    def start(self):
+        with self._lock:
+            for worker_id in range(self._initial_count):
+                self._start_worker(self._workers.setdefault(worker_id, _Worker(worker_id, self._context.Queue())))
+            self._ring = HashRing(range(self._initial_count))
+        self._monitor.start()
+        logger.info(f"Started {self._initial_count} update workers")
+    
+    def _start_worker(self, worker: _Worker):
+        worker.process = self._context.Process(
+            target=run_worker,
+            args=(worker.worker_id, worker.inbox, self._status, self.HEARTBEAT_INTERVAL),
+            name=f"update-worker-{worker.worker_id}",
+            daemon=True
+        )
+        worker.process.start()
+        worker.last_seen = time.monotonic()
+    
+    def submit(self, data: dict):
+        """Queue an update on the worker owning its chat"""
+        key = chat_key(data)
+        with self._lock:
+            owner = self._ring.get(key)
+            if self._previous_ring is not None:
+                previous = self._previous_ring.get(key)
+                if previous != owner and previous in self._pending_barriers:
+                    self._buffered.setdefault(previous, []).append((owner, data))
+                    return
+            self._workers[owner].inbox.put(("update", data))
+    
+    def resize(self, count: int):
+        """Change the number of workers, moving only the chats whose owner changes"""
+        if count < 1:
+            raise ValueError("At least one worker is required")
+        with self._lock:
+            if self._pending_barriers:
+                raise RuntimeError("A rebalance is already in progress")
+            active = sorted(worker_id for worker_id, worker in self._workers.items() if not worker.retiring)
+            if count == len(active):
+                return
+            for worker_id in range(len(active), count):
+                worker = self._workers[worker_id] = _Worker(worker_id, self._context.Queue())
+                self._start_worker(worker)
+            for worker_id in active[count:]:
+                self._workers[worker_id].retiring = True
+            
+            self._previous_ring, self._ring = self._ring, HashRing(range(count))
+            self._barrier_token += 1
+            self._pending_barriers = set(active)
+            for worker_id in active:
+                self._workers[worker_id].inbox.put(("barrier", self._barrier_token))
+        logger.info(f"Rebalancing update workers from {len(active)} to {count}")
+    
+    def _on_barrier(self, worker_id: int, token: int):
+        with self._lock:
+            if token != self._barrier_token or worker_id not in self._pending_barriers:
+                return
+            # Everything queued on the old owner is done; release its moved chats in order
+            for owner, data in self._buffered.pop(worker_id, []):
+                self._workers[owner].inbox.put(("update", data))
+            self._pending_barriers.discard(worker_id)
+            worker = self._workers[worker_id]
+            if worker.retiring:
+                worker.inbox.put(("stop", None))
+            if not self._pending_barriers:
+                self._previous_ring = None
+                logger.info("Rebalancing finished")
+    
+    def _monitor_loop(self):
+        while not self._stopping:
+            try:
+                message = self._status.get(timeout=self.HEARTBEAT_INTERVAL)
+            except queue.Empty:
+                message = None
+            if message is not None:
+                worker = self._workers.get(message["worker"])
+                if message["type"] == "heartbeat" and worker is not None:
+                    worker.heartbeat = message
+                    worker.last_seen = time.monotonic()
+                elif message["type"] == "barrier":
+                    self._on_barrier(message["worker"], message["token"])
+            
+            with self._lock:
+                for worker_id, worker in list(self._workers.items()):
+                    if worker.process.is_alive() or self._stopping:
+                        continue
+                    if worker.retiring and worker_id not in self._pending_barriers:
+                        worker.process.join()
+                        del self._workers[worker_id]
+                        logger.info(f"Update worker {worker_id} retired")
+                        continue
+                    worker.restarts += 1
+                    logger.warning(f"Update worker {worker_id} exited with {worker.process.exitcode}, restarting")
+                    self._start_worker(worker)
+                    if worker_id in self._pending_barriers:
+                        # The barrier may have died with the old process
+                        worker.inbox.put(("barrier", self._barrier_token))
+    
+    def status(self) -> Dict:
+        """Health of every worker, for /health and /admin/workers"""
+        now = time.monotonic()
+        with self._lock:
+            workers = []
+            for worker_id, worker in sorted(self._workers.items()):
+                stale = now - worker.last_seen > 3 * self.HEARTBEAT_INTERVAL
+                workers.append({
+                    "worker": worker_id,
+                    "pid": worker.process.pid,
+                    "alive": worker.process.is_alive(),
+                    "healthy": worker.process.is_alive() and not stale,
+                    "retiring": worker.retiring,
+                    "restarts": worker.restarts,
+                    "seconds_since_heartbeat": round(now - worker.last_seen, 1),
+                    "processed": worker.heartbeat.get("processed", 0),
+                    "queued": worker.heartbeat.get("queued", 0),
+                    "chats": worker.heartbeat.get("chats", 0)
+                })
+            return {"rebalancing": bool(self._pending_barriers), "workers": workers}
+    
+    def stop(self, timeout: float = 10.0):
+        """Let every worker finish its queue, then stop it"""
+        self._stopping = True
+        with self._lock:
+            workers = list(self._workers.values())
+        for worker in workers:
+            worker.inbox.put(("stop", None))
+        for worker in workers:
+            worker.process.join(timeout)
+            if worker.process.is_alive():
+                logger.warning(f"Update worker {worker.worker_id} did not stop in time, terminating")
+                worker.process.terminate()
+
+def run_worker(worker_id: int, inbox, status, heartbeat_interval: float):
+    """Entry point of a worker process"""
+    os.environ["WORKER_ROLE"] = "worker"
+    asyncio.run(_worker_loop(worker_id, inbox, status, heartbeat_interval))
+
+async def _worker_loop(worker_id: int, inbox, status, heartbeat_interval: float):
+    import main
+    
+    await main.initialize_telegram()
+    loop = asyncio.get_running_loop()
+    chats: Dict[int, asyncio.Queue] = {}
+    stats = {"processed": 0}
+    
+    async def consume(key: int, updates: asyncio.Queue):
+        # One consumer per active chat keeps that chat's updates in order
+        while True:
+            try:
+                data = await asyncio.wait_for(updates.get(), timeout=30)
+            except asyncio.TimeoutError:
+                if updates.empty():
+                    del chats[key]
+                    return
+                continue
+            try:
+                await main.process_update_data(data)
+            except Exception as e:
+                logger.error(f"Worker {worker_id} failed to process update: {e}")
+            finally:
+                stats["processed"] += 1
+                updates.task_done()
+    
+    async def report():
+        while True:
+            status.put({
+                "type": "heartbeat",
+                "worker": worker_id,
+                "pid": os.getpid(),
+                "processed": stats["processed"],
+                "queued": sum(updates.qsize() for updates in chats.values()),
+                "chats": len(chats)
+            })
+            await asyncio.sleep(heartbeat_interval)
+    
+    reporter = asyncio.create_task(report())
+    flusher = asyncio.create_task(main.analytics_flush_loop())
+    while True:
+        kind, payload = await loop.run_in_executor(None, inbox.get)
+        if kind == "update":
+            key = chat_key(payload)
+            updates = chats.get(key)
+            if updates is None:
+                updates = chats[key] = asyncio.Queue()
+                asyncio.create_task(consume(key, updates))
+            updates.put_nowait(payload)
+        elif kind in ("barrier", "stop"):
+            await asyncio.gather(*(updates.join() for updates in list(chats.values())))
+            if kind == "barrier":
+                status.put({"type": "barrier", "worker": worker_id, "token": payload})
+            else:
+                break
+    
+    reporter.cancel()
+    flusher.cancel()
+    await loop.run_in_executor(None, main.analytics_service.flush)
+    await main.telegram_app.stop()
+    await main.telegram_app.shutdown()
@@ -1,7 +1,10 @@
-from datetime import datetime, timedelta
-from typing import List, Optional
+from datetime import date, datetime, timedelta
+from typing import List, Optional, Tuple
 import logging
-from database.models import Word, Review, SessionLocal
+from sqlalchemy import case, func, insert, tuple_, update
+from database.models import Word, Review, ReviewDaily, SessionLocal, replica_router
+from services.analytics_service import analytics_service
+from services.due_index import due_index
 
 logger = logging.getLogger(__name__)
 
@@ -13,22 +16,53 @@ class SRSService:
     
     def __init__(self):
         self.db = SessionLocal()
+        self.replica_db = replica_router.new_session()
     
-    def get_due_words(self, user_id: int, limit: int = 20) -> List[Word]:
-        """Get words that are due for review"""
+    def get_due_words(self, user_id: int, limit: int = 20, after: Optional[Tuple] = None) -> List[Word]:
+        """Get due words in priority order: by the day they fell due, weakest first within a day.
+        
+        ``after`` is a keyset cursor (see ``get_due_cursor``) so a session can
+        continue through a large backlog without OFFSET scans or repeats.
+        """
         try:
-            due_words = self.db.query(Word).filter(
-                Word.user_id == user_id,
-                Word.next_review <= datetime.utcnow()
-            ).limit(limit).all()
+            if due_index is not None:
+                due_ids = due_index.get_due_ids(user_id, limit, after)
+            else:
+                # Index-only scan over ix_words_user_due_day; rows are fetched by id below
+                now = datetime.utcnow()
+                due_day = func.date(Word.next_review)
+                query = self.db.query(Word.id).filter(
+                    Word.user_id == user_id,
+                    due_day <= func.date(now),
+                    Word.next_review <= now
+                )
+                if after is not None:
+                    next_review, difficulty, word_id = after
+                    query = query.filter(
+                        tuple_(due_day, Word.difficulty, Word.next_review, Word.id)
+                        > tuple_(func.date(next_review), difficulty, next_review, word_id)
+                    )
+                due_ids = [row.id for row in query.order_by(
+                    due_day, Word.difficulty, Word.next_review, Word.id
+                ).limit(limit)]
+            
+            words_by_id = {
+                word.id: word for word in self.db.query(Word).filter(Word.id.in_(due_ids)).all()
+            } if due_ids else {}
+            due_words = [words_by_id[word_id] for word_id in due_ids if word_id in words_by_id]
             
-            logger.info(f"Found {len(due_words)} due words for user {user_id}")
+            logger.debug("Found %d due words for user %s", len(due_words), user_id)
             return due_words
             
         except Exception as e:
             logger.error(f"Error getting due words: {e}")
             return []
     
+    @staticmethod
+    def get_due_cursor(word: Word) -> Tuple:
+        """Keyset cursor positioned after ``word`` in the due queue"""
+        return (word.next_review, word.difficulty, word.id)
+    
     def process_review(self, word_id: int, user_id: int, knew: bool) -> bool:
         """Process a word review and update SRS schedule"""
         try:
@@ -54,7 +88,11 @@ class SRSService:
             self._update_word_schedule(word, knew)
             
             self.db.commit()
-            logger.info(f"Processed review for word {word_id}, knew={knew}")
+            replica_router.note_write(user_id)
+            if due_index is not None:
+                due_index.on_words_scheduled(user_id, [(word.id, word.next_review, word.difficulty)])
+            analytics_service.record_reviews(1)
+            logger.debug("Processed review for word %s, knew=%s", word_id, knew)
             return True
             
         except Exception as e:
@@ -62,18 +100,115 @@ class SRSService:
             logger.error(f"Error processing review: {e}")
             return False
     
-    def _update_word_schedule(self, word: Word, knew: bool):
-        """Update word's next review date based on SRS algorithm"""
-        current_interval = word.interval_days
+    def apply_review(self, word_id: int, user_id: int, current_interval: int, knew: bool) -> bool:
+        """Apply an answer whose word and interval come from a signed callback token.
+        
+        One conditional UPDATE plus the review INSERT, with no read first. The
+        UPDATE matches only if the word is the user's, is still due (cards are
+        only shown for due words, and every answer schedules the word at least
+        a day ahead) and still has the interval the card was shown with, so a
+        stale or repeated answer changes nothing.
+        """
+        try:
+            new_interval = self.next_interval(current_interval, knew)
+            next_review = datetime.utcnow() + timedelta(days=new_interval)
+            difficulty = 1 if knew else 0
+            updated = self.db.execute(
+                update(Word).where(
+                    Word.id == word_id,
+                    Word.user_id == user_id,
+                    Word.next_review <= datetime.utcnow(),
+                    Word.interval_days == current_interval
+                ).values(interval_days=new_interval, next_review=next_review, difficulty=difficulty)
+            ).rowcount
+            if updated != 1:
+                self.db.rollback()
+                logger.debug("Review of word %s by user %s no longer applies", word_id, user_id)
+                return False
+            
+            self.db.execute(insert(Review).values(
+                word_id=word_id, user_id=user_id, knew=knew, reviewed_at=datetime.utcnow()
+            ))
+            self.db.commit()
+            replica_router.note_write(user_id)
+            if due_index is not None:
+                due_index.on_words_scheduled(user_id, [(word_id, next_review, difficulty)])
+            analytics_service.record_reviews(1)
+            return True
+            
+        except Exception as e:
+            self.db.rollback()
+            logger.error(f"Error applying review: {e}")
+            return False
+    
+    def process_reviews(self, user_id: int, answers: List[Tuple[int, bool]]) -> Optional[List[int]]:
+        """Process a page of (word_id, knew) answers in one transaction.
         
+        Returns the ids of the words the answers were applied to, or None on
+        an error (which rolls back the whole page). As in ``apply_review``, an
+        answer applies only while its word is still the user's and due, so
+        words deleted or already answered since the page was sent (e.g. in
+        /learn) are skipped instead of being graded twice.
+        """
+        try:
+            knew_by_id = dict(answers)
+            now = datetime.utcnow()
+            due = self.db.query(Word.id, Word.interval_days).filter(
+                Word.id.in_(list(knew_by_id)),
+                Word.user_id == user_id,
+                Word.next_review <= now
+            ).all() if knew_by_id else []
+            
+            scheduled = []
+            for word_id, interval in due:
+                knew = knew_by_id[word_id]
+                new_interval = self.next_interval(interval, knew)
+                next_review = now + timedelta(days=new_interval)
+                difficulty = 1 if knew else 0
+                # Conditional on what was just read, so an answer committed in between wins
+                updated = self.db.execute(
+                    update(Word).where(
+                        Word.id == word_id,
+                        Word.next_review <= now,
+                        Word.interval_days == interval
+                    ).values(interval_days=new_interval, next_review=next_review, difficulty=difficulty)
+                ).rowcount
+                if updated == 1:
+                    scheduled.append((word_id, next_review, difficulty))
+            
+            if scheduled:
+                self.db.execute(insert(Review), [
+                    {"word_id": word_id, "user_id": user_id, "knew": knew_by_id[word_id], "reviewed_at": now}
+                    for word_id, _, _ in scheduled
+                ])
+            self.db.commit()
+            if scheduled:
+                replica_router.note_write(user_id)
+                if due_index is not None:
+                    due_index.on_words_scheduled(user_id, scheduled)
+                analytics_service.record_reviews(len(scheduled))
+            logger.debug("Processed %d of %d reviews for user %s", len(scheduled), len(answers), user_id)
+            return [word_id for word_id, _, _ in scheduled]
+            
+        except Exception as e:
+            self.db.rollback()
+            logger.error(f"Error processing reviews: {e}")
+            return None
+    
+    @classmethod
+    def next_interval(cls, current_interval: int, knew: bool) -> int:
+        """Interval in days after answering a word at ``current_interval``"""
         if knew:
             # Move to next interval
-            current_index = self.INTERVALS.index(current_interval) if current_interval in self.INTERVALS else 0
-            next_index = min(current_index + 1, len(self.INTERVALS) - 1)
-            new_interval = self.INTERVALS[next_index]
-        else:
-            # Reset to first interval
-            new_interval = self.INTERVALS[0]
+            current_index = cls.INTERVALS.index(current_interval) if current_interval in cls.INTERVALS else 0
+            next_index = min(current_index + 1, len(cls.INTERVALS) - 1)
+            return cls.INTERVALS[next_index]
+        # Reset to first interval
+        return cls.INTERVALS[0]
+    
+    def _update_word_schedule(self, word: Word, knew: bool):
+        """Update word's next review date based on SRS algorithm"""
+        new_interval = self.next_interval(word.interval_days, knew)
         
         # Update word
         word.interval_days = new_interval
@@ -83,40 +218,7 @@ class SRSService:
     def get_review_stats(self, user_id: int) -> dict:
         """Get review statistics for a user"""
         try:
-            # Total words
-            total_words = self.db.query(Word).filter(Word.user_id == user_id).count()
-            
-            # Due words
-            due_words = self.db.query(Word).filter(
-                Word.user_id == user_id,
-                Word.next_review <= datetime.utcnow()
-            ).count()
-            
-            # Today's reviews
-            today = datetime.utcnow().date()
-            today_reviews = self.db.query(Review).filter(
-                Review.user_id == user_id,
-                Review.reviewed_at >= today
-            ).count()
-            
-            # Accuracy (last 30 days)
-            thirty_days_ago = datetime.utcnow() - timedelta(days=30)
-            recent_reviews = self.db.query(Review).filter(
-                Review.user_id == user_id,
-                Review.reviewed_at >= thirty_days_ago
-            ).all()
-            
-            if recent_reviews:
-                accuracy = sum(1 for r in recent_reviews if r.knew) / len(recent_reviews) * 100
-            else:
-                accuracy = 0
-            
-            return {
-                "total_words": total_words,
-                "due_words": due_words,
-                "today_reviews": today_reviews,
-                "accuracy": round(accuracy, 1)
-            }
+            return replica_router.read(self.db, self.replica_db, user_id, lambda db: self._review_stats(db, user_id))
             
         except Exception as e:
             logger.error(f"Error getting review stats: {e}")
@@ -127,45 +229,97 @@ class SRSService:
                 "accuracy": 0
             }
     
+    def _review_stats(self, db, user_id: int) -> dict:
+        if due_index is not None:
+            total_words = due_index.get_total_count(user_id)
+            due_words = due_index.get_due_count(user_id)
+        else:
+            # Total words
+            total_words = db.query(Word).filter(Word.user_id == user_id).count()
+            
+            # Due words
+            due_words = db.query(Word).filter(
+                Word.user_id == user_id,
+                Word.next_review <= datetime.utcnow()
+            ).count()
+        
+        # Today's reviews
+        today = datetime.utcnow().date()
+        today_reviews = db.query(Review).filter(
+            Review.user_id == user_id,
+            Review.reviewed_at >= today
+        ).count()
+        
+        # Accuracy (last 30 days)
+        thirty_days_ago = datetime.utcnow() - timedelta(days=30)
+        recent_count, recent_knew = db.query(
+            func.count(Review.id),
+            func.sum(case((Review.knew, 1), else_=0))
+        ).filter(
+            Review.user_id == user_id,
+            Review.reviewed_at >= thirty_days_ago
+        ).one()
+        
+        if recent_count:
+            accuracy = recent_knew / recent_count * 100
+        else:
+            accuracy = 0
+        
+        return {
+            "total_words": total_words,
+            "due_words": due_words,
+            "today_reviews": today_reviews,
+            "accuracy": round(accuracy, 1)
+        }
+    
     def get_learning_streak(self, user_id: int) -> int:
         """Calculate user's learning streak (consecutive days with reviews)"""
         try:
-            # Get all review dates for user
-            reviews = self.db.query(Review.reviewed_at).filter(
-                Review.user_id == user_id
-            ).distinct().all()
-            
-            if not reviews:
-                return 0
-            
-            # Convert to dates and sort
-            review_dates = [r.reviewed_at.date() for r in reviews]
-            review_dates.sort(reverse=True)
-            
-            # Calculate streak
-            streak = 0
-            current_date = datetime.utcnow().date()
-            
-            for i, review_date in enumerate(review_dates):
-                if i == 0:
-                    # Check if today or yesterday
-                    if review_date == current_date or review_date == current_date - timedelta(days=1):
-                        streak = 1
-                    else:
-                        break
-                else:
-                    # Check for consecutive days
-                    expected_date = current_date - timedelta(days=i)
-                    if review_date == expected_date:
-                        streak += 1
-                    else:
-                        break
-            
-            return streak
+            return replica_router.read(self.db, self.replica_db, user_id, lambda db: self._learning_streak(db, user_id))
             
         except Exception as e:
             logger.error(f"Error calculating learning streak: {e}")
             return 0
+    
+    def _learning_streak(self, db, user_id: int) -> int:
+        # Review days from the raw log plus days already compacted into daily aggregates
+        raw_days = db.query(func.date(Review.reviewed_at)).filter(
+            Review.user_id == user_id
+        ).distinct().all()
+        compacted_days = db.query(ReviewDaily.day).filter(
+            ReviewDaily.user_id == user_id
+        ).distinct().all()
+        
+        if not raw_days and not compacted_days:
+            return 0
+        
+        # SQLite returns date() as a string
+        review_dates = {
+            date.fromisoformat(day) if isinstance(day, str) else day
+            for (day,) in raw_days + compacted_days
+        }
+        review_dates = sorted(review_dates, reverse=True)
+        
+        # Calculate streak
+        streak = 0
+        current_date = datetime.utcnow().date()
+        
+        for i, review_date in enumerate(review_dates):
+            if i == 0:
+                # Check if today or yesterday
+                if review_date == current_date or review_date == current_date - timedelta(days=1):
+                    streak = 1
+                else:
+                    break
+            else:
+                # Check for consecutive days
+                expected_date = current_date - timedelta(days=i)
+                if review_date == expected_date:
+                    streak += 1
+                else:
+                    break
+        
+        return streak
 
 # Global instance
 srs_service = SRSService()
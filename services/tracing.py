@@ -0,0 +1,102 @@
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+import logging
+import os
+import time
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from telegram.request import HTTPXRequest
+
+logger = logging.getLogger(__name__)
+
+class Trace:
+    """Spans recorded while processing one webhook update"""
+    
+    def __init__(self, update_id):
+        self.update_id = update_id
+        self.label = ("other", "other")
+        self.started = time.perf_counter()
+        self.spans: List[tuple] = []
+    
+    def add(self, kind: str, started: float, detail: str = ""):
+        now = time.perf_counter()
+        self.spans.append((kind, started - self.started, now - started, detail))
+    
+    def summary(self) -> Dict:
+        """Per-kind totals plus every span, offsets and durations in milliseconds"""
+        totals = defaultdict(lambda: {"count": 0, "ms": 0.0})
+        for kind, _, duration, _ in self.spans:
+            totals[kind]["count"] += 1
+            totals[kind]["ms"] += duration * 1000
+        return {
+            "update_id": self.update_id,
+            "update": "/".join(self.label),
+            "total_ms": round((time.perf_counter() - self.started) * 1000, 1),
+            "totals": {kind: {"count": total["count"], "ms": round(total["ms"], 1)} for kind, total in totals.items()},
+            "spans": [
+                {"kind": kind, "offset_ms": round(offset * 1000, 1), "ms": round(duration * 1000, 1), "detail": detail}
+                for kind, offset, duration, detail in self.spans
+            ]
+        }
+
+_current: ContextVar[Optional[Trace]] = ContextVar("update_trace", default=None)
+
+# Updates slower than this many seconds are logged with their span breakdown
+SLOW_UPDATE_SECONDS = float(os.getenv("SLOW_UPDATE_SECONDS", "2.0"))
+# Most recent slow-update breakdowns kept for /admin/slow-updates
+slow_updates = deque(maxlen=int(os.getenv("SLOW_UPDATE_HISTORY", "50")))
+
+def start_trace(update_id) -> Trace:
+    trace = Trace(update_id)
+    _current.set(trace)
+    return trace
+
+def finish_trace(trace: Trace):
+    """Keep and log the breakdown if the update was slow"""
+    _current.set(None)
+    if time.perf_counter() - trace.started < SLOW_UPDATE_SECONDS:
+        return
+    summary = trace.summary()
+    slow_updates.append(summary)
+    totals = ", ".join(f"{kind} {total['count']}x {total['ms']:.0f}ms" for kind, total in summary["totals"].items())
+    logger.warning(f"Slow update {trace.update_id} ({summary['update']}) took {summary['total_ms']:.0f}ms: {totals}")
+
+@contextmanager
+def span(kind: str, detail: str = ""):
+    """Record a span on the current update's trace, if any"""
+    trace = _current.get()
+    if trace is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add(kind, started, detail)
+
+def instrument_engine(engine: Engine):
+    """Record each statement as a ``db`` span"""
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if _current.get() is not None:
+            conn.info.setdefault("trace_started", []).append(time.perf_counter())
+    
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        trace = _current.get()
+        if trace is not None and conn.info.get("trace_started"):
+            trace.add("db", conn.info["trace_started"].pop(), " ".join(statement.split())[:120])
+    
+    @event.listens_for(engine, "handle_error")
+    def handle_error(context):
+        if context.connection is not None and context.connection.info.get("trace_started"):
+            context.connection.info["trace_started"].pop()
+
+class TracingRequest(HTTPXRequest):
+    """Bot API transport recording each call as a ``telegram`` span"""
+    
+    async def do_request(self, url: str, method: str, *args, **kwargs):
+        with span("telegram", url.rsplit("/", 1)[-1]):
+            return await super().do_request(url, method, *args, **kwargs)
@@ -1,7 +1,7 @@
 from datetime import datetime
 from typing import Optional, Dict, Any
 import logging
-from database.models import User, SessionLocal
+from database.models import User, SessionLocal, replica_router
 
 logger = logging.getLogger(__name__)
 
@@ -10,6 +10,7 @@ class UserService:
     
     def __init__(self):
         self.db = SessionLocal()
+        self.replica_db = replica_router.new_session()
     
     def get_or_create_user(self, telegram_id: int, username: str = None) -> User:
         """Get existing user or create new one"""
@@ -26,14 +27,15 @@ class UserService:
                 )
                 self.db.add(user)
                 self.db.commit()
-                logger.info(f"Created new user: {telegram_id}")
+                replica_router.note_write(telegram_id)
+                logger.info("Created new user: %s", telegram_id)
             else:
                 # Update last active
                 user.last_active = datetime.utcnow()
                 if username and username != user.username:
                     user.username = username
                 self.db.commit()
-                logger.info(f"Updated user: {telegram_id}")
+                logger.debug("Updated user: %s", telegram_id)
             
             return user
             
@@ -63,6 +65,7 @@ class UserService:
             user.language_to = language_to
             user.last_active = datetime.utcnow()
             self.db.commit()
+            replica_router.note_write(telegram_id)
             
             logger.info(f"Updated languages for user {telegram_id}: {language_from} -> {language_to}")
             return True
@@ -83,6 +86,7 @@ class UserService:
             user.timezone = timezone
             user.last_active = datetime.utcnow()
             self.db.commit()
+            replica_router.note_write(telegram_id)
             
             logger.info(f"Updated timezone for user {telegram_id}: {timezone}")
             return True
@@ -95,24 +99,27 @@ class UserService:
     def get_user_profile(self, telegram_id: int) -> Optional[Dict[str, Any]]:
         """Get user profile information"""
         try:
-            user = self.db.query(User).filter(User.telegram_id == telegram_id).first()
-            if not user:
-                return None
-            
-            return {
-                "telegram_id": user.telegram_id,
-                "username": user.username,
-                "language_from": user.language_from,
-                "language_to": user.language_to,
-                "timezone": user.timezone,
-                "created_at": user.created_at.isoformat() if user.created_at else None,
-                "last_active": user.last_active.isoformat() if user.last_active else None
-            }
+            return replica_router.read(self.db, self.replica_db, telegram_id, lambda db: self._user_profile(db, telegram_id))
             
         except Exception as e:
             logger.error(f"Error getting user profile: {e}")
             return None
     
+    def _user_profile(self, db, telegram_id: int) -> Optional[Dict[str, Any]]:
+        user = db.query(User).filter(User.telegram_id == telegram_id).first()
+        if not user:
+            return None
+        
+        return {
+            "telegram_id": user.telegram_id,
+            "username": user.username,
+            "language_from": user.language_from,
+            "language_to": user.language_to,
+            "timezone": user.timezone,
+            "created_at": user.created_at.isoformat() if user.created_at else None,
+            "last_active": user.last_active.isoformat() if user.last_active else None
+        }
+    
     def is_user_configured(self, telegram_id: int) -> bool:
         """Check if user has completed initial setup"""
         try:
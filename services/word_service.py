@@ -1,7 +1,11 @@
 from datetime import datetime
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
 import logging
-from database.models import Word, SessionLocal
+from sqlalchemy import text, tuple_
+from sqlalchemy.exc import IntegrityError
+from database.models import User, Word, LexiconEntry, ContextCount, SessionLocal, replica_router
+from services.due_index import due_index
+from services.known_words import known_words
 
 logger = logging.getLogger(__name__)
 
@@ -10,18 +14,30 @@ class WordService:
     
     def __init__(self):
         self.db = SessionLocal()
+        self.replica_db = replica_router.new_session()
     
-    def add_words_from_list(self, user_id: int, words_data: List[Dict], context: str = None) -> List[Word]:
+    def add_words_from_list(
+        self,
+        user_id: int,
+        words_data: List[Dict],
+        context: str = None,
+        language_from: str = None,
+        language_to: str = None
+    ) -> List[Word]:
         """Add multiple words from AI-generated list"""
         try:
+            if language_from is None or language_to is None:
+                user = self.db.get(User, user_id)
+                language_from, language_to = user.language_from or "", user.language_to or ""
+            
+            entries = self.get_lexicon_entries(language_from, language_to, words_data)
+            known_words.add(self.db, user_id, language_from, language_to, [entry.lemma for entry in entries])
             added_words = []
             
-            for word_data in words_data:
+            for entry in entries:
                 word = Word(
                     user_id=user_id,
-                    word=word_data["word"],
-                    translation=word_data["translation"],
-                    example=word_data.get("example_sentence_L1", ""),  # Store L1 example
+                    lexicon=entry,
                     context=context,
                     difficulty=1,
                     next_review=datetime.utcnow(),  # Available for immediate review
@@ -31,8 +47,15 @@ class WordService:
                 self.db.add(word)
                 added_words.append(word)
             
+            if added_words:
+                self._adjust_context_count(user_id, context, len(added_words))
             self.db.commit()
-            logger.info(f"Added {len(added_words)} words for user {user_id}")
+            replica_router.note_write(user_id)
+            if due_index is not None:
+                due_index.on_words_scheduled(
+                    user_id, [(word.id, word.next_review, word.difficulty) for word in added_words]
+                )
+            logger.debug("Added %d words for user %s", len(added_words), user_id)
             return added_words
             
         except Exception as e:
@@ -40,19 +63,116 @@ class WordService:
             logger.error(f"Error adding words: {e}")
             return []
     
-    def get_user_words(self, user_id: int, limit: int = 50) -> List[Word]:
-        """Get all words for a user"""
+    def get_lexicon_entries(self, language_from: str, language_to: str, words_data: List[Dict]) -> List[LexiconEntry]:
+        """Find or create the shared lexicon entry for each word, in input order.
+        
+        Runs inside the caller's transaction; entries another writer creates
+        concurrently are picked up instead of failing on the unique key.
+        """
+        lemmas = [LexiconEntry.normalize_lemma(word_data["word"]) for word_data in words_data]
+        entries = {
+            entry.lemma: entry for entry in self.db.query(LexiconEntry).filter(
+                LexiconEntry.language_from == language_from,
+                LexiconEntry.language_to == language_to,
+                LexiconEntry.lemma.in_(set(lemmas))
+            ).all()
+        } if lemmas else {}
+        
+        for lemma, word_data in zip(lemmas, words_data):
+            entry = entries.get(lemma)
+            if entry is None:
+                entry = LexiconEntry(
+                    language_from=language_from,
+                    language_to=language_to,
+                    lemma=lemma,
+                    word=word_data["word"],
+                    translation=word_data["translation"],
+                    example=word_data.get("example_sentence_L1") or None,
+                    example_translation=word_data.get("example_sentence_L2") or None,
+                    created_at=datetime.utcnow()
+                )
+                try:
+                    with self.db.begin_nested():
+                        self.db.add(entry)
+                except IntegrityError:
+                    entry = self.db.query(LexiconEntry).filter(
+                        LexiconEntry.language_from == language_from,
+                        LexiconEntry.language_to == language_to,
+                        LexiconEntry.lemma == lemma
+                    ).one()
+                entries[lemma] = entry
+            elif entry.imported:
+                # Content from a user's file isn't shared; the importers keep it on their cards
+                entry.word = word_data["word"]
+                entry.translation = word_data["translation"]
+                entry.example = word_data.get("example_sentence_L1") or None
+                entry.example_translation = word_data.get("example_sentence_L2") or None
+                entry.imported = False
+            elif not entry.example and word_data.get("example_sentence_L1"):
+                # Fill in examples the shared entry is still missing
+                entry.example = word_data["example_sentence_L1"]
+                entry.example_translation = word_data.get("example_sentence_L2") or None
+        
+        return [entries[lemma] for lemma in lemmas]
+    
+    def get_words_page(
+        self,
+        user_id: int,
+        context: Optional[str] = None,
+        before: Optional[Tuple[datetime, int]] = None,
+        after: Optional[Tuple[datetime, int]] = None,
+        limit: int = 10
+    ) -> List[Word]:
+        """Get one page of words, newest first, by keyset on (created_at, id).
+        
+        ``before`` returns the page following a (created_at, id) cursor,
+        ``after`` the page preceding it. Up to ``limit + 1`` rows are read so
+        callers can tell whether another page exists in that direction.
+        """
         try:
-            words = self.db.query(Word).filter(
-                Word.user_id == user_id
-            ).order_by(Word.created_at.desc()).limit(limit).all()
-            
-            return words
+            return replica_router.read(
+                self.db, self.replica_db, user_id,
+                lambda db: self._words_page(db, user_id, context, before, after, limit)
+            )
             
         except Exception as e:
-            logger.error(f"Error getting user words: {e}")
+            logger.error(f"Error getting words page: {e}")
             return []
     
+    def _words_page(
+        self,
+        db,
+        user_id: int,
+        context: Optional[str],
+        before: Optional[Tuple[datetime, int]],
+        after: Optional[Tuple[datetime, int]],
+        limit: int
+    ) -> List[Word]:
+        query = db.query(Word).filter(Word.user_id == user_id)
+        if context is not None:
+            query = query.filter(Word.context == context)
+        
+        key = tuple_(Word.created_at, Word.id)
+        if after is not None:
+            # Walk backwards towards newer words, then restore display order
+            words = query.filter(key > tuple_(*after)).order_by(
+                Word.created_at, Word.id
+            ).limit(limit + 1).all()
+            return list(reversed(words))
+        
+        if before is not None:
+            query = query.filter(key < tuple_(*before))
+        return query.order_by(Word.created_at.desc(), Word.id.desc()).limit(limit + 1).all()
+    
+    @staticmethod
+    def get_page_cursor(word: Word) -> Tuple[datetime, int]:
+        """Keyset cursor for ``word`` in the newest-first browse order"""
+        return (word.created_at, word.id)
+    
+    def get_user_words(self, user_id: int, limit: int = 50, before: Optional[Tuple[datetime, int]] = None) -> List[Word]:
+        """Get a user's words, newest first, optionally after a page cursor"""
+        return self.get_words_page(user_id, before=before, limit=limit)[:limit]
+    
     def get_word_by_id(self, word_id: int, user_id: int) -> Optional[Word]:
         """Get specific word by ID"""
         try:
@@ -80,9 +200,14 @@ class WordService:
                 return False
             
             self.db.delete(word)
+            self._adjust_context_count(user_id, word.context, -1)
+            known_words.invalidate(self.db, user_id, word.lexicon.language_from, word.lexicon.language_to)
             self.db.commit()
+            replica_router.note_write(user_id)
+            if due_index is not None:
+                due_index.on_word_deleted(user_id, word_id)
             
-            logger.info(f"Deleted word {word_id} for user {user_id}")
+            logger.debug("Deleted word %s for user %s", word_id, user_id)
             return True
             
         except Exception as e:
@@ -90,38 +215,42 @@ class WordService:
             logger.error(f"Error deleting word: {e}")
             return False
     
-    def get_words_by_context(self, user_id: int, context: str) -> List[Word]:
-        """Get words by context"""
-        try:
-            words = self.db.query(Word).filter(
-                Word.user_id == user_id,
-                Word.context == context
-            ).order_by(Word.created_at.desc()).all()
-            
-            return words
-            
-        except Exception as e:
-            logger.error(f"Error getting words by context: {e}")
-            return []
+    def get_words_by_context(
+        self,
+        user_id: int,
+        context: str,
+        limit: int = 50,
+        before: Optional[Tuple[datetime, int]] = None
+    ) -> List[Word]:
+        """Get words by context, newest first, optionally after a page cursor"""
+        return self.get_words_page(user_id, context=context, before=before, limit=limit)[:limit]
+    
+    def _adjust_context_count(self, user_id: int, context: Optional[str], delta: int):
+        """Change a context's word count within the caller's transaction"""
+        # Upsert: a concurrent first insert for the context (another worker or
+        # connection) becomes an increment instead of failing the caller's write
+        self.db.execute(text(
+            "INSERT INTO context_counts (user_id, context, word_count) VALUES (:user_id, :context, :delta) "
+            "ON CONFLICT (user_id, context) DO UPDATE SET word_count = context_counts.word_count + excluded.word_count"
+        ), {"user_id": user_id, "context": context or "", "delta": delta})
     
     def get_word_count_by_context(self, user_id: int) -> Dict[str, int]:
         """Get word count grouped by context"""
         try:
-            from sqlalchemy import func
-            
-            result = self.db.query(
-                Word.context,
-                func.count(Word.id).label('count')
-            ).filter(
-                Word.user_id == user_id
-            ).group_by(Word.context).all()
-            
-            return {row.context or "General": row.count for row in result}
+            return replica_router.read(self.db, self.replica_db, user_id, lambda db: self._word_count_by_context(db, user_id))
             
         except Exception as e:
             logger.error(f"Error getting word count by context: {e}")
             return {}
     
+    def _word_count_by_context(self, db, user_id: int) -> Dict[str, int]:
+        result = db.query(ContextCount).filter(
+            ContextCount.user_id == user_id,
+            ContextCount.word_count > 0
+        ).all()
+        
+        return {row.context or "General": row.word_count for row in result}
+    
     def format_word_for_display(self, word: Word) -> str:
         """Format word for Telegram display"""
         try:
@@ -140,31 +269,7 @@ class WordService:
     def get_word_stats(self, user_id: int) -> Dict[str, int]:
         """Get word statistics for user"""
         try:
-            from sqlalchemy import func
-            
-            # Total words
-            total_words = self.db.query(func.count(Word.id)).filter(
-                Word.user_id == user_id
-            ).scalar()
-            
-            # Words added today
-            today = datetime.utcnow().date()
-            today_words = self.db.query(func.count(Word.id)).filter(
-                Word.user_id == user_id,
-                func.date(Word.created_at) == today
-            ).scalar()
-            
-            # Words due for review
-            due_words = self.db.query(func.count(Word.id)).filter(
-                Word.user_id == user_id,
-                Word.next_review <= datetime.utcnow()
-            ).scalar()
-            
-            return {
-                "total_words": total_words or 0,
-                "today_words": today_words or 0,
-                "due_words": due_words or 0
-            }
+            return replica_router.read(self.db, self.replica_db, user_id, lambda db: self._word_stats(db, user_id))
             
         except Exception as e:
             logger.error(f"Error getting word stats: {e}")
@@ -173,6 +278,36 @@ class WordService:
                 "today_words": 0,
                 "due_words": 0
             }
+    
+    def _word_stats(self, db, user_id: int) -> Dict[str, int]:
+        from sqlalchemy import func
+        
+        # Total words
+        total_words = db.query(func.count(Word.id)).filter(
+            Word.user_id == user_id
+        ).scalar()
+        
+        # Words added today
+        today = datetime.utcnow().date()
+        today_words = db.query(func.count(Word.id)).filter(
+            Word.user_id == user_id,
+            func.date(Word.created_at) == today
+        ).scalar()
+        
+        # Words due for review
+        if due_index is not None:
+            due_words = due_index.get_due_count(user_id)
+        else:
+            due_words = db.query(func.count(Word.id)).filter(
+                Word.user_id == user_id,
+                Word.next_review <= datetime.utcnow()
+            ).scalar()
+        
+        return {
+            "total_words": total_words or 0,
+            "today_words": today_words or 0,
+            "due_words": due_words or 0
+        }
 
 # Global instance
 word_service = WordService()
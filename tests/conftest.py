@@ -0,0 +1,24 @@
+"""Suite-wide settings, applied before any module reads them at import.
+
+The services open their sessions when imported, so every test shares one
+in-memory SQLite database (a single StaticPool connection, see
+database/sqlite.py). Tests that need tables take the ``schema`` fixture.
+"""
+import os
+
+import pytest
+
+os.environ["DATABASE_URL"] = "sqlite:///:memory:"
+os.environ.pop("REPLICA_DATABASE_URL", None)
+os.environ["DUE_INDEX_ENABLED"] = "false"
+
+@pytest.fixture
+def schema():
+    """The current schema in the shared database; rows are deleted after the test"""
+    from database.models import Base, SchemaMigration, create_tables, engine
+    create_tables()
+    yield engine
+    with engine.begin() as conn:
+        for table in reversed(Base.metadata.sorted_tables):
+            if table is not SchemaMigration.__table__:
+                conn.execute(table.delete())
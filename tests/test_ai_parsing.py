@@ -0,0 +1,48 @@
+import pytest
+
+from services.ai_service import AIService, ai_service
+
+COMPLETE = '[["huis", "house"], ["boom", "tree"], ["fiets", "bicycle"]]'
+
+def items(response: str):
+    return list(AIService._iter_json_items(response))
+
+def test_complete_array():
+    assert items(COMPLETE) == [["huis", "house"], ["boom", "tree"], ["fiets", "bicycle"]]
+
+def test_text_around_the_array_is_ignored():
+    assert items("Here you go:\n```json\n" + COMPLETE + "\n```") == items(COMPLETE)
+
+def test_empty_array():
+    assert items("[]") == []
+    assert items("[ \n ]") == []
+
+@pytest.mark.parametrize("truncated, expected", [
+    ('[["huis", "house"], ["boom", "tr', [["huis", "house"]]),
+    ('[["huis", "house"], ["boom", "tree"', [["huis", "house"]]),
+    ('[["huis", "house"], ["boom", "tree"],', [["huis", "house"], ["boom", "tree"]]),
+    ('[["huis", "house"], ["boom", "tree"], ', [["huis", "house"], ["boom", "tree"]]),
+])
+def test_truncated_array_yields_the_complete_items_before_the_cut(truncated, expected):
+    assert items(truncated) == expected
+
+def test_truncated_inside_the_first_item_yields_nothing():
+    assert items('[["hu') == []
+    assert items("[") == []
+
+def test_response_without_an_array_is_an_error():
+    with pytest.raises(ValueError):
+        items("Sorry, I can't help with that.")
+
+def test_word_list_accepts_both_schemas_and_drops_unusable_items():
+    response = (
+        '[["huis", "house"], {"word": "boom", "translation": "tree", "example_sentence_L1": "De boom."}, '
+        '["", "empty"], ["alleen"], 42, ["fiets", "bicy'
+    )
+    words = ai_service._parse_word_list(response)
+    assert [(word["word"], word["translation"]) for word in words] == [("huis", "house"), ("boom", "tree")]
+    assert words[1]["example_sentence_L1"] == "De boom."
+    assert words[0]["example_sentence_L1"] == ""
+
+def test_word_list_of_an_unparseable_response_is_empty():
+    assert ai_service._parse_word_list("no json here") == []
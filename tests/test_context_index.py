@@ -0,0 +1,64 @@
+import random
+
+import pytest
+
+from services.context_index import ContextIndex, normalize_context
+
+CONTEXTS = [
+    "travel", "travelling abroad", "travel to italy", "business travel", "airport",
+    "cooking", "cooking pasta", "italian cooking", "kitchen", "restaurant",
+    "job interview", "business meeting", "office work", "software engineering",
+    "football", "football match", "sports", "hiking in the mountains", "camping",
+    "doctor visit", "hospital", "pharmacy", "shopping for clothes", "grocery shopping",
+]
+
+def jaccard(index: ContextIndex, first: str, second: str) -> float:
+    first_grams, second_grams = index._trigrams(first), index._trigrams(second)
+    return len(first_grams & second_grams) / len(first_grams | second_grams)
+
+def brute_force(index: ContextIndex, keys, query: str, threshold: float):
+    similarities = [jaccard(index, query, key) for key in keys]
+    best = max(similarities)
+    return best if best >= threshold else None
+
+@pytest.fixture
+def index():
+    index = ContextIndex()
+    for item_id, context in enumerate(CONTEXTS):
+        index.add(item_id, normalize_context(context))
+    return index
+
+def test_normalize_context_drops_case_digits_and_punctuation():
+    assert normalize_context("  Travel, 20 words: ITALY!") == "travel words italy"
+
+def test_exact_key_is_found_with_similarity_one(index):
+    assert index.lookup("cooking pasta", 0.9) == (CONTEXTS.index("cooking pasta"), 1.0)
+
+def test_duplicate_items_and_empty_keys_are_ignored(index):
+    index.add(0, "something else")
+    index.add(100, "")
+    assert len(index) == len(CONTEXTS)
+
+def test_nothing_is_returned_below_the_threshold(index):
+    assert index.lookup("quantum chromodynamics", 0.3) is None
+    assert index.lookup("", 0.3) is None
+
+@pytest.mark.parametrize("threshold", [0.2, 0.3, 0.5, 0.7])
+def test_lookup_finds_the_most_similar_item(index, threshold):
+    keys = [normalize_context(context) for context in CONTEXTS]
+    rng = random.Random(threshold)
+    queries = ["travel italy", "cookng pasta", "busines meeting", "footbal", "shopping", "hospital visit"]
+    # Misspelled variants of the indexed contexts
+    for key in rng.sample(keys, 10):
+        position = rng.randrange(len(key))
+        queries.append(key[:position] + key[position + 1:])
+    
+    for query in queries:
+        expected = brute_force(index, keys, query, threshold)
+        found = index.lookup(query, threshold)
+        if expected is None:
+            assert found is None, query
+        else:
+            item_id, similarity = found
+            assert similarity == pytest.approx(expected), query
+            assert similarity == pytest.approx(jaccard(index, query, keys[item_id])), query
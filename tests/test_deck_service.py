@@ -0,0 +1,121 @@
+import csv
+
+import pytest
+
+from database.models import LexiconEntry, SessionLocal, User, Word
+from services.deck_service import CSV_COLUMNS, DeckImportError, deck_service
+from services.word_service import word_service
+
+WORDS = [
+    {"word": "дом", "translation": "house", "example_sentence_L1": "Это мой дом.", "example_sentence_L2": "This is my house."},
+    {"word": "дерево", "translation": "tree", "example_sentence_L1": "Высокое дерево.", "example_sentence_L2": "A tall tree."},
+    {"word": "велосипед", "translation": "bicycle"},
+]
+
+@pytest.fixture
+def users(schema):
+    db = SessionLocal()
+    db.add_all([User(telegram_id=user_id, language_from="en", language_to="ru") for user_id in (1, 2, 3)])
+    db.commit()
+    db.close()
+    return 1, 2, 3
+
+def write(path, text):
+    path.write_text(text, encoding="utf-8")
+    return str(path)
+
+def exported(user_id, fmt, path):
+    deck_service.export_words(user_id, fmt, str(path))
+    with open(path, encoding="utf-8", newline="") as source:
+        if fmt == "anki":
+            return [row for row in csv.reader(source, delimiter="\t") if not row[0].startswith("#")]
+        return list(csv.DictReader(source))
+
+def validation_error(tmp_path, text):
+    with pytest.raises(DeckImportError) as error:
+        deck_service.validate_file(write(tmp_path / "deck.csv", text), str(tmp_path / "staged.csv"))
+    return str(error.value)
+
+def test_rows_are_validated_with_line_numbers(tmp_path):
+    message = validation_error(tmp_path, (
+        "word,translation,interval_days,next_review\n"
+        "дом,house,1,\n"
+        ",tree,1,\n"
+        "кот,cat,0,\n"
+        "пёс,dog,1,yesterday\n"
+    ))
+    assert message.splitlines() == [
+        "строка 3: нужны слово и перевод",
+        "строка 4: неверные значения расписания",
+        "строка 5: неверный формат расписания",
+    ]
+
+def test_header_must_name_word_and_translation(tmp_path):
+    assert "translation" in validation_error(tmp_path, "word,meaning\nдом,house\n")
+
+def test_empty_file_is_rejected(tmp_path):
+    assert validation_error(tmp_path, "word,translation\n\n") == "В файле нет слов"
+
+def test_non_utf8_file_is_rejected(tmp_path):
+    path = tmp_path / "deck.csv"
+    path.write_bytes("word,translation\nдом,house\n".encode("cp1251"))
+    with pytest.raises(DeckImportError):
+        deck_service.validate_file(str(path), str(tmp_path / "staged.csv"))
+
+def test_row_limit(tmp_path, monkeypatch):
+    monkeypatch.setattr(deck_service, "max_rows", 2)
+    assert "максимум 2" in validation_error(tmp_path, "word,translation\nа,a\nб,b\nв,v\n")
+
+def test_csv_export_round_trips_through_import(users, tmp_path):
+    source, target, _ = users
+    word_service.add_words_from_list(source, WORDS[:2], context="home and garden")
+    word_service.add_words_from_list(source, WORDS[2:], context=None)
+    original = exported(source, "csv", tmp_path / "source.csv")
+    assert len(original) == 3
+    
+    rows, added = deck_service.import_file(target, "en", "ru", str(tmp_path / "source.csv"))
+    assert (rows, added) == (3, 3)
+    copied = exported(target, "csv", tmp_path / "target.csv")
+    
+    def content(rows):
+        return [tuple(row[column] for column in CSV_COLUMNS if column != "created_at") for row in rows]
+    assert content(copied) == content(original)
+    assert word_service.get_word_count_by_context(target) == {"home and garden": 2, "General": 1}
+
+def test_anki_export_round_trips_through_import(users, tmp_path):
+    source, target, _ = users
+    word_service.add_words_from_list(source, WORDS, context="home")
+    original = exported(source, "anki", tmp_path / "source.txt")
+    
+    assert deck_service.import_file(target, "en", "ru", str(tmp_path / "source.txt")) == (3, 3)
+    assert exported(target, "anki", tmp_path / "target.txt") == original
+
+def test_words_already_in_the_collection_and_repeats_are_skipped(users, tmp_path):
+    user_id = users[0]
+    word_service.add_words_from_list(user_id, WORDS[:1])
+    path = write(tmp_path / "deck.csv", "word,translation\nДом,house\nкот,cat\nкот,cat\n")
+    assert deck_service.import_file(user_id, "en", "ru", path) == (3, 1)
+    assert sorted(row["word"] for row in exported(user_id, "csv", tmp_path / "out.csv")) == ["дом", "кот"]
+
+def test_imported_content_stays_on_the_importers_card(users, tmp_path):
+    generated, importer, other = users
+    word_service.add_words_from_list(generated, WORDS[:1])
+    path = write(tmp_path / "deck.csv", "word,translation,example\nдом,home,Дом милый дом.\nкот,cat,\n")
+    deck_service.import_file(importer, "en", "ru", path)
+    
+    db = SessionLocal()
+    try:
+        cards = {word.word: word for word in db.query(Word).filter(Word.user_id == importer)}
+        assert (cards["дом"].translation, cards["дом"].example) == ("home", "Дом милый дом.")
+        house = db.query(LexiconEntry).filter(LexiconEntry.lemma == "дом").one()
+        assert (house.translation, house.example, house.imported) == ("house", "Это мой дом.", False)
+        # A word new to the lexicon is shared, but marked for replacement by generated content
+        assert db.query(LexiconEntry).filter(LexiconEntry.lemma == "кот").one().imported
+    finally:
+        db.close()
+    
+    word_service.add_words_from_list(other, [{"word": "кот", "translation": "tomcat"}])
+    assert [row["translation"] for row in exported(other, "csv", tmp_path / "other.csv")] == ["tomcat"]
+    assert {row["word"]: row["translation"] for row in exported(importer, "csv", tmp_path / "importer.csv")} == {
+        "дом": "home", "кот": "cat"
+    }
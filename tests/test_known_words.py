@@ -0,0 +1,46 @@
+import random
+import string
+
+from database.models import LexiconEntry
+from services.known_words import BloomFilter, KnownWordSet
+
+def random_words(count: int, seed: int):
+    rng = random.Random(seed)
+    return {"".join(rng.choices(string.ascii_lowercase, k=rng.randint(3, 12))) for _ in range(count)}
+
+def test_no_false_negatives_at_capacity():
+    words = random_words(5000, seed=1)
+    bloom = BloomFilter.for_capacity(len(words))
+    for word in words:
+        bloom.add(word)
+    assert all(word in bloom for word in words)
+
+def test_false_positive_rate_at_capacity():
+    words = random_words(5000, seed=2)
+    bloom = BloomFilter.for_capacity(len(words))
+    for word in words:
+        bloom.add(word)
+    others = random_words(20000, seed=3) - words
+    false_positives = sum(word in bloom for word in others)
+    # ~1% expected at 10 bits and 7 hashes per item
+    assert false_positives / len(others) < 0.03
+
+def test_bits_survive_storage():
+    words = random_words(300, seed=4)
+    bloom = BloomFilter.for_capacity(len(words))
+    for word in words:
+        bloom.add(word)
+    # As stored in and read back from known_word_filters.bits
+    restored = BloomFilter(bytearray(bytes(bloom.bits)))
+    assert all(word in restored for word in words)
+
+def test_known_word_set_matches_any_spelling_of_a_lemma():
+    bloom = BloomFilter.for_capacity(256)
+    for word in ("Apple", "ice  cream", "Straße"):
+        bloom.add(LexiconEntry.normalize_lemma(word))
+    known = KnownWordSet(bloom, 3)
+    assert "apple" in known
+    assert " APPLE! " in known
+    assert "Ice Cream" in known
+    assert "STRASSE" in known
+    assert len(known) == 3
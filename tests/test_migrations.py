@@ -0,0 +1,107 @@
+import pytest
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.orm import Session
+
+from database import sqlite
+from database.migrations import MIGRATIONS
+from database.models import User, Word, create_tables
+
+# The schema before any migration: content on every card, no lexicon
+BASELINE = (
+    "CREATE TABLE users (telegram_id BIGINT PRIMARY KEY, username VARCHAR(255), language_from VARCHAR(10), "
+    "language_to VARCHAR(10), timezone VARCHAR(50), created_at DATETIME, last_active DATETIME)",
+    "CREATE TABLE words (id INTEGER PRIMARY KEY, user_id BIGINT REFERENCES users (telegram_id), "
+    "word VARCHAR(255) NOT NULL, translation VARCHAR(255) NOT NULL, example TEXT, context VARCHAR(255), "
+    "difficulty INTEGER, next_review DATETIME, interval_days INTEGER, created_at DATETIME)",
+    "CREATE TABLE reviews (id INTEGER PRIMARY KEY, word_id INTEGER REFERENCES words (id), "
+    "user_id BIGINT REFERENCES users (telegram_id), knew BOOLEAN NOT NULL, reviewed_at DATETIME)",
+)
+
+USERS = [(1, "en", "ru"), (2, "en", "ru"), (3, "en", "nl")]
+# id, user, word, translation, example, context
+WORDS = [
+    (1, 1, "Apple", "яблоко", "An apple a day.", "food"),
+    (2, 2, "apple", "яблочко", "I ate an apple.", "food"),
+    (3, 2, "pear", "груша", None, "food"),
+    (4, 1, "pear", "груша", "A ripe pear.", None),
+    (5, 3, "apple", "appel", "", "food"),
+]
+
+@pytest.fixture
+def baseline():
+    url = "sqlite://"
+    engine = sqlite.configure(create_engine(url, **sqlite.engine_options(url)))
+    with engine.begin() as conn:
+        for statement in BASELINE:
+            conn.exec_driver_sql(statement)
+        conn.execute(text(
+            "INSERT INTO users (telegram_id, language_from, language_to) VALUES (:id, :language_from, :language_to)"
+        ), [{"id": user_id, "language_from": language_from, "language_to": language_to} for user_id, language_from, language_to in USERS])
+        conn.execute(text(
+            "INSERT INTO words (id, user_id, word, translation, example, context, difficulty, next_review, interval_days, created_at) "
+            "VALUES (:id, :user_id, :word, :translation, :example, :context, 1, '2024-01-01 00:00:00', 1, '2024-01-01 00:00:00')"
+        ), [dict(zip(("id", "user_id", "word", "translation", "example", "context"), word)) for word in WORDS])
+        conn.exec_driver_sql("INSERT INTO reviews (word_id, user_id, knew, reviewed_at) VALUES (1, 1, 1, '2024-01-02 00:00:00')")
+    yield engine
+    engine.dispose()
+
+def applied(engine):
+    with engine.connect() as conn:
+        return set(conn.exec_driver_sql("SELECT name FROM schema_migrations").scalars())
+
+def test_baseline_database_is_migrated(baseline):
+    create_tables(baseline)
+    
+    assert applied(baseline) == {name for name, _ in MIGRATIONS}
+    columns = {column["name"] for column in inspect(baseline).get_columns("words")}
+    assert not columns & {"word", "translation", "example"}
+    assert {"lexicon_id", "translation_override", "example_override"} <= columns
+    
+    with Session(baseline) as db:
+        cards = {word.id: word for word in db.query(Word)}
+        # Every card reads back its own content
+        for word_id, _, word, translation, example, _ in WORDS:
+            assert cards[word_id].translation == translation
+            if example:
+                assert cards[word_id].example == example
+        # One entry per language pair and lemma, with the first card's content
+        assert cards[1].lexicon_id == cards[2].lexicon_id != cards[5].lexicon_id
+        assert (cards[1].translation_override, cards[2].translation_override) == (None, "яблочко")
+        assert cards[4].example_override == "A ripe pear."
+        assert cards[4].example == "A ripe pear." and cards[3].example is None
+        assert db.query(User).count() == len(USERS)
+    
+    with baseline.connect() as conn:
+        counts = set(conn.exec_driver_sql("SELECT user_id, context, word_count FROM context_counts").all())
+        assert counts == {(1, "food", 1), (1, "", 1), (2, "food", 2), (3, "food", 1)}
+        assert conn.exec_driver_sql("SELECT count(*) FROM reviews").scalar() == 1
+        found = conn.exec_driver_sql("SELECT word FROM lexicon_fts WHERE lexicon_fts MATCH 'груш'").scalars().all()
+        assert found == ["pear"]
+
+def test_migrating_again_changes_nothing(baseline):
+    create_tables(baseline)
+    with baseline.connect() as conn:
+        before = conn.exec_driver_sql("SELECT * FROM words ORDER BY id").all()
+    create_tables(baseline)
+    with baseline.connect() as conn:
+        assert conn.exec_driver_sql("SELECT * FROM words ORDER BY id").all() == before
+
+def test_words_without_a_language_pair_stop_the_migration(baseline):
+    with baseline.begin() as conn:
+        conn.exec_driver_sql("UPDATE users SET language_to = NULL WHERE telegram_id = 3")
+    
+    with pytest.raises(RuntimeError, match="word ids 5"):
+        create_tables(baseline)
+    # Migrations before 0003 are kept; 0003 left the cards as they were
+    assert "0003_move_words_to_lexicon" not in applied(baseline)
+    with baseline.connect() as conn:
+        assert conn.exec_driver_sql("SELECT word, translation FROM words WHERE id = 5").one() == ("apple", "appel")
+
+def test_new_database_gets_every_migration():
+    url = "sqlite://"
+    engine = sqlite.configure(create_engine(url, **sqlite.engine_options(url)))
+    try:
+        create_tables(engine)
+        assert applied(engine) == {name for name, _ in MIGRATIONS}
+    finally:
+        engine.dispose()
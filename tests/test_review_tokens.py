@@ -0,0 +1,64 @@
+import base64
+
+import pytest
+
+from services import review_tokens
+from services.review_tokens import ReplayGuard, ReviewToken, issue, verify
+
+def test_round_trip():
+    for knew in (True, False):
+        data = issue(123456, 987654321012, 14, 0xDEADBEEF, knew)
+        assert verify(data) == ReviewToken(123456, 987654321012, 14, 0xDEADBEEF, knew)
+
+def test_fits_telegram_callback_data():
+    data = issue(2 ** 32 - 1, 2 ** 62, 30, 2 ** 32 - 1, True)
+    assert data.startswith(review_tokens.PREFIX)
+    assert len(data.encode()) <= 64
+
+def test_missing_interval_is_issued_as_zero():
+    assert verify(issue(1, 2, None, 3, True)).interval_days == 0
+
+def test_tampered_payload_is_rejected():
+    data = issue(1, 2, 3, 4, False)
+    raw = bytearray(base64.urlsafe_b64decode(data[len(review_tokens.PREFIX):]))
+    # Flip the answer: the signature no longer matches
+    raw[0] ^= 1
+    assert verify(review_tokens.PREFIX + base64.urlsafe_b64encode(bytes(raw)).decode()) is None
+
+@pytest.mark.parametrize("data", [
+    "",
+    "review_knew_1",
+    review_tokens.PREFIX,
+    review_tokens.PREFIX + "not base64!",
+    review_tokens.PREFIX + base64.urlsafe_b64encode(b"short").decode(),
+])
+def test_malformed_data_is_rejected(data):
+    assert verify(data) is None
+
+def test_token_signed_with_another_secret_is_rejected(monkeypatch):
+    data = issue(1, 2, 3, 4, True)
+    monkeypatch.setattr(review_tokens, "_SECRET", b"another secret")
+    assert verify(data) is None
+
+def test_replay_guard_accepts_a_card_once_per_session():
+    guard = ReplayGuard()
+    token = ReviewToken(1, 2, 3, 4, True)
+    assert guard.claim(token)
+    # The other button of the same card, in the same session
+    assert not guard.claim(token._replace(knew=False))
+    assert guard.claim(token._replace(nonce=5))
+
+def test_released_claim_can_be_made_again():
+    guard = ReplayGuard()
+    token = ReviewToken(1, 2, 3, 4, True)
+    assert guard.claim(token)
+    guard.release(token)
+    assert guard.claim(token)
+
+def test_replay_guard_forgets_the_oldest_claims():
+    guard = ReplayGuard(size=2)
+    tokens = [ReviewToken(word_id, 2, 3, 4, True) for word_id in range(3)]
+    for token in tokens:
+        assert guard.claim(token)
+    assert guard.claim(tokens[0])
+    assert not guard.claim(tokens[2])
@@ -0,0 +1,103 @@
+"""Local stand-in for the OpenAI chat completions API.
+
+Serves word lists and examples in the format AIService expects and injects latency and
+errors, so retries, hedging, deadlines and the circuit breaker can be
+exercised without the real API:
+
+    python -m tools.fake_openai --port 8081 --latency 0.5 --jitter 1.0 --error-rate 0.2
+    OPENAI_BASE_URL=http://localhost:8081/v1 python main.py
+"""
+import argparse
+import asyncio
+import json
+import random
+import re
+import time
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+import uvicorn
+
+app = FastAPI(title="Fake OpenAI")
+
+# Fault injection settings, set from the command line
+settings = {
+    "latency": 0.0,
+    "jitter": 0.0,
+    "error_rate": 0.0,
+    "error_status": 500,
+    "hang_rate": 0.0
+}
+stats = {"requests": 0, "errors": 0, "hangs": 0}
+
+def _word_list(count: int) -> str:
+    """JSON array of [word, translation] pairs with ``count`` distinct placeholder words"""
+    batch = random.randrange(1_000_000)
+    return json.dumps([[f"woord{batch}_{i}", f"word{batch}_{i}"] for i in range(count)])
+
+def _examples(words: list) -> str:
+    """JSON array of [word, example, example translation] for the requested words"""
+    return json.dumps([[word, f"Dit is {word}.", f"This is {word}."] for word in words], ensure_ascii=False)
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    stats["requests"] += 1
+    
+    await asyncio.sleep(settings["latency"] + random.uniform(0, settings["jitter"]))
+    if random.random() < settings["hang_rate"]:
+        stats["hangs"] += 1
+        await asyncio.sleep(3600)
+    if random.random() < settings["error_rate"]:
+        stats["errors"] += 1
+        return JSONResponse(
+            status_code=settings["error_status"],
+            content={"error": {"message": "Injected failure", "type": "server_error"}}
+        )
+    
+    prompt = body["messages"][-1]["content"]
+    examples = re.search(r"Words: (\[.*?\])\.", prompt)
+    if examples:
+        content = _examples(json.loads(examples.group(1)))
+    else:
+        match = re.search(r"Generate (\d+)", prompt)
+        content = _word_list(int(match.group(1)) if match else 20)
+    return {
+        "id": f"chatcmpl-fake{stats['requests']}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "gpt-3.5-turbo"),
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": content},
+            "finish_reason": "stop"
+        }],
+        "usage": {
+            "prompt_tokens": len(prompt) // 4,
+            "completion_tokens": len(content) // 4,
+            "total_tokens": (len(prompt) + len(content)) // 4
+        }
+    }
+
+@app.get("/stats")
+async def get_stats():
+    return stats
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake OpenAI server with latency and error injection")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency", type=float, default=0.0, help="base response delay in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="extra random delay up to this many seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests that fail")
+    parser.add_argument("--error-status", type=int, default=500, help="HTTP status of injected failures")
+    parser.add_argument("--hang-rate", type=float, default=0.0, help="fraction of requests that never answer")
+    args = parser.parse_args()
+    
+    settings.update(
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        hang_rate=args.hang_rate
+    )
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
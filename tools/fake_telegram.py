@@ -0,0 +1,82 @@
+"""Local stand-in for the Telegram Bot API.
+
+Answers every bot method the handlers use with a plausible result after a
+configurable delay, so the bot can run against it without a real token:
+
+    python -m tools.fake_telegram --port 8082 --latency 0.05
+    TELEGRAM_API_BASE_URL=http://localhost:8082/bot python main.py
+"""
+from collections import Counter
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import time
+from fastapi import FastAPI, Request
+import uvicorn
+
+app = FastAPI(title="Fake Telegram Bot API")
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "Words Learner", "username": "words_learner_fake_bot"}
+
+# Delay settings, set from the command line
+settings = {"latency": 0.0, "jitter": 0.0}
+calls = Counter()
+_message_ids = itertools.count(1)
+
+def _message(params: dict) -> dict:
+    """Message object echoing what the bot sent"""
+    chat_id = int(params.get("chat_id") or 0)
+    message = {
+        "message_id": int(params.get("message_id") or next(_message_ids)),
+        "date": int(time.time()),
+        "chat": {"id": chat_id, "type": "private"},
+        "from": BOT_USER,
+        "text": params.get("text", "")
+    }
+    if isinstance(params.get("reply_markup"), dict):
+        message["reply_markup"] = params["reply_markup"]
+    return message
+
+async def _params(request: Request) -> dict:
+    """Method parameters; the bot sends them form-encoded with JSON values"""
+    if request.headers.get("content-type", "").startswith("application/json"):
+        return await request.json()
+    params = {}
+    for key, value in (await request.form()).items():
+        try:
+            params[key] = json.loads(value)
+        except (TypeError, ValueError):
+            params[key] = value
+    return params
+
+@app.post("/bot{token}/{method}")
+async def bot_method(token: str, method: str, request: Request):
+    params = await _params(request)
+    calls[method] += 1
+    await asyncio.sleep(settings["latency"] + random.uniform(0, settings["jitter"]))
+    
+    if method == "getMe":
+        result = BOT_USER
+    elif method in ("sendMessage", "editMessageText", "editMessageReplyMarkup"):
+        result = _message(params)
+    else:
+        # answerCallbackQuery, setWebhook, deleteMessage, ...
+        result = True
+    return {"ok": True, "result": result}
+
+@app.get("/stats")
+async def get_stats():
+    return dict(calls)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake Telegram Bot API server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8082)
+    parser.add_argument("--latency", type=float, default=0.0, help="base response delay in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="extra random delay up to this many seconds")
+    args = parser.parse_args()
+    
+    settings.update(latency=args.latency, jitter=args.jitter)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
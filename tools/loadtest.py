@@ -0,0 +1,267 @@
+"""End-to-end load test of the webhook handlers.
+
+Starts the fake Telegram and OpenAI servers, points the bot at them, then
+replays synthetic update streams against ``POST /webhook`` of the FastAPI
+app (in-process, over ASGI) at a fixed arrival rate:
+
+    python -m tools.loadtest --rate 20 --duration 30 --mix start=1,generate=1,review=4
+
+Reports throughput, p50/p99 handler latency and SQL statements per update
+type. Uses a throwaway SQLite database unless --database-url is given.
+"""
+from collections import defaultdict
+from contextvars import ContextVar
+import argparse
+import asyncio
+import itertools
+import logging
+import os
+import random
+import socket
+import string
+import sys
+import tempfile
+import threading
+import time
+import httpx
+import uvicorn
+
+TOPICS = [
+    "кухня и еда", "путешествия", "работа в офисе", "спорт", "погода", "покупки в магазине",
+    "семья", "здоровье и врач", "транспорт", "отдых на море", "школа", "хобби", "дом и мебель",
+    "одежда", "ресторан", "музыка", "природа", "банк и деньги", "праздники", "компьютеры"
+]
+
+# Statement counter of the update being processed; each request task gets its own
+_queries: ContextVar = ContextVar("loadtest_queries", default=None)
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def _start_server(app, port: int) -> uvicorn.Server:
+    """Run an ASGI app in a background thread with its own event loop"""
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.01)
+    return server
+
+def _percentile(values, percent: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100))] if ordered else 0.0
+
+class UpdateFactory:
+    """Synthetic Telegram updates for a pool of users"""
+    
+    def __init__(self, users: int, unique_contexts: bool, words: int):
+        self.user_ids = [10_000_000 + i for i in range(users)]
+        self.unique_contexts = unique_contexts
+        self.words = words
+        self._update_ids = itertools.count(1)
+    
+    @staticmethod
+    def _user(user_id: int) -> dict:
+        return {"id": user_id, "is_bot": False, "first_name": f"Load{user_id}", "username": f"load{user_id}"}
+    
+    def message(self, user_id: int, text: str) -> dict:
+        update_id = next(self._update_ids)
+        message = {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": self._user(user_id),
+            "text": text
+        }
+        if text.startswith("/"):
+            message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+        return {"update_id": update_id, "message": message}
+    
+    def callback(self, user_id: int, data: str) -> dict:
+        update_id = next(self._update_ids)
+        return {
+            "update_id": update_id,
+            "callback_query": {
+                "id": str(update_id),
+                "from": self._user(user_id),
+                "chat_instance": str(user_id),
+                "data": data,
+                "message": {
+                    "message_id": update_id,
+                    "date": int(time.time()),
+                    "chat": {"id": user_id, "type": "private"},
+                    "from": {"id": 1, "is_bot": True, "first_name": "Words Learner"},
+                    "text": "review"
+                }
+            }
+        }
+    
+    def generation_text(self) -> str:
+        context = random.choice(TOPICS)
+        if self.unique_contexts:
+            context += " " + "".join(random.choices(string.ascii_lowercase, k=8))
+        return f"{context} {self.words}"
+
+class LoadTest:
+    def __init__(self, args):
+        self.args = args
+        self.factory = UpdateFactory(args.users, args.unique_contexts, args.words)
+        self.word_intervals = {}
+        self.review_nonces = {}
+        self.results = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.client = None
+    
+    async def send(self, update_type: str, update: dict, record: bool = True):
+        counter = [0]
+        _queries.set(counter)
+        started = time.perf_counter()
+        response = await self.client.post("/webhook", json=update)
+        elapsed = time.perf_counter() - started
+        if record:
+            self.results[update_type].append((elapsed, counter[0]))
+            if response.status_code != 200 or response.json().get("status") != "ok":
+                self.errors[update_type] += 1
+    
+    def next_update(self, update_type: str):
+        user_id = random.choice(self.factory.user_ids)
+        if update_type == "start":
+            return self.factory.message(user_id, "/start")
+        if update_type == "generate":
+            return self.factory.message(user_id, self.factory.generation_text())
+        if update_type == "review":
+            from services import review_tokens
+            
+            words = self.word_intervals.get(user_id)
+            if not words:
+                return None
+            # An answer schedules the word days ahead, so each word is answered once
+            word_id = random.choice(list(words))
+            interval_days = words.pop(word_id)
+            knew = random.random() < 0.5
+            data = review_tokens.issue(word_id, user_id, interval_days, self.review_nonces[user_id], knew)
+            return self.factory.callback(user_id, data)
+        raise ValueError(f"Unknown update type: {update_type}")
+    
+    async def setup_users(self):
+        """Register every user, pick a language pair, give them words to review and start a session"""
+        from database.models import Word, SessionLocal
+        import main as bot
+        
+        for user_id in self.factory.user_ids:
+            await self.send("start", self.factory.message(user_id, "/start"), record=False)
+            await self.send("start", self.factory.callback(user_id, "lang_en_nl"), record=False)
+            await self.send("generate", self.factory.message(user_id, self.factory.generation_text()), record=False)
+            # Answers are only accepted for the user's current /learn session
+            await self.send("review", self.factory.message(user_id, "/learn"), record=False)
+            self.review_nonces[user_id] = bot.telegram_app.user_data[user_id].get("review_nonce")
+        
+        db = SessionLocal()
+        try:
+            for word_id, user_id, interval_days in db.query(Word.id, Word.user_id, Word.interval_days).filter(
+                Word.user_id.in_(self.factory.user_ids)
+            ):
+                self.word_intervals.setdefault(user_id, {})[word_id] = interval_days
+        finally:
+            db.close()
+    
+    async def run(self):
+        """Replay updates at the target rate (open loop) for the configured duration"""
+        mix = {}
+        for part in self.args.mix.split(","):
+            name, weight = part.split("=")
+            mix[name.strip()] = float(weight)
+        
+        tasks = []
+        interval = 1 / self.args.rate
+        started = time.perf_counter()
+        for i in itertools.count():
+            scheduled = started + i * interval
+            if scheduled - started >= self.args.duration:
+                break
+            await asyncio.sleep(max(0.0, scheduled - time.perf_counter()))
+            update_type = random.choices(list(mix), weights=list(mix.values()))[0]
+            update = self.next_update(update_type)
+            if update is not None:
+                tasks.append(asyncio.create_task(self.send(update_type, update)))
+        await asyncio.gather(*tasks)
+        return time.perf_counter() - started
+    
+    def report(self, elapsed: float, telegram_calls: dict, openai_stats: dict):
+        total = sum(len(samples) for samples in self.results.values())
+        print(f"\n{total} updates in {elapsed:.1f}s ({total / elapsed:.1f}/s, target {self.args.rate}/s)\n")
+        print(f"{'type':<10}{'count':>7}{'errors':>8}{'rate/s':>9}{'p50 ms':>9}{'p99 ms':>9}{'max ms':>9}{'queries':>9}")
+        for update_type, samples in sorted(self.results.items()):
+            latencies = [latency for latency, _ in samples]
+            queries = sum(count for _, count in samples) / len(samples)
+            print(
+                f"{update_type:<10}{len(samples):>7}{self.errors[update_type]:>8}{len(samples) / elapsed:>9.1f}"
+                f"{_percentile(latencies, 50) * 1000:>9.1f}{_percentile(latencies, 99) * 1000:>9.1f}"
+                f"{max(latencies) * 1000:>9.1f}{queries:>9.1f}"
+            )
+        print(f"\nTelegram API calls: {telegram_calls}")
+        print(f"OpenAI requests: {openai_stats}")
+
+async def main(args):
+    from tools import fake_openai, fake_telegram
+    
+    fake_telegram.settings.update(latency=args.telegram_latency, jitter=args.telegram_jitter)
+    fake_openai.settings.update(
+        latency=args.openai_latency, jitter=args.openai_jitter, error_rate=args.openai_error_rate
+    )
+    telegram_port, openai_port = _free_port(), _free_port()
+    servers = [_start_server(fake_telegram.app, telegram_port), _start_server(fake_openai.app, openai_port)]
+    
+    os.environ["TELEGRAM_BOT_TOKEN"] = "123456:loadtest"
+    os.environ["TELEGRAM_API_BASE_URL"] = f"http://127.0.0.1:{telegram_port}/bot"
+    os.environ["OPENAI_API_KEY"] = "sk-loadtest"
+    os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{openai_port}/v1"
+    os.environ["DATABASE_URL"] = args.database_url or f"sqlite:///{tempfile.mkdtemp()}/loadtest.db"
+    
+    import main as bot
+    from database.models import create_tables, engine
+    create_tables()
+    from sqlalchemy import event
+    logging.getLogger().setLevel(args.log_level)
+    
+    @event.listens_for(engine, "before_cursor_execute")
+    def count_query(conn, cursor, statement, parameters, context, executemany):
+        counter = _queries.get()
+        if counter is not None:
+            counter[0] += 1
+    
+    await bot.startup_event()
+    load_test = LoadTest(args)
+    transport = httpx.ASGITransport(app=bot.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=None) as client:
+        load_test.client = client
+        print(f"Setting up {args.users} users...")
+        await load_test.setup_users()
+        print(f"Replaying {args.mix} at {args.rate}/s for {args.duration}s...")
+        elapsed = await load_test.run()
+    await bot.shutdown_event()
+    
+    load_test.report(elapsed, dict(fake_telegram.calls), dict(fake_openai.stats))
+    for server in servers:
+        server.should_exit = True
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test the webhook against fake Telegram and OpenAI servers")
+    parser.add_argument("--rate", type=float, default=10, help="updates per second")
+    parser.add_argument("--duration", type=float, default=30, help="seconds of load")
+    parser.add_argument("--users", type=int, default=20, help="synthetic users")
+    parser.add_argument("--mix", default="start=1,generate=1,review=4", help="update type weights")
+    parser.add_argument("--words", type=int, default=10, help="words requested per generation")
+    parser.add_argument("--unique-contexts", action="store_true", help="defeat pack and generation cache reuse")
+    parser.add_argument("--telegram-latency", type=float, default=0.03)
+    parser.add_argument("--telegram-jitter", type=float, default=0.02)
+    parser.add_argument("--openai-latency", type=float, default=1.0)
+    parser.add_argument("--openai-jitter", type=float, default=1.0)
+    parser.add_argument("--openai-error-rate", type=float, default=0.0)
+    parser.add_argument("--database-url", help="defaults to a temporary SQLite database")
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args()
+    
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    asyncio.run(main(args))
@@ -0,0 +1,89 @@
+"""Startup benchmark: time from process start to the first webhook response.
+
+Runs `uvicorn main:app` in a fresh process against the fake Telegram server,
+then polls /health and posts a /start update to /webhook until both answer:
+
+    python -m tools.startup_bench --runs 5
+
+The schema is created once beforehand (`python -m database`), as in a
+deploy. Uses a throwaway SQLite database unless --database-url is given.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import httpx
+from tools import fake_telegram
+from tools.loadtest import UpdateFactory, _free_port, _start_server
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def _wait_until(check, timeout: float) -> bool:
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        try:
+            if check():
+                return True
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.005)
+    return False
+
+def measure(env: dict, timeout: float) -> dict:
+    """Seconds from spawn until /health answers and until the first webhook is processed"""
+    port = _free_port()
+    base = f"http://127.0.0.1:{port}"
+    update = UpdateFactory(1, False, 10).message(10_000_000, "/start")
+    
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        with httpx.Client(timeout=timeout) as client:
+            if not _wait_until(lambda: client.get(f"{base}/health").status_code == 200, timeout):
+                raise RuntimeError("Application did not become healthy")
+            healthy = time.perf_counter() - started
+            first_webhook = lambda: client.post(f"{base}/webhook", json=update).json().get("status") == "ok"
+            if not _wait_until(first_webhook, timeout):
+                raise RuntimeError("Webhook did not respond")
+            return {"health": healthy, "webhook": time.perf_counter() - started}
+    finally:
+        process.terminate()
+        process.wait()
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure time to first webhook response")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--database-url", help="defaults to a temporary SQLite database")
+    parser.add_argument("--no-warm-up", action="store_true", help="disable background service warm-up")
+    args = parser.parse_args()
+    
+    telegram_port = _free_port()
+    _start_server(fake_telegram.app, telegram_port)
+    env = dict(
+        os.environ,
+        TELEGRAM_BOT_TOKEN="123456:startup",
+        TELEGRAM_API_BASE_URL=f"http://127.0.0.1:{telegram_port}/bot",
+        OPENAI_API_KEY="sk-startup",
+        DATABASE_URL=args.database_url or f"sqlite:///{tempfile.mkdtemp()}/startup.db",
+        WARM_UP="false" if args.no_warm_up else "true",
+        LOG_LEVEL="WARNING"
+    )
+    subprocess.run([sys.executable, "-m", "database"], cwd=ROOT, env=env, check=True, capture_output=True)
+    
+    results = [measure(env, args.timeout) for _ in range(args.runs)]
+    for key, label in (("health", "first /health"), ("webhook", "first /webhook")):
+        values = [result[key] * 1000 for result in results]
+        print(
+            f"{label:<16} median {statistics.median(values):7.0f} ms"
+            f"   min {min(values):7.0f} ms   max {max(values):7.0f} ms"
+        )
+
+if __name__ == "__main__":
+    main()